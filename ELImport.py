@@ -82,105 +82,112 @@ def importData(ex_filename, db_filename):
     empty_count = 0
     cur_row = 0
     columnNamePos = {}
-
-
-    while empty_count < 10:
-        cur_row += 1
-        cells = []
-        for row in cursheet.iter_rows(min_row=cur_row, max_row=cur_row, max_col=12):
-            for c in row:
-                val = c.value if c.value is not None else ''
-                if type(val) == str:
-                    val = val.strip()
-                cells.append(val)
-
-        rowType = cells[0]
-        if rowType == '':
-            empty_count += 1
-            continue
-        elif str(rowType) == "Тип":
-            column_count = 0
-            columnNamePos = {}
-            for val in cells:
-                columnNamePos[str(val)] = column_count
-                column_count += 1
-            continue
-        empty_count = 0
-
-
-        logger.debug("Got input row: %s", ", ".join(map(str, cells)))
-        ###
-        ###  Get Types child
-        ###
-        path = str(rowType).strip().split(" ")
-        curTypes = rootTypes
-        theType = None
-        for name in path:
-            try:
-                theType = curTypes[name]
-            except IndexError:
-                theType = curTypes.addNode(name)
-            curTypes = theType.getChildren()
-
-
-        ###
-        ###   Parse data row
-        ###
-        els = {}
-        for field in ElDBScheme.ELEMENT_FIELDS.keys():
-            if field == 'id':
+    pending = {}        # type id -> (Type, list of parts fields), inserted by one executemany per type
+
+
+    # Import whole sheet in one transaction instead of commit per row
+    with factory.transaction():
+        while empty_count < 10:
+            cur_row += 1
+            cells = []
+            for row in cursheet.iter_rows(min_row=cur_row, max_row=cur_row, max_col=12):
+                for c in row:
+                    val = c.value if c.value is not None else ''
+                    if type(val) == str:
+                        val = val.strip()
+                    cells.append(val)
+
+            rowType = cells[0]
+            if rowType == '':
+                empty_count += 1
                 continue
+            elif str(rowType) == "Тип":
+                column_count = 0
+                columnNamePos = {}
+                for val in cells:
+                    columnNamePos[str(val)] = column_count
+                    column_count += 1
+                continue
+            empty_count = 0
 
-            valuetype = ElDBScheme.ELEMENT_FIELDS[field].split()[0]
-            culumnNum = 0
-            saveValue = ""
 
-            for variant in FIELDS_MAP_TO_INPUT_NAME[field]:
+            logger.debug("Got input row: %s", ", ".join(map(str, cells)))
+            ###
+            ###  Get Types child
+            ###
+            path = str(rowType).strip().split(" ")
+            curTypes = rootTypes
+            theType = None
+            for name in path:
                 try:
-                    if variant is not None:
-                        culumnNum = columnNamePos[variant]
-                        hdr = theType.getHeaders()[field]
-                        hdr["display"] = variant
-                except KeyError:
+                    theType = curTypes[name]
+                except IndexError:
+                    theType = curTypes.addNode(name)
+                curTypes = theType.getChildren()
+
+
+            ###
+            ###   Parse data row
+            ###
+            els = {}
+            for field in ElDBScheme.ELEMENT_FIELDS.keys():
+                if field == 'id':
                     continue
 
-            if culumnNum > 0 and cells[culumnNum] != '':
-                try:
-                    if valuetype == "INTEGER":
-                        saveValue = int(cells[culumnNum])
-                    elif valuetype == "REAL":
-                        # savedValue = float( cellValue.replace('.','',1).isdigit():     cells[culumnNum])
-                        tmpVal = str(cells[culumnNum]).strip()
-                        if tmpVal.isdigit() or tmpVal.replace('.', '', 1).isdigit():
-                            saveValue = float(tmpVal)
-                        elif tmpVal.replace(',', '', 1).isdigit():
-                            saveValue = float(tmpVal.replace(',', '.', 1))
-                        else:
-                            els["device_code"] = tmpVal
-                            saveValue = ''
-                    elif valuetype == "TEXT":
-                        saveValue = str(cells[culumnNum])
-
-                except BaseException as e:
-                    logger.error("Valuetype = %s, Value= %s, Column Name = %s", valuetype, cells[culumnNum], field  )
-                    logger.error(e)
-                    raise BaseException
-
-            if field == "id":
-                saveValue = 0
-            elif field == "type_id":
-                saveValue = theType.recId
-            elif field == "present":
-                saveValue = 1
-
-            els[field] = saveValue
-
-
-
-        logger.debug("Prepare data to save %s", ", ".join(map(str, els)))
-
-        theType.getHeaders().save()
-        factory.createPart(theType, els)
+                valuetype = ElDBScheme.ELEMENT_FIELDS[field].split()[0]
+                culumnNum = 0
+                saveValue = ""
+
+                for variant in FIELDS_MAP_TO_INPUT_NAME[field]:
+                    try:
+                        if variant is not None:
+                            culumnNum = columnNamePos[variant]
+                            hdr = theType.getHeaders()[field]
+                            hdr["display"] = variant
+                    except KeyError:
+                        continue
+
+                if culumnNum > 0 and cells[culumnNum] != '':
+                    try:
+                        if valuetype == "INTEGER":
+                            saveValue = int(cells[culumnNum])
+                        elif valuetype == "REAL":
+                            # savedValue = float( cellValue.replace('.','',1).isdigit():     cells[culumnNum])
+                            tmpVal = str(cells[culumnNum]).strip()
+                            if tmpVal.isdigit() or tmpVal.replace('.', '', 1).isdigit():
+                                saveValue = float(tmpVal)
+                            elif tmpVal.replace(',', '', 1).isdigit():
+                                saveValue = float(tmpVal.replace(',', '.', 1))
+                            else:
+                                els["device_code"] = tmpVal
+                                saveValue = ''
+                        elif valuetype == "TEXT":
+                            saveValue = str(cells[culumnNum])
+
+                    except BaseException as e:
+                        logger.error("Valuetype = %s, Value= %s, Column Name = %s", valuetype, cells[culumnNum], field  )
+                        logger.error(e)
+                        raise BaseException
+
+                if field == "id":
+                    saveValue = 0
+                elif field == "type_id":
+                    saveValue = theType.recId
+                elif field == "present":
+                    saveValue = 1
+
+                els[field] = saveValue
+
+
+
+            logger.debug("Prepare data to save %s", ", ".join(map(str, els)))
+
+            theType.getHeaders().save()
+            pending.setdefault(theType.recId, (theType, []))[1].append(els)
+
+        for theType, elsList in pending.values():
+            logger.debug("Insert %s parts of type %s", len(elsList), theType.path)
+            factory.createParts(theType, elsList)
 
     factory.disconnect()
 
@@ -63,6 +63,11 @@ class ElConfig:
                 return self.data[section][name]
         return None
 
+    def get_section(self, section: str) -> dict:
+        if self.data is not None and section in self.data and self.data[section] is not None:
+            return dict(self.data[section])
+        return {}
+
     def print_config(self):
         print(yaml.dump(self.data))
 
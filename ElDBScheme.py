@@ -1,8 +1,13 @@
+import csv
+import io
 import logging
 import sqlite3
 import sys
 import os
 import bisect
+import threading
+import weakref
+from collections import OrderedDict
 from sqlite3 import Cursor
 
 import ElLogger
@@ -10,6 +15,11 @@ import ElLogger
 # from numpy import *
 
 DB_FACTORY = None
+PARTS_PAGE_SIZE = 200
+SORT_ORDER_ENV = "parts_sort."     # ENVIRONMENT name prefix of the per type sort order
+MAX_IN_PARAMS = 500                # ids per "id IN (...)" statement, below SQLite variables limit
+PARTS_CACHE_SIZE = 5000            # Part objects kept by the factory parts cache
+RETURNING_SUPPORTED = sqlite3.sqlite_version_info >= (3, 35, 0)    # INSERT ... RETURNING
 
 from connector import SQLiteConnector, DBError
 
@@ -74,6 +84,10 @@ ELEMENT_FIELDS_DISPLAY = {
 
 
 ELEMENT_FLD_NAMES = list(ELEMENT_FIELDS.keys())
+
+# Parts table columns which have a (type_id, field) index, so sorting parts of a type by them
+# is read from the index without sorting. part_num is indexed since scheme version 1.
+SORT_INDEXED_FIELDS = ["device_code", "value", "package", "quantity", "price"]
 #  DataSheet
 #  Image
 #  Project
@@ -85,6 +99,9 @@ DATASHEETS_TABLE_NAME = "DATASHEETS"
 PROJECTS_TABLE = "PROJECTS"
 EL_BY_PROJECT_TABLE = "EL_BY_PROJECT"
 ENVIRONMENT_TABLE = "ENVIRONMENT"
+PARTS_FTS_TABLE_NAME = "PARTS_FTS"
+TYPES_TREE_TABLE_NAME = "TYPES_TREE"
+TYPES_COUNTS_TABLE_NAME = "TYPES_COUNTS"
 
 TYPES_TABLE_SQL = "CREATE TABLE IF NOT EXISTS " + TYPES_TABLE_NAME + " (" \
                                                                      "id INTEGER PRIMARY KEY AUTOINCREMENT," \
@@ -180,10 +197,271 @@ ENVIRONMENT_TABLE_SQL = "CREATE TABLE IF NOT EXISTS " + ENVIRONMENT_TABLE + " ("
                 ");"
 
 
+#
+#   Full text index for parts search. External content table over PARTS,
+#   kept in sync by triggers.
+#
+PARTS_FTS_FIELDS = ["part_num", "device_code", "description"]
+PARTS_FTS_WEIGHTS = "10.0, 5.0, 1.0"    # bm25 weight per PARTS_FTS_FIELDS column
+
+PARTS_FTS_TABLE_SQL = "CREATE VIRTUAL TABLE IF NOT EXISTS " + PARTS_FTS_TABLE_NAME + " USING fts5(" + \
+    ", ".join(PARTS_FTS_FIELDS) + ", content='" + PARTS_TABLE_NAME + "', content_rowid='id'," \
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3');"
+
+PARTS_FTS_TRIGGERS_SQL = [
+    "CREATE TRIGGER IF NOT EXISTS parts_fts_insert AFTER INSERT ON " + PARTS_TABLE_NAME + " BEGIN" +
+    " INSERT INTO " + PARTS_FTS_TABLE_NAME + " (rowid, " + ", ".join(PARTS_FTS_FIELDS) + ")" +
+    " VALUES (new.id, " + ", ".join(map(lambda n: "new." + n, PARTS_FTS_FIELDS)) + "); END;",
+
+    "CREATE TRIGGER IF NOT EXISTS parts_fts_delete AFTER DELETE ON " + PARTS_TABLE_NAME + " BEGIN" +
+    " INSERT INTO " + PARTS_FTS_TABLE_NAME + " (" + PARTS_FTS_TABLE_NAME + ", rowid, " + ", ".join(PARTS_FTS_FIELDS) + ")" +
+    " VALUES ('delete', old.id, " + ", ".join(map(lambda n: "old." + n, PARTS_FTS_FIELDS)) + "); END;",
+
+    "CREATE TRIGGER IF NOT EXISTS parts_fts_update AFTER UPDATE OF " + ", ".join(PARTS_FTS_FIELDS) +
+    " ON " + PARTS_TABLE_NAME + " BEGIN" +
+    " INSERT INTO " + PARTS_FTS_TABLE_NAME + " (" + PARTS_FTS_TABLE_NAME + ", rowid, " + ", ".join(PARTS_FTS_FIELDS) + ")" +
+    " VALUES ('delete', old.id, " + ", ".join(map(lambda n: "old." + n, PARTS_FTS_FIELDS)) + ");" +
+    " INSERT INTO " + PARTS_FTS_TABLE_NAME + " (rowid, " + ", ".join(PARTS_FTS_FIELDS) + ")" +
+    " VALUES (new.id, " + ", ".join(map(lambda n: "new." + n, PARTS_FTS_FIELDS)) + "); END;",
+]
+
+
+def _createPartsFts(scheme):
+    """
+    Migration step. Create parts full text index, sync triggers and fill the index from existing rows.
+    Skipped when sqlite library built without FTS5, search falls back to LIKE then.
+    The index is made at startup once FTS5 is available, see DBScheme.migrate.
+    """
+    if not scheme.db.hasCompileOption("ENABLE_FTS5"):
+        logger.warning("SQLite built without FTS5. Parts search will scan the whole table.")
+        return
+    scheme.db.exec(PARTS_FTS_TABLE_SQL)
+    for sql in PARTS_FTS_TRIGGERS_SQL:
+        scheme.db.exec(sql)
+    scheme.db.exec("INSERT INTO " + PARTS_FTS_TABLE_NAME + " (" + PARTS_FTS_TABLE_NAME + ") VALUES ('rebuild');")
+
+
+def ftsQuery(searchStr: str) -> str:
+    """
+    Make FTS5 MATCH expression from user input. Each word is quoted (so no FTS syntax leaks from input)
+    and searched as prefix, all words are required.
+    :return: MATCH expression or empty string when nothing to search
+    """
+    tokens = []
+    for word in searchStr.split():
+        tokens.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(tokens)
+
+
+#
+#   Closure table of TYPES. One row per (ancestor, descendant) pair, including
+#   the type itself with depth 0. Kept in sync with TYPES.parent_id by triggers.
+#
+TYPES_TREE_TABLE_SQL = "CREATE TABLE IF NOT EXISTS " + TYPES_TREE_TABLE_NAME + " (" \
+                       "ancestor_id INTEGER NOT NULL, descendant_id INTEGER NOT NULL, depth INTEGER NOT NULL," \
+                       " PRIMARY KEY (ancestor_id, descendant_id)) WITHOUT ROWID;"
+
+TYPES_TREE_TRIGGERS_SQL = [
+    "CREATE TRIGGER IF NOT EXISTS types_tree_insert AFTER INSERT ON " + TYPES_TABLE_NAME + " BEGIN" +
+    " INSERT INTO " + TYPES_TREE_TABLE_NAME + " (ancestor_id, descendant_id, depth)" +
+    " SELECT ancestor_id, new.id, depth + 1 FROM " + TYPES_TREE_TABLE_NAME + " WHERE descendant_id = new.parent_id" +
+    " UNION ALL SELECT new.id, new.id, 0; END;",
+
+    # Subtypes of deleted type stay in TYPES, so only their links to the type and above are dropped
+    "CREATE TRIGGER IF NOT EXISTS types_tree_delete AFTER DELETE ON " + TYPES_TABLE_NAME + " BEGIN" +
+    " DELETE FROM " + TYPES_TREE_TABLE_NAME +
+    " WHERE descendant_id IN (SELECT descendant_id FROM " + TYPES_TREE_TABLE_NAME + " WHERE ancestor_id = old.id)" +
+    " AND ancestor_id IN (SELECT ancestor_id FROM " + TYPES_TREE_TABLE_NAME + " WHERE descendant_id = old.id); END;",
+
+    "CREATE TRIGGER IF NOT EXISTS types_tree_move AFTER UPDATE OF parent_id ON " + TYPES_TABLE_NAME +
+    " WHEN old.parent_id IS NOT new.parent_id BEGIN" +
+    " DELETE FROM " + TYPES_TREE_TABLE_NAME +
+    " WHERE descendant_id IN (SELECT descendant_id FROM " + TYPES_TREE_TABLE_NAME + " WHERE ancestor_id = new.id)" +
+    " AND ancestor_id IN (SELECT ancestor_id FROM " + TYPES_TREE_TABLE_NAME +
+    " WHERE descendant_id = new.id AND ancestor_id != new.id);" +
+    " INSERT INTO " + TYPES_TREE_TABLE_NAME + " (ancestor_id, descendant_id, depth)" +
+    " SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1" +
+    " FROM " + TYPES_TREE_TABLE_NAME + " a, " + TYPES_TREE_TABLE_NAME + " d" +
+    " WHERE a.descendant_id = new.parent_id AND d.ancestor_id = new.id; END;",
+]
+
+TYPES_TREE_FILL_SQL = "INSERT INTO " + TYPES_TREE_TABLE_NAME + " (ancestor_id, descendant_id, depth)" \
+                      " WITH RECURSIVE chain(ancestor_id, descendant_id, depth) AS (" \
+                      " SELECT id, id, 0 FROM " + TYPES_TABLE_NAME + \
+                      " UNION ALL SELECT c.ancestor_id, t.id, c.depth + 1 FROM " + TYPES_TABLE_NAME + \
+                      " t JOIN chain c ON t.parent_id = c.descendant_id)" \
+                      " SELECT ancestor_id, descendant_id, depth FROM chain;"
+
+
+#
+#   Number of parts directly in each type, kept by triggers on PARTS.
+#
+TYPES_COUNTS_TABLE_SQL = "CREATE TABLE IF NOT EXISTS " + TYPES_COUNTS_TABLE_NAME + " (" \
+                         "type_id INTEGER PRIMARY KEY, parts INTEGER NOT NULL DEFAULT 0);"
+
+TYPES_COUNTS_TRIGGERS_SQL = [
+    "CREATE TRIGGER IF NOT EXISTS types_counts_insert AFTER INSERT ON " + PARTS_TABLE_NAME + " BEGIN" +
+    " INSERT INTO " + TYPES_COUNTS_TABLE_NAME + " (type_id, parts) VALUES (new.type_id, 1)" +
+    " ON CONFLICT(type_id) DO UPDATE SET parts = parts + 1; END;",
+
+    "CREATE TRIGGER IF NOT EXISTS types_counts_delete AFTER DELETE ON " + PARTS_TABLE_NAME + " BEGIN" +
+    " UPDATE " + TYPES_COUNTS_TABLE_NAME + " SET parts = parts - 1 WHERE type_id = old.type_id; END;",
+
+    "CREATE TRIGGER IF NOT EXISTS types_counts_move AFTER UPDATE OF type_id ON " + PARTS_TABLE_NAME +
+    " WHEN old.type_id IS NOT new.type_id BEGIN" +
+    " UPDATE " + TYPES_COUNTS_TABLE_NAME + " SET parts = parts - 1 WHERE type_id = old.type_id;" +
+    " INSERT INTO " + TYPES_COUNTS_TABLE_NAME + " (type_id, parts) VALUES (new.type_id, 1)" +
+    " ON CONFLICT(type_id) DO UPDATE SET parts = parts + 1; END;",
+]
+
+
+#
+#   Schema migrations. Applied in order to upgrade catalog files in place,
+#   the current version is kept in PRAGMA user_version.
+#   Each step is an SQL statement or a callable receiving DBScheme.
+#
+SCHEME_MIGRATIONS = [
+    (1, "Indexes for catalog lookups", [
+        # (type_id, part_num) serves both WHERE type_id = ? and ORDER BY part_num
+        "CREATE INDEX IF NOT EXISTS idx_parts_type_partnum ON " + PARTS_TABLE_NAME + " (type_id, part_num);",
+        "CREATE INDEX IF NOT EXISTS idx_types_parent ON " + TYPES_TABLE_NAME + " (parent_id, name);",
+        "CREATE INDEX IF NOT EXISTS idx_headers_type ON " + HEADER_TABLE_NAME + " (type_id, field_name);",
+        "CREATE INDEX IF NOT EXISTS idx_datasheets_part ON " + DATASHEETS_TABLE_NAME + " (part_id);",
+    ]),
+    (2, "Indexes for project references", [
+        "CREATE INDEX IF NOT EXISTS idx_el_by_project_project ON " + EL_BY_PROJECT_TABLE + " (project_id);",
+        "CREATE INDEX IF NOT EXISTS idx_el_by_project_part ON " + EL_BY_PROJECT_TABLE + " (part_id);",
+    ]),
+    (3, "Full text index for parts search", [
+        _createPartsFts,
+    ]),
+    (4, "Types closure table", [
+        TYPES_TREE_TABLE_SQL,
+        "CREATE INDEX IF NOT EXISTS idx_types_tree_descendant ON " + TYPES_TREE_TABLE_NAME +
+        " (descendant_id, depth);",
+        "DELETE FROM " + TYPES_TREE_TABLE_NAME + ";",
+        TYPES_TREE_FILL_SQL,
+    ] + TYPES_TREE_TRIGGERS_SQL),
+    (5, "Parts counts per type", [
+        TYPES_COUNTS_TABLE_SQL,
+        "DELETE FROM " + TYPES_COUNTS_TABLE_NAME + ";",
+        "INSERT INTO " + TYPES_COUNTS_TABLE_NAME + " (type_id, parts)" +
+        " SELECT type_id, count(*) FROM " + PARTS_TABLE_NAME + " GROUP BY type_id;",
+    ] + TYPES_COUNTS_TRIGGERS_SQL),
+    (6, "Indexes for parts sorting", [
+        "CREATE INDEX IF NOT EXISTS idx_parts_type_" + fldName + " ON " + PARTS_TABLE_NAME +
+        " (type_id, " + fldName + ");" for fldName in SORT_INDEXED_FIELDS
+    ]),
+    (7, "Unique settings names", [
+        # Keep the last value of a repeated name and sort orders of existing types only
+        "DELETE FROM " + ENVIRONMENT_TABLE + " WHERE id NOT IN (SELECT max(id) FROM " + ENVIRONMENT_TABLE +
+        " GROUP BY name);",
+        "DELETE FROM " + ENVIRONMENT_TABLE + " WHERE substr(name, 1, " + str(len(SORT_ORDER_ENV)) + ")" +
+        " = '" + SORT_ORDER_ENV + "' AND substr(name, " + str(len(SORT_ORDER_ENV) + 1) + ") NOT IN (SELECT CAST(id AS TEXT) FROM " +
+        TYPES_TABLE_NAME + ");",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_environment_name ON " + ENVIRONMENT_TABLE + " (name);",
+    ]),
+]
+
+SCHEME_VERSION = SCHEME_MIGRATIONS[-1][0]
+
+
+def _idChunks(ids: list):
+    """
+    Split ids for "id IN (...)" statements, yields (placeholders, ids)
+    """
+    ids = [int(recId) for recId in ids]
+    for start in range(0, len(ids), MAX_IN_PARAMS):
+        chunk = ids[start:start + MAX_IN_PARAMS]
+        yield ", ".join(["?"] * len(chunk)), chunk
+
+
+#
+#   Statements registry. Each query is defined once with ? placeholders,
+#   so the text is stable and sqlite3 reuses the compiled statement.
+#
+SCHEME_STATEMENTS = {
+    "loadTypes": "SELECT id,name,path,parent_id FROM " + TYPES_TABLE_NAME + " WHERE parent_id = ? ORDER BY name;",
+    "loadAllTypes": "SELECT t.id,t.name,t.path,t.parent_id,coalesce(n.parts, 0) FROM " + TYPES_TABLE_NAME + " t" +
+                    " LEFT JOIN " + TYPES_COUNTS_TABLE_NAME + " n ON n.type_id = t.id" +
+                    " ORDER BY t.parent_id, t.name;",
+    "loadTypesSubtree": "SELECT t.id,t.name,t.path,t.parent_id,coalesce(n.parts, 0) FROM " + TYPES_TREE_TABLE_NAME + " c" +
+                        " JOIN " + TYPES_TABLE_NAME + " t ON t.id = c.descendant_id" +
+                        " LEFT JOIN " + TYPES_COUNTS_TABLE_NAME + " n ON n.type_id = t.id" +
+                        " WHERE c.ancestor_id = ? AND c.depth > 0 ORDER BY t.parent_id, t.name;",
+    "isSubtype": "SELECT depth FROM " + TYPES_TREE_TABLE_NAME + " WHERE ancestor_id = ? AND descendant_id = ?;",
+    "subtypeIds": "SELECT descendant_id FROM " + TYPES_TREE_TABLE_NAME + " WHERE ancestor_id = ?;",
+    "hasSubtypes": "SELECT 1 FROM " + TYPES_TREE_TABLE_NAME + " WHERE ancestor_id = ? AND depth > 0 LIMIT 1;",
+    "getEnv": "SELECT value FROM " + ENVIRONMENT_TABLE + " WHERE name = ?;",
+    "setEnv": "INSERT INTO " + ENVIRONMENT_TABLE + " (name, value) VALUES (?, ?)" +
+              " ON CONFLICT(name) DO UPDATE SET value = excluded.value;",
+    "addType": "INSERT INTO " + TYPES_TABLE_NAME + " ( name,path,parent_id ) VALUES (?, ?, ?);",
+    "renameType": "UPDATE " + TYPES_TABLE_NAME + " SET name = ? WHERE id = ?;",
+    "updateType": "UPDATE " + TYPES_TABLE_NAME + " SET name = ?, path = ? WHERE id = ?;",
+    "moveType": "UPDATE " + TYPES_TABLE_NAME + " SET parent_id = ?, path = ? WHERE id = ?;",
+    "delType": "DELETE FROM " + TYPES_TABLE_NAME + " WHERE id = ?;",
+    "loadHeaders": "SELECT " + ", ".join(HEADER_FLD_NAMES) + " FROM " + HEADER_TABLE_NAME +
+                   " WHERE type_id = ? ORDER BY field_name;",
+    "addHeader": "INSERT INTO " + HEADER_TABLE_NAME + " (" + ", ".join(HEADER_FLD_NAMES[1:]) + ")" +
+                 " VALUES (" + ", ".join(["?"] * (len(HEADER_FLD_NAMES) - 1)) + ");",
+    "updateHeader": "UPDATE " + HEADER_TABLE_NAME + " SET " +
+                    ", ".join(map(lambda n: n + " = ?", HEADER_FLD_NAMES[1:])) + " WHERE id = ?;",
+    "loadPart": "SELECT " + ", ".join(ELEMENT_FLD_NAMES) + " FROM " + PARTS_TABLE_NAME + " WHERE id = ?;",
+    "loadPartsByType": "SELECT " + ", ".join(ELEMENT_FLD_NAMES) + " FROM " + PARTS_TABLE_NAME +
+                       " WHERE type_id = ? ORDER BY part_num;",
+    # Parts of the type and all its subtypes. Ordered by type path (names chain),
+    # so types come depth first with siblings by name, like the types tree shows them.
+    "loadPartsBySubtree": "SELECT " + ", ".join(map(lambda n: "p." + n, ELEMENT_FLD_NAMES)) +
+                          " FROM " + TYPES_TREE_TABLE_NAME + " c" +
+                          " JOIN " + TYPES_TABLE_NAME + " t ON t.id = c.descendant_id" +
+                          " JOIN " + PARTS_TABLE_NAME + " p ON p.type_id = c.descendant_id" +
+                          " WHERE c.ancestor_id = ? ORDER BY t.path, p.part_num;",
+    "countPartsByType": "SELECT coalesce(sum(parts), 0) FROM " + TYPES_COUNTS_TABLE_NAME + " WHERE type_id = ?;",
+    "countPartsBySubtree": "SELECT coalesce(sum(n.parts), 0) FROM " + TYPES_TREE_TABLE_NAME + " c" +
+                           " JOIN " + TYPES_COUNTS_TABLE_NAME + " n ON n.type_id = c.descendant_id" +
+                           " WHERE c.ancestor_id = ?;",
+    "updatePart": "UPDATE " + PARTS_TABLE_NAME + " SET " +
+                  ", ".join(map(lambda n: n + " = ?", ELEMENT_FLD_NAMES[1:])) + " WHERE id = ?;",
+    "delPart": "DELETE FROM " + PARTS_TABLE_NAME + " WHERE id = ?;",
+    "chPartsType": "UPDATE " + PARTS_TABLE_NAME + " SET type_id = ? WHERE id = ?;",
+    "partSearch": "SELECT " + ", ".join(ELEMENT_FLD_NAMES) + " FROM " + PARTS_TABLE_NAME +
+                  " WHERE part_num LIKE ? OR device_code LIKE ? OR description LIKE ?;",
+    "partSearchFts": "SELECT " + ", ".join(map(lambda n: "p." + n, ELEMENT_FLD_NAMES)) +
+                     " FROM " + PARTS_FTS_TABLE_NAME + " f JOIN " + PARTS_TABLE_NAME + " p ON p.id = f.rowid" +
+                     " WHERE " + PARTS_FTS_TABLE_NAME + " MATCH ?" +
+                     " ORDER BY bm25(" + PARTS_FTS_TABLE_NAME + ", " + PARTS_FTS_WEIGHTS + "), p.part_num;",
+    "partSearchScoped": "SELECT " + ", ".join(ELEMENT_FLD_NAMES) + " FROM " + PARTS_TABLE_NAME +
+                        " WHERE (part_num LIKE ? OR device_code LIKE ? OR description LIKE ?)" +
+                        " AND type_id IN (SELECT descendant_id FROM " + TYPES_TREE_TABLE_NAME +
+                        " WHERE ancestor_id = ?);",
+    "partSearchFtsScoped": "SELECT " + ", ".join(map(lambda n: "p." + n, ELEMENT_FLD_NAMES)) +
+                           " FROM " + PARTS_FTS_TABLE_NAME + " f JOIN " + PARTS_TABLE_NAME + " p ON p.id = f.rowid" +
+                           " WHERE " + PARTS_FTS_TABLE_NAME + " MATCH ?" +
+                           " AND p.type_id IN (SELECT descendant_id FROM " + TYPES_TREE_TABLE_NAME +
+                           " WHERE ancestor_id = ?)" +
+                           " ORDER BY bm25(" + PARTS_FTS_TABLE_NAME + ", " + PARTS_FTS_WEIGHTS + "), p.part_num;",
+    "loadDocuments": "SELECT id, part_id, type, uri FROM " + DATASHEETS_TABLE_NAME + " WHERE part_id = ?;",
+    "addDocument": "INSERT INTO " + DATASHEETS_TABLE_NAME + " ( part_id, type, uri ) VALUES (?, ?, ?);",
+    "delDocument": "DELETE FROM " + DATASHEETS_TABLE_NAME + " WHERE id = ?;",
+}
+
+
 class DBScheme:
-    def __init__(self, db_file: str):
-        self.db: SQLiteConnector = SQLiteConnector(db_file)
+    def __init__(self, db_file: str, profile: dict = None):
+        self.db: SQLiteConnector = SQLiteConnector(db_file, profile=profile)
         self.Types = None
+        self.ftsEnabled = False
+        for name, sql in SCHEME_STATEMENTS.items():
+            self.db.statements.register(name, sql)
+
+    def sql(self, name) -> str:
+        """
+        Return registered statement text by name
+        """
+        return self.db.statements[name]
+
+    def statementStats(self) -> dict:
+        return self.db.statements.stats()
 
     # def createDB(self):
     #     self.db.connect()
@@ -191,6 +469,28 @@ class DBScheme:
     def connect(self):
         self.db.connect()
 
+    def closeThreadConnection(self):
+        self.db.closeThreadConnection()
+
+    def transaction(self):
+        """
+        Transaction scope for a group of writes. A nested scope is a savepoint of the outer one.
+        Usage:
+            with scheme.transaction():
+                scheme.addPart(...)
+                scheme.chPartsType(...)
+        """
+        return self.db.transaction()
+
+    def begin(self):
+        self.db.begin()
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
     def createTables(self):
         if self.db.isConnect():
             # Create Types table
@@ -203,10 +503,75 @@ class DBScheme:
             self.db.exec(ENVIRONMENT_TABLE_SQL)
             self.db.commit()
 
+    def getVersion(self) -> int:
+        curr = self.db.select("PRAGMA user_version;")
+        version = curr.fetchone()[0]
+        curr.close()
+        return version
+
+    def migrate(self) -> int:
+        """
+        Upgrade DB scheme up to SCHEME_VERSION. Every migration runs in its own transaction
+        together with the user_version update. Statistics are refreshed with ANALYZE when
+        at least one migration applied.
+        :return: resulting scheme version
+        """
+        version = self.getVersion()
+        if version > SCHEME_VERSION:
+            logger.warning("DB scheme version %s is newer than supported %s. Skip migrations.",
+                           version, SCHEME_VERSION)
+            return version
+
+        applied = False
+        for migVersion, descr, steps in SCHEME_MIGRATIONS:
+            if migVersion <= version:
+                continue
+            logger.info("Migrate DB scheme to version %s: %s", migVersion, descr)
+            with self.transaction():
+                for step in steps:
+                    if callable(step):
+                        step(self)
+                    else:
+                        self.db.exec(step)
+                self.db.exec("PRAGMA user_version = " + str(int(migVersion)) + ";")
+            version = migVersion
+            applied = True
+
+        if applied:
+            self.db.exec("ANALYZE;")
+        if not self.db.hasTable(PARTS_FTS_TABLE_NAME) and self.db.hasCompileOption("ENABLE_FTS5"):
+            # Full text index migration ran with SQLite without FTS5, make the index now
+            logger.info("Create missing parts full text index")
+            with self.transaction():
+                _createPartsFts(self)
+        self.ftsEnabled = self.db.hasTable(PARTS_FTS_TABLE_NAME)
+        return version
+
     def loadTypes(self, parent_id: int = 0):
         if self.db.isConnect():
-            curr = self.db.select(
-                "SELECT id,name,path,parent_id FROM " + TYPES_TABLE_NAME + " WHERE parent_id = '" + str(parent_id) + "' ORDER BY name;")
+            curr = self.db.select(self.sql("loadTypes"), [int(parent_id)])
+            res = curr.fetchall()
+            curr.close()
+            return res
+
+    def loadAllTypes(self):
+        """
+        Whole TYPES table in one query, ordered by parent_id, name.
+        Rows are (id, name, path, parent_id, parts count)
+        """
+        if self.db.isConnect():
+            curr = self.db.select(self.sql("loadAllTypes"))
+            res = curr.fetchall()
+            curr.close()
+            return res
+
+    def loadTypesSubtree(self, parent_id: int):
+        """
+        All descendants of the type in one query, ordered by parent_id, name.
+        Rows are (id, name, path, parent_id, parts count)
+        """
+        if self.db.isConnect():
+            curr = self.db.select(self.sql("loadTypesSubtree"), [int(parent_id)])
             res = curr.fetchall()
             curr.close()
             return res
@@ -230,70 +595,130 @@ class DBScheme:
 
     def loadHeaders(self, type_id: int):
         if self.db.isConnect():
-            sql = "SELECT " + ", ".join(HEADER_FIELDS.keys()) + "  FROM " + HEADER_TABLE_NAME
-            sql += " WHERE type_id = '" + str(type_id) + "' ORDER BY field_name;"
-            curr = self.db.select(sql)
+            curr = self.db.select(self.sql("loadHeaders"), [int(type_id)])
             return curr.fetchall()
         return None
 
     def loadDocuments(self, partId):
-        sql = "SELECT  id, part_id, type, uri "
-        sql += " FROM " + DATASHEETS_TABLE_NAME + " WHERE part_id = '" + str(partId) + "'"
-        sql += ";"
-        curr = self.db.select(sql)
+        curr = self.db.select(self.sql("loadDocuments"), [partId])
         return curr.fetchall()
 
     def addType(self, type):
         values = [type.name,type.path,type.parent_id]
-
-        sql = "INSERT INTO " + TYPES_TABLE_NAME + \
-              " ( name,path,parent_id ) " \
-              "VALUES (?, ?, ?);"
-        # logger.debug("SQL > "+sql)
-        type.recId = self.db.exec_insert(sql, values)
-        self.db.commit()
+        type.recId = self.db.exec_insert(self.sql("addType"), values)
         return type
 
     def updateType(self, type_id, name, path=""):
-        values = []
         if type_id is None or name == "":
             raise ValueError("Cannot rename, new name cannot be empty.")
 
-        sql = "UPDATE " + TYPES_TABLE_NAME + " SET "
-        sql += " name=?"
-        values.append(name)
         if path != "":
-            sql += ", path=?"
-            values.append(path)
-        sql += " WHERE id=" + str(type_id) + ";"
-        recId = self.db.exec_insert(sql, values)
-        self.db.commit()
+            recId = self.db.exec_insert(self.sql("updateType"), [name, path, type_id])
+        else:
+            recId = self.db.exec_insert(self.sql("renameType"), [name, type_id])
         return recId
 
+    def moveType(self, type_id, parent_id, path):
+        self.db.exec(self.sql("moveType"), [int(parent_id), path, int(type_id)])
+
     def delType(self, recId):
-        sql = "DELETE FROM " + TYPES_TABLE_NAME + " WHERE id='" + str(recId) + "';"
-        self.db.exec(sql)
+        self.db.exec(self.sql("delType"), [recId])
         # sql = "DELETE FROM " + TYPES_TABLE_NAME + " WHERE parent_id='" + str(recId) + "';"
         # self.db.exec(sql)
-        self.db.commit()
+
+    def delTypeSubtree(self, recId) -> list:
+        """
+        Delete the type, all its subtypes and their parts with headers and documents.
+        Foreign keys are not enforced, so nothing is deleted by cascade. Call inside transaction.
+        :return: ids of deleted types
+        """
+        curr = self.db.select(self.sql("subtypeIds"), [int(recId)])
+        typeIds = [row[0] for row in curr.fetchall()]
+        curr.close()
+        for params, chunk in _idChunks(typeIds):
+            self.db.exec("DELETE FROM " + DATASHEETS_TABLE_NAME + " WHERE part_id IN (SELECT id FROM " +
+                         PARTS_TABLE_NAME + " WHERE type_id IN (" + params + "));", chunk)
+            self.db.exec("DELETE FROM " + PARTS_TABLE_NAME + " WHERE type_id IN (" + params + ");", chunk)
+            self.db.exec("DELETE FROM " + HEADER_TABLE_NAME + " WHERE type_id IN (" + params + ");", chunk)
+            self.db.exec("DELETE FROM " + TYPES_COUNTS_TABLE_NAME + " WHERE type_id IN (" + params + ");", chunk)
+            self.db.exec("DELETE FROM " + TYPES_TABLE_NAME + " WHERE id IN (" + params + ");", chunk)
+            self.db.exec("DELETE FROM " + ENVIRONMENT_TABLE + " WHERE name IN (" + params + ");",
+                         [SORT_ORDER_ENV + str(typeId) for typeId in chunk])
+        return typeIds
 
     def loadPart(self, recId: int) -> dict:
         if self.db.isConnect():
-            sql = "SELECT " + get_parts_fld_str()
-            sql += " FROM " + PARTS_TABLE_NAME + " WHERE id = " + str(recId)
-            sql += ";"
-            curr = self.db.select(sql)
+            curr = self.db.select(self.sql("loadPart"), [recId])
             return curr.fetchone()
         return None
 
     def loadPartsByType(self, typeId):
-        sql = "SELECT " + get_parts_fld_str()
-        sql += " FROM " + PARTS_TABLE_NAME + " WHERE type_id = '" + str(typeId) + "'"
-        sql += " ORDER BY part_num;"
-        curr = self.db.select(sql)
+        curr = self.db.select(self.sql("loadPartsByType"), [typeId])
         return curr.fetchall()
 
+    def loadPartsBySubtree(self, typeId):
+        """
+        Parts of the type and all its subtypes by one query
+        """
+        curr = self.db.select(self.sql("loadPartsBySubtree"), [int(typeId)])
+        return curr.fetchall()
+
+    def countPartsByType(self, typeId) -> int:
+        curr = self.db.select(self.sql("countPartsByType"), [int(typeId)])
+        res = curr.fetchone()[0]
+        curr.close()
+        return res
+
+    def countPartsBySubtree(self, typeId) -> int:
+        curr = self.db.select(self.sql("countPartsBySubtree"), [int(typeId)])
+        res = curr.fetchone()[0]
+        curr.close()
+        return res
+
+    def isSubtype(self, ancestorId, typeId) -> bool:
+        """
+        True when the type is the ancestor itself or lays anywhere below it
+        """
+        curr = self.db.select(self.sql("isSubtype"), [int(ancestorId), int(typeId)])
+        res = curr.fetchone()
+        curr.close()
+        return res is not None
+
+    def hasSubtypes(self, typeId) -> bool:
+        curr = self.db.select(self.sql("hasSubtypes"), [int(typeId)])
+        res = curr.fetchone()
+        curr.close()
+        return res is not None
+
+    def getEnv(self, name, default = None):
+        """
+        Catalog wide setting stored in ENVIRONMENT table
+        """
+        curr = self.db.select(self.sql("getEnv"), [name])
+        row = curr.fetchone()
+        curr.close()
+        return default if row is None else row[0]
+
+    def setEnv(self, name, value):
+        self.db.exec(self.sql("setEnv"), [name, value])
+
     def addPart(self, type_id: int, els: dict) -> int:
+        sql, values = self._addPartSql(type_id, els)
+        recId = self.db.exec_insert(sql + ";", values)
+        # self.db.commit()
+        return recId
+
+    def insertPart(self, type_id: int, els: dict) -> tuple:
+        """
+        Same as addPart but return the stored row, fields in ELEMENT_FLD_NAMES order
+        """
+        sql, values = self._addPartSql(type_id, els)
+        if RETURNING_SUPPORTED:
+            return self.db.exec_returning(sql + " RETURNING " + ", ".join(ELEMENT_FLD_NAMES) + ";", values)
+        # SQLite before 3.35, read the stored row back
+        return self.loadPart(self.db.exec_insert(sql + ";", values))
+
+    def _addPartSql(self, type_id: int, els: dict):
         allow_fields = ELEMENT_FIELDS.keys()
         f_names = ""
         params = ""
@@ -317,37 +742,96 @@ class DBScheme:
         params = params[:-1]
 
         sql = "INSERT INTO " + PARTS_TABLE_NAME + " ( " + f_names + " )"
-        sql += " VALUES (" + params + ");"
-        recId = self.db.exec_insert(sql, values)
-        # self.db.commit()
-        return recId
+        sql += " VALUES (" + params + ")"
+        return sql, values
+
+    def addParts(self, type_id: int, elsList: list) -> int:
+        """
+        Bulk insert parts of one type with a single executemany.
+        All dicts take the field list of the first one.
+        :return: count of inserted rows
+        """
+        if len(elsList) == 0:
+            return 0
+        f_names = [key for key in elsList[0].keys() if key in ELEMENT_FIELDS.keys() and key not in ("id", "type_id")]
+        if "part_num" not in f_names:
+            raise RuntimeError("Field part_num Required.")
+        f_names.append("type_id")
+
+        sql = "INSERT INTO " + PARTS_TABLE_NAME + " ( " + ",".join(f_names) + " )"
+        sql += " VALUES (" + ",".join(["?"] * len(f_names)) + ");"
+        rows = [[els.get(key) for key in f_names[:-1]] + [type_id] for els in elsList]
+        return self.db.exec_many(sql, rows)
+
+    def updateParts(self, elsList: list) -> int:
+        """
+        Bulk update parts with a single executemany.
+        All dicts should contain "id" and take the field list of the first one.
+        :return: count of modified rows
+        """
+        if len(elsList) == 0:
+            return 0
+        f_names = [key for key in elsList[0].keys() if key in ELEMENT_FIELDS.keys() and key != "id"]
+        sql = "UPDATE " + PARTS_TABLE_NAME + " SET " + ", ".join(map(lambda n: n + " = ?", f_names))
+        sql += " WHERE id = ?;"
+        rows = [[els.get(key) for key in f_names] + [els["id"]] for els in elsList]
+        return self.db.exec_many(sql, rows)
 
     def updatePart(self, els):
+        """
+        Update part record. Values are bound with their native types, None is stored as NULL.
+        :param els: dict of field values, "id" required.
+        """
         allow_fields = ELEMENT_FIELDS.keys()
-        sql = ""
         for key in els.keys():
-            try:
-                if key in allow_fields:
-                    if key != "id":
-                        sql += key + " = '"
-                        sql += str(els[key]) if els[key] is not None else ""
-                        sql += "',"
-                else:
-                    raise AttributeError("Try to assign undefined parts field {}".format(key))
-            except AttributeError:
-                logger.warning("Try to assign undefined parts field %", key)
+            if key not in allow_fields:
+                logger.warning("Try to assign undefined parts field %s", key)
 
-        #   Remove trail comas
-        sql = sql[:-1]
-        sql = "UPDATE " + PARTS_TABLE_NAME + "  SET " + sql + " WHERE id=" + str(els['id']) + ";"
-        recId = self.db.exec(sql)
-        self.db.commit()
+        f_names = [key for key in ELEMENT_FLD_NAMES[1:] if key in els.keys()]
+        if len(f_names) == len(ELEMENT_FLD_NAMES) - 1:
+            sql = self.sql("updatePart")
+        else:
+            sql = "UPDATE " + PARTS_TABLE_NAME + " SET " + ", ".join(map(lambda n: n + " = ?", f_names))
+            sql += " WHERE id = ?;"
+        values = [els[key] for key in f_names]
+        values.append(els["id"])
+        recId = self.db.exec_insert(sql, values)
         return recId
 
     def delPart(self, partId):
-        sql = "DELETE FROM " + PARTS_TABLE_NAME + " WHERE id='" + str(partId) + "';"
-        self.db.exec(sql)
-        self.db.commit()
+        self.db.exec(self.sql("delPart"), [partId])
+
+    def countPartsByIds(self, partIds: list, excludeTypeId = None) -> dict:
+        """
+        :return: type id -> count of the given parts in it
+        """
+        res = {}
+        for params, chunk in _idChunks(partIds):
+            sql = "SELECT type_id, count(*) FROM " + PARTS_TABLE_NAME + " WHERE id IN (" + params + ")"
+            values = chunk
+            if excludeTypeId is not None:
+                sql += " AND type_id <> ?"
+                values = chunk + [int(excludeTypeId)]
+            curr = self.db.select(sql + " GROUP BY type_id;", values)
+            for typeId, count in curr.fetchall():
+                res[typeId] = res.get(typeId, 0) + count
+            curr.close()
+        return res
+
+    def delParts(self, partIds: list):
+        """
+        Delete parts by ids, one statement per MAX_IN_PARAMS ids. Call inside transaction.
+        """
+        for params, chunk in _idChunks(partIds):
+            self.db.exec("DELETE FROM " + PARTS_TABLE_NAME + " WHERE id IN (" + params + ");", chunk)
+
+    def chPartsTypes(self, partIds: list, newTypeId):
+        """
+        Move parts by ids to another type, one statement per MAX_IN_PARAMS ids. Call inside transaction.
+        """
+        for params, chunk in _idChunks(partIds):
+            self.db.exec("UPDATE " + PARTS_TABLE_NAME + " SET type_id = ? WHERE id IN (" + params + ")" +
+                         " AND type_id <> ?;", [int(newTypeId)] + chunk + [int(newTypeId)])
 
     def addDocument(self, parentId, type, link ):
         values = []
@@ -355,76 +839,101 @@ class DBScheme:
         values.append(type)
         values.append(link)
 
-        sql = "INSERT INTO " + DATASHEETS_TABLE_NAME + " ( part_id, type, uri )"
-        sql += " VALUES (?, ?, ?);"
-        recId = self.db.exec_insert(sql, values)
-        self.db.commit()
+        recId = self.db.exec_insert(self.sql("addDocument"), values)
         return recId
 
     def addHeader(self, hdr_dict) -> int:
-        fname = ""
-        vholder = ""
-        values = []
-        for key in hdr_dict.keys():
-            if key != "id":
-                fname += key + ","
-                vholder += "?,"
-                values.append(hdr_dict[key])
-
-        fname = fname[:-1]
-        vholder = vholder[:-1]
-
-        sql = "INSERT INTO " + HEADER_TABLE_NAME + "("+fname+") "
-        sql += "VALUES ("+vholder+");"
-
-        logger.debug("SQL: %s", sql)
-        recId = self.db.exec_insert(sql, values)
-        self.db.commit()
+        values = [hdr_dict.get(key) for key in HEADER_FLD_NAMES[1:]]
+        recId = self.db.exec_insert(self.sql("addHeader"), values)
         return recId
 
     def updateHeader(self, hdr_dict:dict):
-        sql = ""
-        values = []
-        for key in hdr_dict.keys():
-            try:
-                if key != "id":
-                    sql += key + " = ?,"
-                    values.append(hdr_dict[key])
-            except AttributeError:
-                logger.warning("Try to assign undefined parts field %", key)
-
-        #   Remove trail comas
-        sql = sql[:-1]
-        sql = "UPDATE " + HEADER_TABLE_NAME + "  SET " + sql + " WHERE id=" + str(hdr_dict['id']) + ";"
-        recId = self.db.exec_insert(sql, values)
-        self.db.commit()
+        values = [hdr_dict.get(key) for key in HEADER_FLD_NAMES[1:]]
+        values.append(hdr_dict["id"])
+        recId = self.db.exec_insert(self.sql("updateHeader"), values)
         return recId
 
     def delDocument(self, docId):
-        sql = "DELETE FROM " + DATASHEETS_TABLE_NAME + " WHERE id='" + str(docId) + "';"
-        self.db.exec(sql)
-        self.db.commit()
+        self.db.exec(self.sql("delDocument"), [docId])
 
     def chPartsType(self, partId, newParentId):
-        sql = "UPDATE " + PARTS_TABLE_NAME + "  SET type_id  = ? WHERE id=" + str(partId) + ";"
-        recId = self.db.exec_insert(sql, [newParentId])
-        self.db.commit()
+        self.db.exec_insert(self.sql("chPartsType"), [newParentId, partId])
         return partId
 
-    def partSearch(self, searchStr):
-        #"select * from tovari where [ИмяПоля] like '%" + TextBox.Text + "%'"
-        sql = "Select "+ get_parts_fld_str() + " FROM " + PARTS_TABLE_NAME +\
-              " WHERE part_num like '%" + searchStr + "%' OR" \
-              " device_code like '%" + searchStr + "%' OR" \
-              " description like '%" + searchStr + "%'" \
-                                                        ";"
-        curr = self.db.select(sql)
+    def partSearch(self, searchStr, typeId: int = None):
+        """
+        Search parts by part_num, device_code and description.
+        Use full text index (ranked, words matched by prefix) when exist, else substring scan.
+        Substring scan is also done when the index finds nothing, as prefixes miss the middle
+        of words ("358" in "LM358"), and for empty string, which lists all parts.
+        :param typeId: limit search to the type and its subtypes
+        """
+        query = ftsQuery(searchStr) if self.ftsEnabled else ""
+        if query != "":
+            if typeId is None:
+                curr = self.db.select(self.sql("partSearchFts"), [query])
+            else:
+                curr = self.db.select(self.sql("partSearchFtsScoped"), [query, int(typeId)])
+            rows = curr.fetchall()
+            if len(rows) > 0:
+                return rows
+
+        pattern = "%" + searchStr.strip() + "%"
+        if typeId is None:
+            curr = self.db.select(self.sql("partSearch"), [pattern, pattern, pattern])
+        else:
+            curr = self.db.select(self.sql("partSearchScoped"), [pattern, pattern, pattern, int(typeId)])
         return curr.fetchall()
 
     def disconnect(self):
         self.db.disconnect()
 
 
+def pathKey(path: str) -> str:
+    return " ".join(path.split())
+
+
+class TypesIndex:
+    """
+    id -> Type and path -> Type lookup over loaded types tree.
+    Filled by Types while building/adding nodes, DBFactory keeps it in sync on rename, move and delete.
+    """
+    def __init__(self):
+        self.byId = {}
+        self.byPath = {}
+
+    def add(self, theType):
+        self.byId[theType.recId] = theType
+        self.byPath[pathKey(theType.path)] = theType
+
+    def discard(self, theType):
+        """
+        Drop the type with all its subtypes from index
+        """
+        for subType in subtree(theType):
+            if self.byId.get(subType.recId) is subType:
+                del self.byId[subType.recId]
+            key = pathKey(subType.path)
+            if self.byPath.get(key) is subType:
+                del self.byPath[key]
+
+    def clear(self):
+        self.byId = {}
+        self.byPath = {}
+
+
+def subtree(theType):
+    """
+    The type and all its loaded subtypes, parents first. No recursion, safe for deep trees.
+    """
+    stack = [theType]
+    while len(stack) > 0:
+        current = stack.pop()
+        yield current
+        if current.children is not None:
+            stack.extend(current.children.typesAr)
+
+
 class Type:
     def __init__(self, scheme: DBScheme, recId: int, name: str, path: str, parent):
         self.recId = recId
@@ -435,6 +944,8 @@ class Type:
         self.children = None
         self.scheme = scheme
         self.headers: Headers = None
+        self.partsCount = 0         # parts of the type itself
+        self.subtreeCount = 0       # parts of the type and all its subtypes
 
     def __eq__(self, other):
         return self.recId == other.recId
@@ -468,17 +979,35 @@ class Type:
         return len(self.children) != 0
 
     def addChild(self, name, path):
+        children = self.getChildren()
         type = Type(self.scheme, 0, name, path, self)
         type = self.scheme.addType(type)
-        if self.children is None:
-            self.children.reload()
-        else:
-            self.children = Types(self.scheme, self)
+        type.children = Types(self.scheme, type, (), children.typesIndex)
+        children.insertNode(type)
+        if children.typesIndex is not None:
+            children.typesIndex.add(type)
         return type
 
     def appendExistChild(self, partId: int):
         self.scheme.chPartsType(partId, self.recId)
 
+    def changePartsCount(self, delta: int, direct=True) -> list:
+        """
+        Adjust cached parts counters of the type and subtree counters of its ancestors.
+        DB counters are kept by triggers, this only follows them in memory.
+        :param direct: False when parts moved with subtree, so own counter is not changed
+        :return: types which counters changed, the type first
+        """
+        if direct:
+            self.partsCount += delta
+        changed = []
+        theType = self
+        while theType is not None:
+            theType.subtreeCount += delta
+            changed.append(theType)
+            theType = theType.parent
+        return changed
+
     def getHeaders(self):
         if self.headers is None:
             self.headers = Headers(self.scheme, self.recId)
@@ -489,67 +1018,106 @@ class Type:
         return self.headers
 
     def rename(self, new_name):
+        """
+        Change name only, path and indexes are kept. Use DBFactory.renameType to keep them in sync.
+        """
         self.scheme.updateType(self.recId, new_name, self.path)
         self.name = new_name
 
 
 class Types:
-    def __init__(self, scheme: DBScheme, parent: Type = None):
+    def __init__(self, scheme: DBScheme, parent: Type = None, rows=None, typesIndex: TypesIndex = None):
+        """
+        :param parent: owner type, None for the root list
+        :param rows: type rows (id, name, path, parent_id, parts count) of the whole subtree to build from.
+                     If None, subtree loaded from DB.
+        :param typesIndex: index to register loaded and added types in, shared with all the subtree
+        """
         self.scheme = scheme
+        self.typesIndex: TypesIndex = typesIndex
         self.cursor = None
-        self.typesAr = []
-        self.IterAr = []
+        self.typesAr = []           # always sorted by name
+        self.byName = {}
         # self.parentObj = parent_obj
         self.parent: Type = parent
-        self.index = 0
-        self.reload()
+        if rows is None:
+            self.reload()
+        else:
+            self._build(rows)
 
     def reload(self):
-        self.typesAr = []
-        self.IterAr = []
-
-        parentId = 0
-        if self.parent is not None:
-            parentId = str(self.parent.recId)
+        """
+        Reload this level with all the levels below by one query.
+        """
+        if self.parent is None:
+            self._build(self.scheme.loadAllTypes())
+        else:
+            self._build(self.scheme.loadTypesSubtree(self.parent.recId))
 
-        for row in self.scheme.loadTypes(parentId):
+    def _build(self, rows):
+        """
+        Assemble subtree from flat rows in memory. Rows expected ordered by name within parent.
+        """
+        if self.typesIndex is not None:
+            for theType in self.typesAr:
+                self.typesIndex.discard(theType)
 
-            theType = Type(self.scheme, row[0], row[1], row[2], self.parent)
-            self.typesAr.append(theType)
+        byParent = {}
+        for row in rows:
+            byParent.setdefault(row[3], []).append(row)
+
+        built = []
+        stack = [self]
+        while len(stack) > 0:
+            types: Types = stack.pop()
+            types.typesAr = []
+            types.byName = {}
+            parentId = 0 if types.parent is None else types.parent.recId
+            for row in byParent.get(parentId, ()):
+                theType = Type(self.scheme, row[0], row[1], row[2], types.parent)
+                theType.children = Types(self.scheme, theType, (), self.typesIndex)
+                theType.partsCount = row[4] if len(row) > 4 else 0
+                types.typesAr.append(theType)
+                types.byName.setdefault(theType.name, theType)
+                built.append(theType)
+                if self.typesIndex is not None:
+                    self.typesIndex.add(theType)
+                stack.append(theType.children)
+
+        # Subtypes always follow their parent in built, so reversed order sums children first
+        for theType in built:
+            theType.subtreeCount = theType.partsCount
+        for theType in reversed(built):
+            if theType.parent is not None and theType.parent is not self.parent:
+                theType.parent.subtreeCount += theType.subtreeCount
+        if self.parent is not None:
+            self.parent.subtreeCount = self.parent.partsCount + sum(t.subtreeCount for t in self.typesAr)
 
     def __len__(self):
         return len(self.typesAr)
 
     def __iter__(self):
-        self.index = 0
-        self.IterAr = []
-        for item in sorted(self.typesAr):
-            self.IterAr.append(item)
-        return self
-
-    def __next__(self) -> Type:
-        if self.index < len(self.IterAr):
-            res = self.IterAr[self.index]
-            self.index += 1
-            return res
-        else:
-            self.IterAr = []
-            raise StopIteration
+        return iter(self.typesAr)
 
     def __getitem__(self, index):
         if type(index) == int:
             return self.typesAr[index]
         else:
-            for theType in self.typesAr:
-                if theType.name == index:
-                    return theType
-            raise IndexError
+            try:
+                return self.byName[index]
+            except KeyError:
+                raise IndexError(index)
 
     def getNodeById(self, db_id):
+        if self.typesIndex is not None:
+            theType = self.typesIndex.byId.get(db_id)
+            if theType is not None and theType.parent is self.parent:
+                return theType
+            raise IndexError(db_id)
         for theType in self.typesAr:
             if theType.recId == db_id:
                 return theType
-        raise IndexError
+        raise IndexError(db_id)
 
     # def getByName(self, name) -> Type:
     #     for theType in self.typesAr:
@@ -561,7 +1129,10 @@ class Types:
         thePath = self.parent.path + " " + name if self.parent is not None else name
         theType = Type(self.scheme, 0, name, thePath, self.parent)
         theType = self.scheme.addType(theType)
-        bisect.insort(self.typesAr, theType)
+        theType.children = Types(self.scheme, theType, (), self.typesIndex)
+        self.insertNode(theType)
+        if self.typesIndex is not None:
+            self.typesIndex.add(theType)
         # self.typesAr.append(theType)
         # self.typesAr.insort = sorted(self.typesAr)
         return theType
@@ -571,14 +1142,37 @@ class Types:
         # parentId = 0 if self.parent is None else self.parent.recId
         theType = Type(self.scheme, 0, name, path, self.parent)
         theType = self.scheme.addType(theType)
+        theType.children = Types(self.scheme, theType, (), self.typesIndex)
         # self.typesAr.append(theType)
-        bisect.insort(self.typesAr, theType)
+        self.insertNode(theType)
+        if self.typesIndex is not None:
+            self.typesIndex.add(theType)
         return theType
 
+    def insertNode(self, theType: Type):
+        """
+        Put existing type object to its sorted position. Neither DB nor types index are touched.
+        """
+        bisect.insort(self.typesAr, theType)
+        self.byName.setdefault(theType.name, theType)
+
     def deleteNode(self, theType: Type):
-        if theType in self.typesAr:
-            # self.scheme.
-            pass
+        """
+        Detach the type from this list. DB record is not touched, see DBFactory.deleteType
+        """
+        pos = bisect.bisect_left(self.typesAr, theType)
+        while pos < len(self.typesAr) and self.typesAr[pos] is not theType:
+            pos += 1
+        if pos == len(self.typesAr):
+            return
+        del self.typesAr[pos]
+        if self.byName.get(theType.name) is theType:
+            del self.byName[theType.name]
+            # other sibling with the same name, if any, stays reachable by name
+            if pos < len(self.typesAr) and self.typesAr[pos].name == theType.name:
+                self.byName[theType.name] = self.typesAr[pos]
+        if self.typesIndex is not None:
+            self.typesIndex.discard(theType)
 
 
 class Header:
@@ -639,10 +1233,8 @@ class Headers:
         self.scheme = scheme
         self.type_id: int = type_id
         self.headersAr = {}
-        self.index = 0
-        self.IterAr = []
 
-        for row in self.scheme.loadHeaders(str(self.type_id)):
+        for row in self.scheme.loadHeaders(self.type_id):
             # id, type_id, field_name, name, align, hidden, sort, display
             count = 0
             fldList: list = list(HEADER_FIELDS.keys())
@@ -655,20 +1247,7 @@ class Headers:
         return len(self.headersAr.keys())
 
     def __iter__(self):
-        self.index = 0
-        self.IterAr = []
-        for item in self.headersAr.keys():
-            self.IterAr.append(self.headersAr[item])
-        return self
-
-    def __next__(self) -> Header:
-        if self.index < len(self.IterAr):
-            res = self.IterAr[self.index]
-            self.index += 1
-            return res
-        else:
-            self.IterAr = []
-            raise StopIteration
+        return iter(self.headersAr.values())
 
     def __getitem__(self, field_name) -> Header:
         try:
@@ -788,6 +1367,12 @@ class Documents:
             docObj.link = doc[3]
             self.documentsAr.append(docObj)
 
+    def __len__(self):
+        return len(self.documentsAr)
+
+    def __iter__(self):
+        return iter(self.documentsAr)
+
     def __getitem__(self, id):
         for theDoc in self.documentsAr:
             if theDoc.id == id:
@@ -822,7 +1407,9 @@ class Part:
             if key != "id":
                 self.__dict__[key] = ""
         self.changed = False
+        self.dirty = set()      # fields changed since load or last save
         self.documents = None
+        self.store = None       # Parts which row this part is a view of, or PartsCache of shared parts
 
     def getType(self):
         typeId = self.__getitem__("type_id")
@@ -836,6 +1423,10 @@ class Part:
 
         for pos in range(0, len(el)):
             self.__setattr__(f_names[int(pos)], el[pos])
+        self.dirty.clear()
+        self.changed = False
+        if self.store is not None:
+            self.store.update(self)
 
     def copyData(self, fl: dict):
         allow_field = ELEMENT_FIELDS.keys()
@@ -844,29 +1435,39 @@ class Part:
                 self.__dict__[key] = fl[key]
             else:
                 logger.warning("Try to assign undefined parts field %", key)
+        if self.store is not None:
+            self.store.update(self)
 
     def __getitem__(self, index):
         return self.__dict__[index]
 
     def __setitem__(self, key, value):
-        if ELEMENT_FIELDS[key].strip() == "BOOLEAN" and type(value) == bool:
-            self.__dict__[key] = value
-        elif ELEMENT_FIELDS[key].strip() == "INTEGER" and type(value) == int:
-            self.__dict__[key] = value
-        elif ELEMENT_FIELDS[key].strip() == "TEXT" and type(value) == str:
-            self.__dict__[key] = value
-        elif ELEMENT_FIELDS[key].strip() == "REAL" and (type(value) == int or type(value) == float):
-            self.__dict__[key] = value
-        else:
+        fldType = ELEMENT_FIELDS[key].strip()
+        if not ((fldType == "BOOLEAN" and type(value) == bool) or
+                (fldType == "INTEGER" and type(value) == int) or
+                (fldType == "TEXT" and type(value) == str) or
+                (fldType == "REAL" and (type(value) == int or type(value) == float))):
             raise ValueError("Incorrect parameter type for {}. got type {}".format(key, type(value)))
+        old = self.__dict__[key]
+        if old == value and type(old) == type(value):
+            return
+        self.__dict__[key] = value
+        self.dirty.add(key)
         self.changed = True
+        if self.store is not None:
+            self.store.setValue(self.id, key, value)
 
     def save(self):
-        if self.changed:
-            els = {}
-            for key in ELEMENT_FIELDS.keys():
-                els[key] = self.__dict__[key]
-            self.scheme.updatePart(els)
+        """
+        Write changed fields only. Does nothing when there are no changes since the last save.
+        """
+        if len(self.dirty) == 0:
+            return
+        els = {key: self.__dict__[key] for key in self.dirty}
+        els["id"] = self.id
+        self.scheme.updatePart(els)
+        self.dirty.clear()
+        self.changed = False
 
     def getID(self) -> int:
         return self.id
@@ -898,42 +1499,426 @@ class Part:
             raise RuntimeError("Document id %s not found for current part %s ".format(theDoc.id,self.id))
 
 
+def _textSortKey(value):
+    return "" if value is None else str(value)
+
+
+def _numberSortKey(value):
+    """
+    Empty values first, then numbers. Numbers may be stored as text with decimal comma,
+    text which is not a number goes last.
+    """
+    if value is None or value == "":
+        return 0, 0.0
+    if type(value) == int or type(value) == float:
+        return 1, value
+    try:
+        return 1, float(str(value).strip().replace(",", "."))
+    except ValueError:
+        return 2, str(value)
+
+
+def _boolSortKey(value):
+    return bool(value)
+
+
+SORT_KEYS = {
+    "TEXT": _textSortKey,
+    "INTEGER": _numberSortKey,
+    "REAL": _numberSortKey,
+    "BOOLEAN": _boolSortKey,
+}
+
+
+def fieldSortKey(fldName):
+    """
+    Sort key function for values of the parts field, by the field type
+    """
+    return SORT_KEYS.get(ELEMENT_FIELDS[fldName].split()[0], _textSortKey)
+
+
+def parseSortOrder(text: str) -> list:
+    """
+    "part_num,-value" -> [("part_num", False), ("value", True)]. Unknown fields are skipped.
+    """
+    order = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        desc = item.startswith("-")
+        fldName = item.lstrip("-")
+        if fldName in ELEMENT_FIELDS:
+            order.append((fldName, desc))
+    return order
+
+
+def formatSortOrder(order: list) -> str:
+    return ",".join(("-" if desc else "") + fldName for fldName, desc in order)
+
+
+TRUE_TEXTS = ("1", "true", "yes", "y", "x", "+")
+FALSE_TEXTS = ("", "0", "false", "no", "n", "-")
+
+
+def convertValue(fieldType: str, value):
+    """
+    Value entered or pasted into a cell to the field type
+    :raise ValueError: when the value does not fit the type
+    """
+    if type(value) != str:
+        return value
+    text = value.strip()
+    if fieldType == "INTEGER":
+        return int(text) if text != "" else 0
+    elif fieldType == "REAL":
+        return float(text.replace(",", ".")) if text != "" else 0.0
+    elif fieldType == "BOOLEAN":
+        if text.lower() in TRUE_TEXTS:
+            return True
+        elif text.lower() in FALSE_TEXTS:
+            return False
+        raise ValueError("Not a boolean value {}".format(value))
+    return value
+
+
+def parseTsv(text: str) -> list:
+    """
+    Cells range copied from a spreadsheet: rows of tab separated, maybe quoted, values
+    """
+    rows = list(csv.reader(io.StringIO(text), delimiter="\t"))
+    while len(rows) > 0 and len(rows[-1]) == 0:
+        rows.pop()
+    return rows
+
+
+def clickSortOrder(order: list, fldName: str, descending: bool, addKey: bool = False) -> list:
+    """
+    New sort order after header click. Shift+click (addKey) adds the column as next sort key
+    or changes its direction, plain click sorts by the column only.
+    """
+    if addKey:
+        if fldName in dict(order):
+            return [(name, descending if name == fldName else desc) for name, desc in order]
+        return list(order) + [(fldName, descending)]
+    return [(fldName, descending)]
+
+
+class PartsCache:
+    """
+    Identity map of parts shared by all factory loaders: while a part is cached, every load
+    gives the same Part object. Least recently used parts are dropped above the size bound.
+    Parts lists made with the cache are registered in it, so values set through a Part or
+    written by the factory reach the rows of every loaded list.
+    """
+    def __init__(self, size: int = PARTS_CACHE_SIZE):
+        self.size = size
+        self.parts = OrderedDict()          # part id -> Part, least recently used first
+        self.stores = weakref.WeakSet()     # Parts lists sharing the cached parts
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __contains__(self, partId):
+        return partId in self.parts
+
+    def get(self, partId, default = None) -> Part:
+        with self.lock:
+            thePart = self.parts.get(partId)
+            if thePart is None:
+                return default
+            self.parts.move_to_end(partId)
+            return thePart
+
+    def __setitem__(self, partId, thePart: Part):
+        self.put(thePart)
+
+    def put(self, thePart: Part) -> Part:
+        with self.lock:
+            self.parts[thePart.id] = thePart
+            self.parts.move_to_end(thePart.id)
+            thePart.store = self
+            self._trim()
+        return thePart
+
+    def _trim(self):
+        for _ in range(0, len(self.parts)):
+            if len(self.parts) <= self.size:
+                break
+            partId = next(iter(self.parts))
+            if len(self.parts[partId].dirty) > 0:
+                # Not saved yet, keep it until it is
+                self.parts.move_to_end(partId)
+            else:
+                del self.parts[partId]
+
+    def discard(self, partId):
+        with self.lock:
+            self.parts.pop(partId, None)
+
+    def unsavedValues(self, partId) -> dict:
+        """
+        Fields of the cached part changed but not written to DB yet
+        """
+        with self.lock:
+            thePart = self.parts.get(partId)
+            if thePart is None:
+                return {}
+            return {fldName: thePart.__dict__[fldName] for fldName in thePart.dirty}
+
+    def clear(self):
+        with self.lock:
+            self.parts.clear()
+
+    def register(self, parts):
+        with self.lock:
+            self.stores.add(parts)
+
+    def _storesOf(self, partId) -> list:
+        with self.lock:
+            stores = list(self.stores)
+        return [parts for parts in stores if parts.hasPart(partId)]
+
+    def setValue(self, partId: int, fldName: str, value):
+        """
+        Field of a cached part changed, put it to rows of all lists having the part
+        """
+        for parts in self._storesOf(partId):
+            parts.setValue(partId, fldName, value)
+
+    def update(self, thePart: Part):
+        for parts in self._storesOf(thePart.id):
+            parts.update(thePart)
+
+    def storeValues(self, partId: int, values: dict):
+        """
+        Set fields already written to DB, in the cached part and rows of all lists having the part
+        """
+        thePart = self.get(partId)
+        if thePart is not None:
+            thePart.__dict__.update(values)
+            thePart.dirty.difference_update(values)
+            thePart.changed = len(thePart.dirty) > 0
+        stores = self._storesOf(partId)
+        for fldName, value in values.items():
+            for parts in stores:
+                parts.setValue(partId, fldName, value)
+
+
+class PendingEdits:
+    """
+    Edited parts waiting to be written together, in one transaction.
+    Part tracks its changed fields, so several edits of a part or a field make one UPDATE.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.parts = {}         # part id -> Part
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __contains__(self, partId):
+        return partId in self.parts
+
+    def add(self, thePart: Part) -> bool:
+        """
+        :return: True when the part was not pending yet
+        """
+        if len(thePart.dirty) == 0 or thePart.id in self.parts:
+            return False
+        self.parts[thePart.id] = thePart
+        return True
+
+    def flush(self) -> int:
+        """
+        Write all pending edits. On error they stay pending and the error is raised.
+        :return: count of written parts
+        """
+        if len(self.parts) == 0:
+            return 0
+        parts = list(self.parts.values())
+        dirty = [set(thePart.dirty) for thePart in parts]
+        try:
+            with self.factory.transaction():
+                for thePart in parts:
+                    thePart.save()
+        except BaseException:
+            # The transaction is rolled back, so all edits are unsaved again
+            for thePart, fields in zip(parts, dirty):
+                thePart.dirty |= fields
+                thePart.changed = True
+            raise
+        logger.debug("Saved edits of %s parts", len(parts))
+        self.parts.clear()
+        return len(parts)
+
+    def discard(self):
+        """
+        Drop pending edits unsaved. The parts leave the factory cache, so they are read from DB again.
+        """
+        for thePart in self.parts.values():
+            thePart.dirty.clear()
+            thePart.changed = False
+            self.factory.cache.discard(thePart.id)
+        self.parts.clear()
+
+
 class Parts:
-    def __init__(self, scheme: DBScheme):
+    """
+    Parts list stored by columns: one list of values per ELEMENT_FLD_NAMES field, filled
+    from cursor rows without per part objects. Part objects are views of rows, made on demand
+    and kept while somebody holds them, or taken from the shared PartsCache when given.
+    Changes made through a view are written to its row.
+    """
+    def __init__(self, scheme: DBScheme, rows = None, cache: PartsCache = None):
         self.scheme = scheme
-        self.partsAr = []
-        self.IterAr = []
+        self.columns = {fldName: [] for fldName in ELEMENT_FLD_NAMES}
+        self.ids = self.columns["id"]
+        self.cache = cache
+        if cache is None:
+            self.views = weakref.WeakValueDictionary()     # part id -> Part
+        else:
+            self.views = cache
+            cache.register(self)
+        self.positions = None                          # part id -> row, built on demand
+        self.keys = {}                                 # field name -> sort keys of the column
+        if rows is not None:
+            self.extend(rows)
+
+    def extend(self, rows):
+        """
+        Add cursor rows, fields in ELEMENT_FLD_NAMES order.
+        Rows of cached parts get the values not saved yet, so they show the same as the parts.
+        """
+        start = len(self.ids)
+        for fldName, values in zip(ELEMENT_FLD_NAMES, zip(*rows)):
+            self.columns[fldName].extend(values)
+        if self.cache is not None:
+            for row in range(start, len(self.ids)):
+                for fldName, value in self.cache.unsavedValues(self.ids[row]).items():
+                    self.columns[fldName][row] = value
+        self.positions = None
+        self.keys.clear()
 
     def append(self, thePart: Part):
-        self.partsAr.append(thePart)
+        for fldName in ELEMENT_FLD_NAMES:
+            self.columns[fldName].append(thePart.__dict__[fldName])
+        self.positions = None
+        self.keys.clear()
+        thePart.store = self if self.cache is None else self.cache
+        self.views[thePart.id] = thePart
 
     def __len__(self):
-        return len(self.partsAr)
+        return len(self.ids)
 
     def __iter__(self):
-        self.index = 0
-        self.IterAr = []
-        for item in self.partsAr:
-            self.IterAr.append(item)
-        return self
-
-    def __next__(self) -> Part:
-        if self.index < len(self.IterAr):
-            res = self.IterAr[self.index]
-            self.index += 1
-            return res
-        else:
-            self.IterAr = []
-            raise StopIteration
+        for row in range(0, len(self.ids)):
+            yield self._view(row)
 
     def __getitem__(self, index):
         if type(index) == int:
-            return self.partsAr[index]
+            if index < 0:
+                index += len(self.ids)
+            if not 0 <= index < len(self.ids):
+                raise IndexError(index)
+            return self._view(index)
         else:
-            for thePart in self.partsAr:
-                if thePart.part_num == index:
-                    return thePart
-            raise IndexError
+            try:
+                return self._view(self.columns["part_num"].index(index))
+            except ValueError:
+                raise IndexError
+
+    def _view(self, row: int) -> Part:
+        partId = self.ids[row]
+        thePart = self.views.get(partId)
+        if thePart is None:
+            thePart = Part(self.scheme, partId)
+            for fldName in ELEMENT_FLD_NAMES:
+                thePart.__dict__[fldName] = self.columns[fldName][row]
+            thePart.store = self if self.cache is None else self.cache
+            self.views[partId] = thePart
+        return thePart
+
+    def value(self, row: int, fldName: str):
+        """
+        Field of the row without making the Part view
+        """
+        return self.columns[fldName][row]
+
+    def column(self, fldName: str) -> list:
+        """
+        All values of the field in rows order. Do not change it, use Part or setValue
+        """
+        return self.columns[fldName]
+
+    def _positions(self) -> dict:
+        if self.positions is None:
+            self.positions = {partId: row for row, partId in enumerate(self.ids)}
+        return self.positions
+
+    def rowOf(self, partId: int) -> int:
+        return self._positions()[partId]
+
+    def hasPart(self, partId: int) -> bool:
+        return partId in self._positions()
+
+    def setValue(self, partId: int, fldName: str, value):
+        self.columns[fldName][self.rowOf(partId)] = value
+        self.keys.pop(fldName, None)
+
+    def storeValue(self, partId: int, fldName: str, value):
+        """
+        Set the field already written to DB, in the row and its Part view if any
+        """
+        self.setValue(partId, fldName, value)
+        thePart = self.views.get(partId)
+        if thePart is not None:
+            thePart.__dict__[fldName] = value
+
+    def update(self, thePart: Part):
+        """
+        Write all fields of the part view to its row
+        """
+        row = self.rowOf(thePart.id)
+        for fldName in ELEMENT_FLD_NAMES:
+            self.columns[fldName][row] = thePart.__dict__[fldName]
+        self.keys.clear()
+
+    def sortKeys(self, fldName: str) -> list:
+        """
+        Typed sort keys of the column, kept until the column changes
+        """
+        keys = self.keys.get(fldName)
+        if keys is None:
+            keys = list(map(fieldSortKey(fldName), self.columns[fldName]))
+            self.keys[fldName] = keys
+        return keys
+
+    def sort(self, fldName: str, reverse = False, key = None):
+        """
+        Reorder rows by the field values
+        :param key: function of the field value, as in list.sort. Field type sort key by default.
+        """
+        if key is None:
+            keys = self.sortKeys(fldName)
+        else:
+            keys = list(map(key, self.columns[fldName]))
+        self._reorder(sorted(range(0, len(keys)), key=keys.__getitem__, reverse=reverse))
+
+    def sortBy(self, order: list):
+        """
+        Reorder rows by several fields
+        :param order: list of (field name, descending) pairs, the first is the main one
+        """
+        rows = list(range(0, len(self.ids)))
+        # Stable sorts from the last key to the first give lexicographic order
+        for fldName, desc in reversed(order):
+            rows.sort(key=self.sortKeys(fldName).__getitem__, reverse=desc)
+        self._reorder(rows)
+
+    def _reorder(self, rows: list):
+        for values in list(self.columns.values()) + list(self.keys.values()):
+            values[:] = [values[row] for row in rows]
+        self.positions = None
 
     # def sort(self, fieldName: str, sortOrder: bool):
     #
@@ -958,35 +1943,197 @@ class Parts:
     #                       key = lambda partFld: partFld[fieldName].strip() if partFld[fieldName] is not None else "" )
 
     def getByID(self, idx) -> Part:
-        for thePart in self.partsAr:
-            if thePart.getID() == idx:
-                return thePart
-        raise IndexError
+        try:
+            return self._view(self.rowOf(idx))
+        except KeyError:
+            raise IndexError
+
+
+class PartsQuery:
+    """
+    Parts of a type (with its subtypes) in fixed order, read by pages with keyset pagination:
+    next page starts after the key of the last read row, so no OFFSET scans.
+    Order is a list of (field name, descending) pairs, part id is appended as the last key field
+    in the direction of the first one, so every row has a unique key.
+    """
+    def __init__(self, scheme: DBScheme, typeId: int, withChild=True, order: list = None):
+        self.scheme = scheme
+        self.typeId = int(typeId)
+        # Without subtypes "type_id = ?" gives the same rows and lets ORDER BY use a (type_id, field) index
+        self.withChild = withChild and scheme.hasSubtypes(self.typeId)
+        self.order = list(order) if order else [("part_num", False)]
+        for fldName, desc in self.order:
+            if fldName not in ELEMENT_FIELDS:
+                raise ValueError("Unknown parts field {}".format(fldName))
+        self.keyFields = [fldName for fldName, desc in self.order if fldName != "id"] + ["id"]
+        # id follows the direction of the first key, so a (type_id, field) index is scanned
+        # forward or backward for both directions instead of sorting
+        self.keyDesc = [desc for fldName, desc in self.order if fldName != "id"]
+        self.keyDesc.append(self.keyDesc[0] if len(self.keyDesc) > 0 else self.order[0][1])
+        self.keyPos = [ELEMENT_FLD_NAMES.index(fldName) for fldName in self.keyFields]
+
+        if self.withChild:
+            self.where = "type_id IN (SELECT descendant_id FROM " + TYPES_TREE_TABLE_NAME + " WHERE ancestor_id = ?)"
+        else:
+            self.where = "type_id = ?"
+        self.orderBy = ", ".join(map(lambda f, d: f + (" DESC" if d else ""), self.keyFields, self.keyDesc))
+
+    def keyOf(self, row) -> tuple:
+        """
+        Key of the row read by page()
+        """
+        return tuple(row[pos] for pos in self.keyPos)
+
+    def _after(self, key):
+        """
+        Condition "row comes after the key" in query order.
+        SQLite puts NULL first in ascending order and last in descending.
+        """
+        terms = []
+        values = []
+        for i in range(0, len(self.keyFields)):
+            fldName, desc, value = self.keyFields[i], self.keyDesc[i], key[i]
+            conds = []
+            condValues = []
+            for j in range(0, i):
+                if key[j] is None:
+                    conds.append(self.keyFields[j] + " IS NULL")
+                else:
+                    conds.append(self.keyFields[j] + " = ?")
+                    condValues.append(key[j])
+            if not desc:
+                if value is None:
+                    conds.append(fldName + " IS NOT NULL")
+                else:
+                    conds.append(fldName + " > ?")
+                    condValues.append(value)
+            else:
+                if value is None:
+                    continue        # nothing comes after NULL in descending order
+                conds.append("(" + fldName + " < ? OR " + fldName + " IS NULL)")
+                condValues.append(value)
+            terms.append("(" + " AND ".join(conds) + ")")
+            values += condValues
+
+        sql = "(" + " OR ".join(terms) + ")"
+        # Redundant bound on the first key field lets SQLite seek the index instead of scanning
+        if key[0] is not None:
+            if self.keyDesc[0]:
+                sql = "(" + self.keyFields[0] + " <= ? OR " + self.keyFields[0] + " IS NULL) AND " + sql
+            else:
+                sql = self.keyFields[0] + " >= ? AND " + sql
+            values.insert(0, key[0])
+        return sql, values
+
+    def pageSql(self, afterKey: tuple = None, limit: int = PARTS_PAGE_SIZE):
+        """
+        Statement of page()
+        :return: (sql, values)
+        """
+        sql = "SELECT " + ", ".join(ELEMENT_FLD_NAMES) + " FROM " + PARTS_TABLE_NAME + " WHERE " + self.where
+        values = [self.typeId]
+        if afterKey is not None:
+            cond, condValues = self._after(afterKey)
+            sql += " AND " + cond
+            values += condValues
+        sql += " ORDER BY " + self.orderBy + " LIMIT ?;"
+        values.append(int(limit))
+        return sql, values
+
+    def page(self, afterKey: tuple = None, limit: int = PARTS_PAGE_SIZE) -> list:
+        """
+        :param afterKey: key of the last row of the previous page, None for the first page
+        :return: rows in ELEMENT_FLD_NAMES order
+        """
+        sql, values = self.pageSql(afterKey, limit)
+        curr = self.scheme.db.select(sql, values)
+        rows = curr.fetchall()
+        curr.close()
+        return rows
+
+    def count(self) -> int:
+        if self.withChild:
+            return self.scheme.countPartsBySubtree(self.typeId)
+        return self.scheme.countPartsByType(self.typeId)
+
+    def pageKeys(self, pageSize: int, pages: int) -> list:
+        """
+        Keys of the last row of each of the first pages, read by one scan.
+        Lets the caller jump to any page without reading the ones before it.
+        """
+        keys = ", ".join(self.keyFields)
+        sql = "SELECT " + keys + " FROM (SELECT " + keys + ", row_number() OVER (ORDER BY " + self.orderBy + ") AS rn" + \
+              " FROM " + PARTS_TABLE_NAME + " WHERE " + self.where + ")" + \
+              " WHERE rn % ? = 0 AND rn <= ? ORDER BY rn;"
+        curr = self.scheme.db.select(sql, [self.typeId, int(pageSize), int(pageSize) * int(pages)])
+        res = [tuple(row) for row in curr.fetchall()]
+        curr.close()
+        return res
+
+    def position(self, partId: int) -> int:
+        """
+        Row number of the part in query order, -1 when the part is out of the query
+        """
+        sql = "SELECT rn FROM (SELECT id, row_number() OVER (ORDER BY " + self.orderBy + ") AS rn" + \
+              " FROM " + PARTS_TABLE_NAME + " WHERE " + self.where + ") WHERE id = ?;"
+        curr = self.scheme.db.select(sql, [self.typeId, int(partId)])
+        row = curr.fetchone()
+        curr.close()
+        return -1 if row is None else row[0] - 1
 
 
 class DBFactory:
+    """
+    Catalog access point. DB calls may be made from worker threads, every thread
+    gets its own connection. The types tree objects are shared, edit them from the GUI thread.
+    Loaded parts are shared by all loaders through the parts cache, see PartsCache.
+    """
 
-    def __init__(self, db_file: str):
+    def __init__(self, db_file: str, profile: dict = None, cacheSize: int = PARTS_CACHE_SIZE):
+        """
+        :param db_file: catalog sqlite file
+        :param profile: connection pragmas, see connector.buildProfile
+        :param cacheSize: count of Part objects kept by the parts cache
+        """
+        self.lock = threading.RLock()
         self.rootTypes = None
+        self.typesIndex = TypesIndex()
         self.db_file = db_file
-        self.scheme: DBScheme = DBScheme(self.db_file)
+        self.scheme: DBScheme = DBScheme(self.db_file, profile)
         self.idPos = ELEMENT_FLD_NAMES.index("id")
+        self.cache = PartsCache(cacheSize)
 
         if not self.isDB():
             self.scheme.connect()
             self.scheme.createTables()
-            self.scheme.db.conn.commit()
+            self.scheme.commit()
         else:
             self.scheme.connect()
+        self.scheme.migrate()
 
     def isDB(self) -> bool:
         return True if os.path.exists(self.db_file) else False
 
+    def transaction(self):
+        """
+        Transaction scope. All factory, Type, Part and Documents writes made inside
+        are committed once on exit.
+        """
+        return self.scheme.transaction()
+
     def getRootTypes(self):
         if self.rootTypes is None:
-            self.rootTypes = Types(self.scheme)
+            with self.lock:
+                if self.rootTypes is None:
+                    self.rootTypes = Types(self.scheme, typesIndex=self.typesIndex)
         return self.rootTypes
 
+    def closeThreadConnection(self):
+        """
+        Release DB connection of the current worker thread.
+        """
+        self.scheme.closeThreadConnection()
+
     def appendType(self, name, parent: Type) -> Type:
         typesList: Types = parent.getChildren() if parent is not None else self.getRootTypes()
         return typesList.addNode(name)
@@ -999,9 +2146,8 @@ class DBFactory:
         for level in range(0, len(pathAr)):
             token = pathAr[level]
 
-            try:
-                theType = typesList[token]
-            except IndexError:
+            theType = self.typesIndex.byPath.get(" ".join(pathAr[:level + 1]))
+            if theType is None:
                 theType = typesList.addNode(token)
             typesList = theType.getChildren()
 
@@ -1014,93 +2160,260 @@ class DBFactory:
 
     def getTypeByID(self, typeId: int) -> Type:
         """
-        Scan types tree for the type with requested ID.
+        Get the type with requested ID from types index.
 
         :param typeId: type id for type we are looking for
         :return: the Type object
         """
-        typesList: Types = self.getRootTypes()
-        return self._getTypeByID(typesList, typeId)
+        self.getRootTypes()
+        theType = self.typesIndex.byId.get(int(typeId))
+        if theType is None:
+            raise RuntimeError("Type id {} not found".format(typeId))
+        return theType
 
-    def _getTypeByID(self, typesList: Types, typeId: int) -> Type:
-        for theType in typesList:
-            if theType.recId == typeId:
-                return theType
-            if theType.isChildren():
-                try:
-                    return self._getTypeByID(theType.getChildren(), typeId)
-                except RuntimeError:
-                    pass
+    def getTypeByPath(self, path) -> Type:
+        self.getRootTypes()
+        theType = self.typesIndex.byPath.get(pathKey(path))
+        if theType is None:
+            raise IndexError("Type path {} not found".format(path))
+        return theType
 
-        raise RuntimeError("Type id {} not found".format(typeId))
+    def _getSiblings(self, theType: Type) -> Types:
+        return theType.parent.getChildren() if theType.parent is not None else self.getRootTypes()
 
-    def getTypeByPath(self, path) -> Type:
-        pathAr = path.split()
-        typesList: Types = self.getRootTypes()
-        theType: Type = None
+    def _rePath(self, theType: Type):
+        """
+        Rebuild paths of the type subtree from its parent path, in memory and DB, and reindex it.
+        """
+        self.typesIndex.discard(theType)
+        for subType in subtree(theType):
+            prefix = subType.parent.path + " " if subType.parent is not None else ""
+            subType.path = prefix + subType.name
+            subType.parent_id = 0 if subType.parent is None else subType.parent.recId
+            self.scheme.updateType(subType.recId, subType.name, subType.path)
+            self.typesIndex.add(subType)
+
+    def renameType(self, theType: Type, name: str) -> Type:
+        """
+        Rename the type. Paths of the type and its subtypes follow the new name.
+        """
+        if name == "":
+            raise ValueError("Type name cannot be empty.")
+        siblings = self._getSiblings(theType)
+        with self.transaction():
+            siblings.deleteNode(theType)
+            theType.name = name
+            self._rePath(theType)
+        siblings.insertNode(theType)
+        return theType
 
-        for token in pathAr:
-            theType = typesList[token]
-            if theType is None:
-                raise ValueError
-            else:
-                typesList = theType.getChildren()
+    def moveType(self, theType: Type, newParent: Type) -> Type:
+        """
+        Reparent the type with all its subtypes.
 
+        :param newParent: new parent type, None to move to the root level
+        """
+        if newParent is not None and self.scheme.isSubtype(theType.recId, newParent.recId):
+            raise ValueError("Cannot move type {} under itself.".format(theType.name))
+        siblings = self._getSiblings(theType)
+        oldParent = theType.parent
+        with self.transaction():
+            siblings.deleteNode(theType)
+            theType.parent = newParent
+            newSiblings = self._getSiblings(theType)
+            self._rePath(theType)
+            self.scheme.moveType(theType.recId, theType.parent_id, theType.path)
+        newSiblings.insertNode(theType)
+        if oldParent is not None:
+            oldParent.changePartsCount(-theType.subtreeCount, False)
+        if newParent is not None:
+            newParent.changePartsCount(theType.subtreeCount, False)
         return theType
 
+    def deleteType(self, theType: Type) -> list:
+        """
+        Delete the type with all its subtypes and their parts, and drop them from the tree.
+        :return: ancestors which parts counters changed, the parent first
+        """
+        with self.transaction():
+            self.scheme.delTypeSubtree(theType.recId)
+        self.cache.clear()
+        self._getSiblings(theType).deleteNode(theType)
+        # Counters are read back from DB, the in-memory ones may be behind it
+        changed = []
+        ancestor = theType.parent
+        while ancestor is not None:
+            ancestor.subtreeCount = self.scheme.countPartsBySubtree(ancestor.recId)
+            changed.append(ancestor)
+            ancestor = ancestor.parent
+        return changed
+
+    def movePart(self, thePart: Part, theType: Type) -> list:
+        """
+        Move the part to another type.
+        :return: types which parts counters changed
+        """
+        oldType = self.typesIndex.byId.get(thePart.type_id)
+        self.scheme.chPartsType(thePart.id, theType.recId)
+        thePart.type_id = theType.recId
+        self.cache.storeValues(thePart.id, {"type_id": theType.recId})
+        changed = theType.changePartsCount(1)
+        if oldType is not None:
+            changed += oldType.changePartsCount(-1)
+        return changed
+
+    def moveParts(self, partIds: list, theType: Type) -> list:
+        """
+        Move parts to another type in one transaction
+        :return: types which parts counters changed
+        """
+        with self.transaction():
+            moved = self.scheme.countPartsByIds(partIds, theType.recId)
+            self.scheme.chPartsTypes(partIds, theType.recId)
+        for partId in partIds:
+            self.cache.storeValues(partId, {"type_id": theType.recId})
+        changed = []
+        for typeId, count in moved.items():
+            oldType = self.typesIndex.byId.get(typeId)
+            if oldType is not None:
+                changed += oldType.changePartsCount(-count)
+        changed += theType.changePartsCount(sum(moved.values()))
+        return changed
+
+    def updateParts(self, changes: dict) -> int:
+        """
+        Write field values of many parts in one transaction. Parts with the same set
+        of changed fields are written by one executemany.
+        :param changes: part id -> {field name: value}
+        :return: count of updated parts
+        """
+        groups = {}
+        for partId, values in changes.items():
+            els = dict(values)
+            els["id"] = partId
+            groups.setdefault(tuple(sorted(values)), []).append(els)
+        with self.transaction():
+            for elsList in groups.values():
+                self.scheme.updateParts(elsList)
+        for partId, values in changes.items():
+            self.cache.storeValues(partId, values)
+        return len(changes)
+
+    def deleteParts(self, partIds: list) -> list:
+        """
+        Delete parts in one transaction
+        :return: types which parts counters changed
+        """
+        with self.transaction():
+            deleted = self.scheme.countPartsByIds(partIds)
+            self.scheme.delParts(partIds)
+        for partId in partIds:
+            self.cache.discard(partId)
+        changed = []
+        for typeId, count in deleted.items():
+            theType = self.typesIndex.byId.get(typeId)
+            if theType is not None:
+                changed += theType.changePartsCount(-count)
+        return changed
+
     def getHeadersByType(self, typeId):
         headers = Headers(self.scheme, typeId)
         return headers
 
-    def loadPartsByType(self, theType: Type, withChild = False) -> Parts:
-        parts = Parts(self.scheme)
-        parts = self._scanChildTypes(parts, theType)
-        return parts
+    def isSubtype(self, theType: Type, ancestor: Type) -> bool:
+        return self.scheme.isSubtype(ancestor.recId, theType.recId)
 
-    def _scanChildTypes(self, parts: Parts, theType: Type ) -> Parts:
-        rows = self.scheme.loadPartsByType(theType.recId)
-        parts = self._loadParts(parts, rows)
+    def countParts(self, theType: Type, withChild = True) -> int:
+        """
+        Number of parts in the type, with all its subtypes by default
+        """
+        if withChild:
+            return self.scheme.countPartsBySubtree(theType.recId)
+        return self.scheme.countPartsByType(theType.recId)
 
-        for childType in theType.getChildren():
-            parts = self._scanChildTypes(parts, childType)
-        return parts
+    def loadPartsByType(self, theType: Type, withChild = True) -> Parts:
+        """
+        :param withChild: include parts of all subtypes, fetched by one recursive query
+        """
+        parts = Parts(self.scheme, cache=self.cache)
+        if withChild:
+            rows = self.scheme.loadPartsBySubtree(theType.recId)
+        else:
+            rows = self.scheme.loadPartsByType(theType.recId)
+        return self._loadParts(parts, rows)
+
+    def queryParts(self, theType: Type, withChild = True, order: list = None) -> PartsQuery:
+        """
+        Paged reader of the type parts, see PartsQuery
+        """
+        return PartsQuery(self.scheme, theType.recId, withChild, order)
+
+    def getSortOrder(self, theType: Type) -> list:
+        """
+        Parts table sort order saved for the type, list of (field name, descending) pairs
+        """
+        return parseSortOrder(self.scheme.getEnv(SORT_ORDER_ENV + str(theType.recId), ""))
+
+    def setSortOrder(self, theType: Type, order: list):
+        self.scheme.setEnv(SORT_ORDER_ENV + str(theType.recId), formatSortOrder(order))
+
+    def loadPartsRows(self, rows) -> Parts:
+        return Parts(self.scheme, rows, self.cache)
 
     def _loadParts(self, parts: Parts, rows) -> Parts:
-        # rows = self.scheme.loadPartsByType(theType.recId)
-        for row in rows:
-            part = Part(self.scheme, row[self.idPos])
-            count = 0
-            for fldName in ELEMENT_FLD_NAMES:
-                part.__dict__[fldName] = row[count]
-                count += 1
-            parts.append(part)
+        parts.extend(rows)
         return parts
 
     def loadElementById(self, elId):
-        thePart: Part = Part(self.scheme, elId)
-        thePart.loadDatas()
+        thePart: Part = self.cache.get(elId)
+        if thePart is None:
+            thePart = Part(self.scheme, elId)
+            thePart.loadDatas()
+            self.cache.put(thePart)
         return thePart
 
     def createPart(self, theType: Type, el: dict) -> Part:
         logger.debug("Create part : {}".format(', '.join(map(str, el.values()))))
-        el_id = self.scheme.addPart(theType.recId, el)
-        part = Part(self.scheme, el_id)
-        part.loadDatas()
+        row = self.scheme.insertPart(theType.recId, el)
+        part = Part(self.scheme, row[self.idPos])
+        for fldName, value in zip(ELEMENT_FLD_NAMES, row):
+            part.__dict__[fldName] = value
+        self.cache.put(part)
+        theType.changePartsCount(1)
         return part
 
-    def search(self, searchStr):
-        partsList: Parts = Parts(self.scheme)
-        rows = self.scheme.partSearch(searchStr)
+    def createParts(self, theType: Type, elsList: list) -> int:
+        """
+        Bulk insert of many parts of the type with one executemany, see DBScheme.addParts.
+        Parts are not loaded back.
+        :return: count of inserted parts
+        """
+        with self.transaction():
+            count = self.scheme.addParts(theType.recId, elsList)
+        theType.changePartsCount(count)
+        return count
+
+    def search(self, searchStr, theType: Type = None):
+        """
+        :param theType: search only in the type and its subtypes
+        """
+        partsList: Parts = Parts(self.scheme, cache=self.cache)
+        rows = self.scheme.partSearch(searchStr, None if theType is None else theType.recId)
         parts = self._loadParts(partsList, rows)
         return parts
 
     def deletePart(self, thePart: Part):
         logger.debug("Delete part : {}".format(', '.join(map(str, thePart.__dict__.values()))))
         self.scheme.delPart(thePart.id)
+        self.cache.discard(thePart.id)
+        theType = self.typesIndex.byId.get(thePart.type_id)
+        if theType is not None:
+            theType.changePartsCount(-1)
 
     def getSearch(self, searchStr):
         self.scheme.partSearch(searchStr)
 
     def disconnect(self):
+        self.cache.clear()
         self.scheme.disconnect()
 
@@ -5,12 +5,14 @@ import sys
 from PyQt6 import QtWidgets, QtGui, QtCore
 from PyQt6.QtCore import Qt, QItemSelectionModel, QPoint, QPointF, QModelIndex
 from PyQt6.QtGui import QIcon, QAction, QDragEnterEvent, QDropEvent, QDragMoveEvent
-from PyQt6.QtWidgets import QApplication, QWidget, QMainWindow, QInputDialog, QMessageBox, QFileDialog, QDialog
+from PyQt6.QtWidgets import QApplication, QWidget, QMainWindow, QInputDialog, QMessageBox, QFileDialog, QDialog, \
+    QLabel
 
 import ElConfig
 import ElDBScheme
 import ElLogger
 import ElTypesTree
+import connector
 import constants
 from ElAppList import AppList
 from ElAppPathDialog import AppPathConfig
@@ -86,6 +88,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.partsTable.comm.partSelect.connect(self.onPartSelect)
         self.partsTable.comm.partsTypeRequest.connect(self.onLoadPartsType)
         self.partsTable.comm.hdrEditRequest.connect(self.onEditHeader)
+        self.partsTable.comm.loadProgress.connect(self.onLoadProgress)
+        self.partsTable.comm.partsCountChanged.connect(self.onPartsCountChanged)
+        self.partsTable.comm.pendingEdits.connect(self.onPendingEdits)
+        self.partsTable.comm.error.connect(self.onPartsError)
+
+        self.pendingLabel = QLabel()
+        self.statusbar.addPermanentWidget(self.pendingLabel)
 
         # self.typesTree.addEventListener(ElTypesTree.CLICK_EDIT_HEADER, self.onTreeSelect)
 
@@ -159,11 +168,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 index = self.types_tree_view.indexAt(pos)
                 if index is not None and index.isValid():
                     theType = index.data(Qt.ItemDataRole.UserRole)   #itemFromIndex
-                    # self.partsTable.tableView.model().beginRemoveRows()
-                    for partIndex in self.partsTable.tableView.selectionModel().selectedRows(column=1):
-                        thePart: Part = partIndex.data(Qt.ItemDataRole.UserRole)
-                        theType.appendExistChild(thePart.id)
-                    self.onTreeSelect(theType)
+                    changed = self.partsTable.moveSelected(theType)
+                    self.typesTree.updateCounts(changed)
                     self.statusbar.showMessage("Drop records to the `{}` type.".format(theType.name), 2000)
                     success = True
         #
@@ -266,7 +272,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         """
         self.savedTreeSelection = self.typesTree.getSelectedIndex()
         self.typesTree.getSelectedIndex()
-        self.partsTable.loadData(theType)
+        if not self.partsTable.loadData(theType):
+            return
 
         # Clear search string
         self.searchStr.setText("")
@@ -276,6 +283,29 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.partsTable.setFocus()
 
+    def onLoadProgress(self, loading: bool, rows: int):
+        """
+        Show parts loading state in the status bar
+        :param loading: True while load in progress
+        :param rows: rows loaded so far
+        """
+        if loading:
+            self.statusbar.showMessage("Loading parts… {}".format(rows))
+        else:
+            self.statusbar.showMessage("{} parts.".format(rows), 2000)
+
+    def onPendingEdits(self, count: int):
+        """
+        Show count of edited parts not written to DB yet
+        """
+        self.pendingLabel.setText("Unsaved changes: {}".format(count) if count > 0 else "")
+
+    def onPartsError(self, message: str):
+        QMessageBox.critical(self, "Error!", message)
+
+    def onPartsCountChanged(self, types: list):
+        self.typesTree.updateCounts(types)
+
     def onPartSelect(self, thePart: Part):
         """
         Process event when part selected
@@ -442,6 +472,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     def onSearch(self):
         searchStr = str(self.searchStr.text()).strip()
         if searchStr:
+            # Search is done by DB, so it must see the pending edits
+            if not self.partsTable.releaseEdits():
+                return
             parts: ElDBScheme.Parts = self.factory.search(searchStr)
             self.partsTable.loadSearchData(parts)
         # self.types_tree_view.setEnabled(False)
@@ -454,6 +487,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         :return:
         """
         # self.DB.disconnect()
+        if not self.partsTable.flushEdits():
+            button = QMessageBox.question(self, "Unsaved changes",
+                                          "Changes of {} parts cannot be saved. Quit anyway?".format(
+                                              len(self.partsTable.edits)))
+            if button != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+        self.partsTable.cancelLoad()
+        self.partsTable.pool.waitForDone()
         if self.config is not None:
             self.config.set_value("width", super(MainWindow, self).width(), "window")
             self.config.set_value("height", super(MainWindow, self).height(), "window")
@@ -483,7 +525,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         :return:
         """
         if type != ElDBScheme.DOC_TYPE_URL:
-            self.factory = DBFactory(uri)
+            if not self.partsTable.flushEdits():
+                return
+            self.factory = DBFactory(uri, connector.buildProfile(
+                self.config.get_section(constants.DB_PROFILE_SECTION)))
             ElDBScheme.DB_FACTORY = self.factory
             self.typesTree = TypesTree(self.factory, self.types_tree_view)
             # self.typesTree.addEventListener(ElTypesTree.CLICK_EVENT_NAME, self.onTreeSelect)
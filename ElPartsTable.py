@@ -1,16 +1,20 @@
 import logging
 import sys
+import threading
 import time
+from collections import OrderedDict
 
 from PyQt6 import QtCore, QtWidgets
-from PyQt6.QtCore import Qt, QModelIndex, pyqtSignal, QSize, QTimer, QVariant, QObject, QMimeData
-from PyQt6.QtGui import QStandardItemModel, QStandardItem, QColor, QAction, QFont, QMouseEvent, QDrag, QDragEnterEvent
+from PyQt6.QtCore import Qt, QModelIndex, pyqtSignal, QSize, QTimer, QVariant, QObject, QMimeData, QRunnable, \
+    QThreadPool
+from PyQt6.QtGui import QStandardItemModel, QStandardItem, QColor, QAction, QFont, QMouseEvent, QDrag, QDragEnterEvent, \
+    QKeySequence
 from PyQt6.QtWidgets import QTreeWidget, QTreeView, QHeaderView, QMenu, QInputDialog, QAbstractItemView, QMessageBox, \
     QListWidget
 
 import ElDBScheme
 import ElLogger
-from ElDBScheme import DBFactory, Type, Types, Parts, Part, Document
+from ElDBScheme import DBFactory, Type, Types, Parts, Part, Document, convertValue, parseTsv, clickSortOrder
 from ElHdrEditDialog import HeaderEditDialog
 from ElIconListWidget import IconsListWidget
 
@@ -30,6 +34,10 @@ CLICK_EVENT_NAME = "on_click"
 MODEL_TYPECHILD = 1
 MODEL_SEARCHLIST = 2
 
+PAGE_SIZE = ElDBScheme.PARTS_PAGE_SIZE
+MAX_CACHED_PAGES = 25
+EDITS_IDLE_MS = 1500     # write pending edits after this pause in editing
+
 
 class Communicate(QObject):
     documentSelect = pyqtSignal(ElDBScheme.Document)
@@ -37,6 +45,60 @@ class Communicate(QObject):
     partsTypeRequest = pyqtSignal(Part)
     error = pyqtSignal(str)
     hdrEditRequest = pyqtSignal()
+    loadProgress = pyqtSignal(bool, int)     # loading in progress, rows loaded
+    partsCountChanged = pyqtSignal(object)   # list of Types which parts were added or removed
+    pendingEdits = pyqtSignal(int)           # count of parts with not yet written changes
+
+
+HEADER_SIZE = QSize(100, 30)
+NOT_PRESENT_COLOR = QColor(245, 239, 255, 127)
+_headerFont: QFont = None
+
+
+def headerFont() -> QFont:
+    """
+    Font of the table headers. Made on first use, when QApplication already exists.
+    """
+    global _headerFont
+    if _headerFont is None:
+        _headerFont = QFont()
+        _headerFont.setBold(True)
+        _headerFont.setPixelSize(12)
+    return _headerFont
+
+
+class ColumnInfo:
+    """
+    Everything data() and headerData() need to know about a table column,
+    computed once from the field type and its header settings.
+    """
+    def __init__(self, column: int, header: ElDBScheme.Header = None):
+        self.fieldName = DB_COLUMNS[column + 2]
+        self.fieldType = ElDBScheme.ELEMENT_FIELDS[self.fieldName].split()[0]
+        self.isBool = self.fieldType == "BOOLEAN"
+        self.label = self.fieldName if header is None else header.display
+        align = None if header is None else header["align"]
+        if self.isBool or align == ElDBScheme.F_ALIGN_CENTER:
+            self.align = Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
+        elif align == ElDBScheme.F_ALIGN_LEFT:
+            self.align = Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
+        elif align == ElDBScheme.F_ALIGN_RIGHT:
+            self.align = Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        else:
+            self.align = None
+        if column == 0:
+            self.flags = Qt.ItemFlag.ItemIsEditable
+        elif self.isBool:
+            self.flags = Qt.ItemFlag.ItemIsUserCheckable
+        else:
+            self.flags = Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsEnabled
+
+
+def addKeyPressed() -> bool:
+    """
+    Shift is held: header click adds a sort key instead of replacing the order
+    """
+    return bool(QtWidgets.QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier)
 
 
 def ErrorDialog(parent, message):
@@ -48,6 +110,107 @@ def ErrorDialog(parent, message):
         defaultButton=QMessageBox.StandardButton.Ok)
 
 
+class EditQueue(QObject):
+    """
+    Write-behind queue of part edits, see ElDBScheme.PendingEdits. Edits are written
+    after EDITS_IDLE_MS without edits or when flush() is called.
+    """
+    def __init__(self, factory: DBFactory, comm: Communicate):
+        super(EditQueue, self).__init__()
+        self.comm = comm
+        self.pending = ElDBScheme.PendingEdits(factory)
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(EDITS_IDLE_MS)
+        self.timer.timeout.connect(self.onIdle)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, thePart: Part):
+        if len(thePart.dirty) == 0:
+            return
+        if self.pending.add(thePart):
+            self.comm.pendingEdits.emit(len(self.pending))
+        self.timer.start()
+
+    def flush(self):
+        """
+        Write all pending edits. On error they stay pending and the error is raised.
+        """
+        self.timer.stop()
+        if self.pending.flush() > 0:
+            self.comm.pendingEdits.emit(0)
+
+    def discard(self):
+        """
+        Drop pending edits unsaved
+        """
+        self.timer.stop()
+        self.pending.discard()
+        self.comm.pendingEdits.emit(0)
+
+    def trySave(self) -> bool:
+        """
+        Write all pending edits, an error is reported by comm.error and the edits stay pending
+        :return: False when writing failed
+        """
+        try:
+            self.flush()
+        except BaseException as e:
+            logger.exception("Saving edits failed")
+            self.comm.error.emit("Error when saving changes: {}".format(e))
+            return False
+        return True
+
+    def onIdle(self):
+        self.trySave()
+
+
+class LoaderSignals(QObject):
+    done = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+
+class PageLoader(QRunnable):
+    """
+    Run one read of a parts model in a worker thread, on the DB connection of that thread.
+    The result is posted to the GUI thread. A cancelled read is not run, or its result is dropped.
+    """
+    def __init__(self, job):
+        super(PageLoader, self).__init__()
+        self.job = job
+        self.signals = LoaderSignals()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        if self.cancelled.is_set():
+            return
+        try:
+            result = self.job()
+        except BaseException as e:
+            logger.exception("Parts read failed")
+            if not self.cancelled.is_set():
+                self.signals.error.emit(str(e))
+            return
+        if not self.cancelled.is_set():
+            self.signals.done.emit(result)
+
+
+def loaderPool() -> QThreadPool:
+    """
+    Worker for parts model reads. Reads must come in the order they were started,
+    so there is one thread. It never expires and keeps its DB connection open.
+    """
+    pool = QThreadPool()
+    pool.setMaxThreadCount(1)
+    pool.setExpiryTimeout(-1)
+    return pool
+
+
 class SearchTableModel(QtCore.QAbstractTableModel):
 
     def __init__(self, factory: DBFactory, parts: Parts):
@@ -56,6 +219,8 @@ class SearchTableModel(QtCore.QAbstractTableModel):
         self.parts: Parts = parts
         self.theType = None
         self.headers = None
+        self.order = []
+        self.columns = [ColumnInfo(column) for column in range(0, PARTS_COLUMN_COUNT)]
 
     def flags(self, index):
         column = index.column()
@@ -76,123 +241,361 @@ class SearchTableModel(QtCore.QAbstractTableModel):
 
     def data(self, index: QModelIndex, role=None):
         row = index.row()
-        column = index.column()
-        # thePart: Part = self.parts[row - 1]
-        thePart: Part = self.parts[row]
-        # hdr = self.headers[ElDBScheme.ELEMENT_FLD_NAMES[column + 2]]
-        columnName = DB_COLUMNS[column + 2]
+        col = self.columns[index.column()]
         if (role == Qt.ItemDataRole.DisplayRole) or (role == Qt.ItemDataRole.EditRole):  # Display Cell Context
-            fieldData = thePart[columnName]
-            if ElDBScheme.ELEMENT_FIELDS[columnName].strip() != "BOOLEAN":
-                return fieldData
+            if not col.isBool:
+                return self.parts.value(row, col.fieldName)
         elif role == Qt.ItemDataRole.UserRole:
-            return thePart
+            return self.parts[row]
 
     def sort(self, column: int, order: Qt.SortOrder = ...):
         columnName = DB_COLUMNS[column + 2]
-        logger.debug("Sorting by field %s", columnName)
-
-        def sort_func(Item):
-            retval = Item[columnName]
-            if ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "TEXT":
-                return "" if retval is None else str(retval)
-            elif ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "INTEGER":
-                return 0 if retval is None or retval == '' else int(retval)
-            elif ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "REAL":
-                return 0.0 if retval is None or retval == '' else float(str(retval).strip().replace(",", "."))
-            return retval
-
-        if order == Qt.SortOrder.AscendingOrder:
-            self.parts.partsAr.sort(reverse=True, key=sort_func)
-        else:
-            self.parts.partsAr.sort(reverse=False, key=sort_func)
+        self.order = clickSortOrder(self.order, columnName, order == Qt.SortOrder.DescendingOrder, addKeyPressed())
+        logger.debug("Sorting by %s", ElDBScheme.formatSortOrder(self.order))
+        self.layoutAboutToBeChanged.emit()
+        self.parts.sortBy(self.order)
 
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("Sorting result: %s", " | ".join(map(lambda p: str(p[columnName]), self.parts.partsAr)))
+            logger.debug("Sorting result: %s", " | ".join(map(str, self.parts.column(columnName))))
 
         self.layoutChanged.emit()
 
     def headerData(self, section, orientation, role=None):
         if role == Qt.ItemDataRole.DisplayRole:
             if orientation == Qt.Orientation.Horizontal:
-                column = section + 2
-                result = list(ElDBScheme.ELEMENT_FIELDS.keys())[column]
-                return result
+                return self.columns[section].label
 
         elif role == Qt.ItemDataRole.FontRole:
-            font = QFont()
-            font.setBold(True)
-            font.setPixelSize(12)
-            return QVariant(font)
+            return headerFont()
 
         elif role == Qt.ItemDataRole.SizeHintRole:
             if orientation == Qt.Orientation.Horizontal:
-                # logger.debug("data: Got resize event. Section {}".format(section))
-                return QSize(100, 30)
+                return HEADER_SIZE
 
 
 class PartsTableModel(QtCore.QAbstractTableModel):
+    """
+    Parts of the type with its subtypes, read from DB by pages on demand.
+    Rows are fetched by canFetchMore/fetchMore while the view scrolls, only the last
+    MAX_CACHED_PAGES pages stay in memory, evicted pages are read again by their start key.
+    With a loader pool the count, pages and part positions are read in its worker: rows are
+    shown when their page comes, cells of a page not read yet are empty until then.
+    """
     data_changed = pyqtSignal(QModelIndex, Part, name='dataChanged')
+    partsCounted = pyqtSignal(int)      # rows count of the query is known
+    loadError = pyqtSignal(str)
 
-    def __init__(self, factory: DBFactory, theType: Type):
+    def __init__(self, factory: DBFactory, theType: Type, order: list = None, edits: EditQueue = None,
+                 pool: QThreadPool = None):
+        """
+        :param order: list of (field name, descending) pairs, part number by default
+        :param edits: queue for cell edits, each edit is saved at once if None
+        :param pool: one thread pool for reads, see loaderPool. Read in the calling thread if None.
+        """
         super(PartsTableModel, self).__init__()
         self.factory: DBFactory = factory
         self.theType: Type = theType
-        self.parts: Parts = factory.loadPartsByType(self.theType)
+        self.edits: EditQueue = edits
+        self.pool: QThreadPool = pool
+        self.loaders = set()        # reads started and not finished yet
+        self.requested = set()      # pages being read
+        self.generation = 0         # changes when pages are forgotten, older reads are dropped
+        self.queryId = 0            # changes with the query
         self.headers: ElDBScheme.Headers = self.theType.getHeaders()
         self.needReload = False
+        self._loadColumns()
+        self._setQuery(order if order is not None else factory.getSortOrder(theType))
 
-    def data(self, index: QModelIndex, role=None):
+    def _submit(self, job, onDone):
+        """
+        Run the read job in the loader pool and pass its result to onDone in the GUI thread.
+        Without pool the job is run at once.
+        """
+        if self.pool is None:
+            onDone(job())
+            return
+        loader = PageLoader(job)
+
+        def done(result):
+            self.loaders.discard(loader)
+            if not loader.cancelled.is_set():
+                onDone(result)
+
+        def failed(message):
+            self.loaders.discard(loader)
+            if not loader.cancelled.is_set():
+                self.loadError.emit(message)
+
+        loader.signals.done.connect(done)
+        loader.signals.error.connect(failed)
+        self.loaders.add(loader)
+        self.pool.start(loader)
+
+    def cancelLoads(self):
+        """
+        Drop all reads in progress, their results are ignored
+        """
+        for loader in self.loaders:
+            loader.cancel()
+        self.loaders.clear()
+        self.requested.clear()
+
+    def _flushEdits(self) -> bool:
+        """
+        Write pending edits before an action which orders or positions rows by SQL.
+        Never called from data(): pages read meanwhile get unsaved values from the parts cache.
+        :return: False when writing failed, the error is reported and the edits stay pending
+        """
+        return self.edits is None or self.edits.trySave()
+
+    def _saveEdit(self, thePart: Part):
+        if self.edits is not None:
+            self.edits.add(thePart)
+        else:
+            thePart.save()
+
+    def _loadColumns(self):
+        """
+        (Re)build column descriptors. Done on creation and after updateHeader, not per cell.
+        """
         if self.needReload:
             self.headers: ElDBScheme.Headers = self.theType.refreshHeaders()
             self.needReload = False
+        self.columns = [ColumnInfo(column, self.headers[DB_COLUMNS[column + 2]])
+                        for column in range(0, PARTS_COLUMN_COUNT)]
+
+    def _setQuery(self, order: list = None):
+        """
+        Start the query in the order. The first page is fetched when the rows count is known.
+        """
+        self.cancelLoads()
+        self.order = order or [("part_num", False)]
+        self.query: ElDBScheme.PartsQuery = self.factory.queryParts(self.theType, True, self.order)
+        self.total = 0              # rows of the query, 0 until counted
+        self.loaded = 0             # rows shown in the view
+        self.pageKeys = []          # key of the last row of every known page
+        self.cache = OrderedDict()  # page number -> Parts, in LRU order
+        self.generation += 1
+        self.queryId += 1
+        queryId = self.queryId
+        self._submit(self.query.count, lambda total: self._onCounted(queryId, total))
+
+    def _onCounted(self, queryId: int, total: int):
+        if queryId != self.queryId:
+            return
+        self.total = total
+        self.partsCounted.emit(total)
+        if self.canFetchMore():
+            self.fetchMore()
+
+    def _invalidate(self, fromPage: int = 0):
+        """
+        Forget pages from fromPage on, they are read again with new boundaries
+        """
+        del self.pageKeys[fromPage:]
+        for page in [page for page in self.cache if page >= fromPage]:
+            del self.cache[page]
+        # Reads in progress may bring rows of the old boundaries
+        self.generation += 1
+        self.requested.clear()
+
+    def _readRows(self, query: ElDBScheme.PartsQuery, pageKeys: list, page: int):
+        """
+        Read rows of the page, may run in the loader thread
+        :return: (page keys up to the page, rows)
+        """
+        if len(pageKeys) < page:
+            pageKeys = query.pageKeys(PAGE_SIZE, page)
+        afterKey = pageKeys[page - 1] if page > 0 else None
+        return pageKeys, query.page(afterKey, PAGE_SIZE)
+
+    def _storePage(self, page: int, pageKeys: list, rows: list) -> Parts:
+        if len(self.pageKeys) < page:
+            self.pageKeys = pageKeys[:page]
+        if len(rows) == PAGE_SIZE and len(self.pageKeys) == page:
+            self.pageKeys.append(self.query.keyOf(rows[-1]))
+        parts = self.factory.loadPartsRows(rows)
+        self.cache[page] = parts
+        while len(self.cache) > MAX_CACHED_PAGES:
+            self.cache.popitem(last=False)
+        return parts
+
+    def _readPage(self, page: int) -> Parts:
+        return self._storePage(page, *self._readRows(self.query, self.pageKeys, page))
+
+    def _requestPage(self, page: int):
+        """
+        Read the page in the loader thread. Shown rows of the page are repainted when it comes.
+        """
+        if page in self.requested:
+            return
+        self.requested.add(page)
+        query, pageKeys, generation = self.query, list(self.pageKeys), self.generation
+        self._submit(lambda: self._readRows(query, pageKeys, page),
+                     lambda result: self._onPageRead(generation, page, *result))
+
+    def _onPageRead(self, generation: int, page: int, pageKeys: list, rows: list):
+        if generation != self.generation:
+            # Rows of old page boundaries. Fetching goes on with the new ones.
+            if page == self.loaded // PAGE_SIZE and self.canFetchMore():
+                self.fetchMore()
+            return
+        self.requested.discard(page)
+        parts = self._storePage(page, pageKeys, rows)
+        first = page * PAGE_SIZE
+        last = min(self.loaded, first + len(parts)) - 1
+        if last >= first:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, PARTS_COLUMN_COUNT - 1))
+        if page == self.loaded // PAGE_SIZE:
+            self._showLoaded()
+
+    def _page(self, page: int) -> Parts:
+        """
+        The page for reading or editing parts, read at once if it is not in memory
+        """
+        parts = self.cache.get(page)
+        if parts is None:
+            parts = self._readPage(page)
+        else:
+            self.cache.move_to_end(page)
+        return parts
+
+    def _shownPage(self, page: int) -> Parts:
+        """
+        The page for painting. Page not in memory is requested, None until it comes.
+        """
+        parts = self.cache.get(page)
+        if parts is not None:
+            self.cache.move_to_end(page)
+            return parts
+        if self.pool is None:
+            return self._readPage(page)
+        self._requestPage(page)
+        return None
+
+    def _shownValue(self, row: int, fldName: str):
+        parts = self._shownPage(row // PAGE_SIZE)
+        offset = row % PAGE_SIZE
+        return parts.value(offset, fldName) if parts is not None and offset < len(parts) else None
+
+    def partAt(self, row: int) -> Part:
+        parts = self._page(row // PAGE_SIZE)
+        offset = row % PAGE_SIZE
+        return parts[offset] if offset < len(parts) else None
+
+    def valueAt(self, row: int, fldName: str):
+        """
+        Field of the row read from the page columns, without making the Part
+        """
+        parts = self._page(row // PAGE_SIZE)
+        offset = row % PAGE_SIZE
+        return parts.value(offset, fldName) if offset < len(parts) else None
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return not parent.isValid() and self.loaded < self.total and \
+            self.loaded // PAGE_SIZE not in self.requested
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        if parent.isValid():
+            return
+        page = self.loaded // PAGE_SIZE
+        if page in self.cache or self.pool is None:
+            self._page(page)
+            self._showLoaded()
+        else:
+            self._requestPage(page)
+
+    def fetchUpTo(self, row: int):
+        """
+        Read pages up to the row at once and show their rows, for editing rows not shown yet
+        """
+        row = min(row, self.total - 1)
+        for page in range(self.loaded // PAGE_SIZE, row // PAGE_SIZE + 1):
+            self._page(page)
+        self._showUpTo(row)
+
+    def _showLoaded(self):
+        """
+        Show rows of the page next to the shown rows, when it is in memory
+        """
+        parts = self.cache.get(self.loaded // PAGE_SIZE)
+        if parts is None or self.loaded >= self.total:
+            return
+        count = min(len(parts) - self.loaded % PAGE_SIZE, self.total - self.loaded)
+        if count <= 0:
+            # Parts were removed outside of the model
+            self.total = self.loaded
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def _showUpTo(self, row: int):
+        if row >= self.loaded:
+            self.beginInsertRows(QModelIndex(), self.loaded, row)
+            self.loaded = row + 1
+            self.endInsertRows()
+
+    def _locateRows(self, query: ElDBScheme.PartsQuery, pageKeys: list, partId: int):
+        """
+        Position of the part with rows of its page and the rows count, may run in the loader thread
+        :return: (row, rows count, page keys, page rows), row is -1 when the part is out of the query
+        """
+        row = query.position(partId)
+        if row < 0:
+            return row, 0, pageKeys, []
+        return (row, query.count()) + self._readRows(query, pageKeys, row // PAGE_SIZE)
+
+    def _locate(self, partId: int, onLocated):
+        self._flushEdits()
+        query, pageKeys, generation = self.query, list(self.pageKeys), self.generation
+        self._submit(lambda: self._locateRows(query, pageKeys, partId),
+                     lambda result: onLocated(generation, *result))
+
+    def rowOfPart(self, partId: int, done=None):
+        """
+        Find row of the part, rows up to it are fetched if needed.
+        :param done: called with the row, -1 when the part is out of the type
+        """
+        def located(generation, row, total, pageKeys, rows):
+            if row >= 0:
+                if generation == self.generation:
+                    self._storePage(row // PAGE_SIZE, pageKeys, rows)
+                self._showUpTo(row)
+            if done is not None:
+                done(row)
+
+        self._locate(partId, located)
+
+    def data(self, index: QModelIndex, role=None):
+        if self.needReload:
+            self._loadColumns()
         row = index.row()
-        column = index.column()
-        # thePart: Part = self.parts[row - 1]
-        thePart: Part = self.parts[row]
-        hdr = self.headers[ElDBScheme.ELEMENT_FLD_NAMES[column + 2]]
-        columnName = DB_COLUMNS[column + 2]
+        col = self.columns[index.column()]
         if (role == Qt.ItemDataRole.DisplayRole) or (role == Qt.ItemDataRole.EditRole):  # Display Cell Context
-            fieldData = thePart[columnName]
-            if ElDBScheme.ELEMENT_FIELDS[columnName].strip() != "BOOLEAN":
-                return fieldData
+            if not col.isBool:
+                return self._shownValue(row, col.fieldName)
 
         elif role == Qt.ItemDataRole.TextAlignmentRole:
-
-            if ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "BOOLEAN":
-                return Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
-            elif hdr["align"] == ElDBScheme.F_ALIGN_CENTER:
-                return Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
-            elif hdr["align"] == ElDBScheme.F_ALIGN_LEFT:
-                return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
-            elif hdr["align"] == ElDBScheme.F_ALIGN_RIGHT:
-                return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+            return col.align
 
         elif role == Qt.ItemDataRole.UserRole:
-            return thePart
+            return self.partAt(row)
 
         elif role == Qt.ItemDataRole.CheckStateRole:
-            if ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "BOOLEAN":
-                return Qt.CheckState.Checked if thePart[columnName] else Qt.CheckState.Unchecked
+            if col.isBool:
+                return Qt.CheckState.Checked if self._shownValue(row, col.fieldName) else Qt.CheckState.Unchecked
 
         elif role == Qt.ItemDataRole.BackgroundRole:
-            if thePart["present"] is not None and not thePart["present"]:
-                color = QColor(245, 239, 255, 127)
-                return color
+            present = self._shownValue(row, "present")
+            if present is not None and not present:
+                return NOT_PRESENT_COLOR
 
     def flags(self, index):
-        column = index.column()
-        fieldName = ElDBScheme.ELEMENT_FLD_NAMES[column + 2]
-
-        if index.column() == 0:
-            return super().flags(index) | Qt.ItemFlag.ItemIsEditable
-        elif ElDBScheme.ELEMENT_FIELDS[fieldName] == "BOOLEAN":
-            return super().flags(index) | Qt.ItemFlag.ItemIsUserCheckable
-        else:
-            return super().flags(index) | Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsEnabled
+        return super().flags(index) | self.columns[index.column()].flags
 
     def rowCount(self, index: QModelIndex = ...):
-        return len(self.parts)
+        return self.loaded
 
     def columnCount(self, index: QModelIndex = ...) -> int:
         return PARTS_COLUMN_COUNT
@@ -202,28 +605,18 @@ class PartsTableModel(QtCore.QAbstractTableModel):
 
     def headerData(self, section, orientation, role=None):
         if self.needReload:
-            self.headers: ElDBScheme.Headers = self.theType.refreshHeaders()
-            self.needReload = False
+            self._loadColumns()
 
         if role == Qt.ItemDataRole.DisplayRole:
             if orientation == Qt.Orientation.Horizontal:
-                column = section + 2
-                fldName = list(ElDBScheme.ELEMENT_FIELDS.keys())[column]
-                result = self.headers[fldName].display
-                # logger.debug("Header %s, value %s",fldName, result)
-                # result = self.headers[fldName].display
-                return result
+                return self.columns[section].label
 
         elif role == Qt.ItemDataRole.FontRole:
-            font = QFont()
-            font.setBold(True)
-            font.setPixelSize(12)
-            return QVariant(font)
+            return headerFont()
 
         elif role == Qt.ItemDataRole.SizeHintRole:
             if orientation == Qt.Orientation.Horizontal:
-                # logger.debug("data: Got resize event. Section {}".format(section))
-                return QSize(100, 30)
+                return HEADER_SIZE
 
     # https://doc.qt.io/qt-6/qabstractitemmodel.html#dataChanged
     def setData(self, index, value, role=None):
@@ -231,64 +624,154 @@ class PartsTableModel(QtCore.QAbstractTableModel):
             return False
         row = index.row()
         column = index.column()
-        # thePart: Part = self.parts[row - 1]
-        thePart: Part = self.parts[row]
-        columnName = DB_COLUMNS[column + 2]
+        thePart: Part = self.partAt(row)
+        if thePart is None:
+            return False
+        col = self.columns[column]
+        columnName = col.fieldName
 
         if role == Qt.ItemDataRole.EditRole:
             logger.debug("Call edit. row=%s column=%s, value=%s", index.row(), index.column(), value)
             # column = index.column()
             try:
-                if ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "INTEGER":
-                    thePart[columnName] = int(value) if value != "" else 0
-                elif ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "REAL":
-                    transTbl = str.maketrans("," , ".")
-                    thePart[columnName] = float(str(value).translate(transTbl)) if value != "" else 0.0
-                else:
-                    thePart[columnName] = value
-                thePart.save()
+                thePart[columnName] = convertValue(col.fieldType, value)
+                self._saveEdit(thePart)
+                self._keyChanged(columnName)
             except ValueError as e:
                 # logger.error(e)
                 logging.exception("ValueError")
                 ErrorDialog(None, "Incorrect value type for column {}".format(columnName))
             return True
 
-        elif role == Qt.ItemDataRole.CheckStateRole and ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "BOOLEAN":
+        elif role == Qt.ItemDataRole.CheckStateRole and col.isBool:
             logger.debug("Check State %s, value %s", role, value)
             if thePart[columnName]:
                 thePart[columnName] = False
             else:
                 thePart[columnName] = True
             # self.dataChanged.emit(index, index)
-            thePart.save()
+            self._saveEdit(thePart)
+            self._keyChanged(columnName)
             return True
 
         return super().setData(index, value, role)
 
-    def removeRow(self, row: int, parent: QModelIndex = ...) -> bool:
-        # index = self.selectionModel().currentIndex()
-        # super(PartsTableModel, self).selectionModel().currentIndex()
-        # thePart: Part = index.sibling(row, 1).data(Qt.ItemDataRole.UserRole)
+    def setCells(self, cells: list) -> int:
+        """
+        Set many cells at once: all values are checked first, then written by batched UPDATEs
+        in one transaction and shown by one dataChanged.
+        :param cells: list of (row, column, value), values as entered or pasted
+        :return: count of changed parts
+        :raise ValueError: when a value does not fit its column, nothing is changed then
+        """
+        changes = {}        # row -> {field name: value}
+        for row, column, value in cells:
+            col = self.columns[column]
+            try:
+                changes.setdefault(row, {})[col.fieldName] = convertValue(col.fieldType, value)
+            except ValueError:
+                raise ValueError("Row {}, column {}: '{}' is not {} value".format(
+                    row + 1, col.label, value, col.fieldType.lower()))
+        if len(changes) == 0:
+            return 0
+        self._flushEdits()
+        # Loaded pages and parts get the values from the factory parts cache
+        self.factory.updateParts({self.valueAt(row, "id"): values for row, values in changes.items()})
+
+        fields = set()
+        for values in changes.values():
+            fields.update(values)
+        if len(fields.intersection(self.query.keyFields)) > 0:
+            # Changed parts move, read all pages again
+            self.layoutAboutToBeChanged.emit()
+            self._invalidate()
+            self.layoutChanged.emit()
+        else:
+            columns = [column for row, column, value in cells]
+            self.dataChanged.emit(self.index(min(changes), min(columns)), self.index(max(changes), max(columns)))
+        return len(changes)
 
-        self.beginRemoveRows(QModelIndex(), row, row)
-        thePart: Part = self.parts.partsAr.pop(row)
-        try:
-            logger.debug("Remove part=%s(%s), row=%s", thePart["part_num"], thePart.id, row)
-            self.factory.deletePart(thePart)
-        except BaseException as e:
-            logger.error(e)
-            self.parts.partsAr.append(thePart)
-            ErrorDialog(self, "DB error when removing part {}".format(thePart["part_num"]))
-            return False
-        self.endRemoveRows()
-        return True
+    def _keyChanged(self, columnName):
+        """
+        Edit of a sort field moves the part, so read all pages again
+        """
+        if columnName in self.query.keyFields:
+            self._flushEdits()
+            self.layoutAboutToBeChanged.emit()
+            self._invalidate()
+            self.layoutChanged.emit()
 
-    def appendRow(self, thePart: Part):
-        newRow = len(self.parts.partsAr) + 1
-        self.beginInsertRows(QModelIndex(), newRow, newRow)
-        self.parts.partsAr.append(thePart)
-        self.endInsertRows()
-        return True
+    def _removeRows(self, rows: list):
+        """
+        Take out of the view rows which parts already left the query
+        """
+        rows = sorted(set(rows), reverse=True)
+        if len(rows) == 0:
+            return
+        self._invalidate(rows[-1] // PAGE_SIZE)
+        # Remove contiguous ranges from the bottom, so rows above keep their numbers
+        start = end = rows[0]
+        for row in rows[1:] + [None]:
+            if row is not None and row == start - 1:
+                start = row
+                continue
+            self.beginRemoveRows(QModelIndex(), start, end)
+            self.loaded -= end - start + 1
+            self.total -= end - start + 1
+            self.endRemoveRows()
+            start = end = row
+
+    def removeParts(self, rows: list) -> list:
+        """
+        Delete parts of the rows by one statement
+        :return: types which parts counters changed
+        """
+        self._flushEdits()
+        partIds = [self.valueAt(row, "id") for row in rows]
+        changed = self.factory.deleteParts(partIds)
+        self._removeRows(rows)
+        return changed
+
+    def moveParts(self, rows: list, theType: Type) -> list:
+        """
+        Move parts of the rows to another type by one statement.
+        Rows stay when the type is in the shown subtree, otherwise they are removed.
+        :return: types which parts counters changed
+        """
+        self._flushEdits()
+        partIds = [self.valueAt(row, "id") for row in rows]
+        changed = self.factory.moveParts(partIds, theType)
+        if self.factory.isSubtype(theType, self.theType):
+            self.layoutAboutToBeChanged.emit()
+            self._invalidate(min(rows) // PAGE_SIZE)
+            self.layoutChanged.emit()
+        else:
+            self._removeRows(rows)
+        return changed
+
+    def insertPart(self, thePart: Part, done=None):
+        """
+        Show just created part at its place in the query order
+        :param done: called with the row of the part, -1 when the part is out of the type
+        """
+        def located(generation, row, total, pageKeys, rows):
+            if row >= 0:
+                self.total = total
+                known = generation == self.generation
+                self._invalidate(row // PAGE_SIZE)
+                if known:
+                    # Read after the part was added, so the page is up to date
+                    self._storePage(row // PAGE_SIZE, pageKeys, rows)
+                if row < self.loaded:
+                    self.beginInsertRows(QModelIndex(), row, row)
+                    self.loaded += 1
+                    self.endInsertRows()
+                else:
+                    self._showUpTo(row)
+            if done is not None:
+                done(row)
+
+        self._locate(thePart.id, located)
 
     def setHeaderData(self, section, orientation, value, role=None):
         if role == Qt.ItemDataRole.DisplayRole:
@@ -302,30 +785,29 @@ class PartsTableModel(QtCore.QAbstractTableModel):
         return False
 
     def sort(self, column: int, order: Qt.SortOrder = ...):
-        # self.beginResetModel()
+        """
+        Sorting is done by DB, the model is read again from the first page.
+        The order is saved for the type.
+        """
         columnName = DB_COLUMNS[column + 2]
-        logger.debug("Sorting by field %s", columnName)
-
-        def sort_func(Item):
-            retval = Item[columnName]
-            if ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "TEXT":
-                return "" if retval is None else str(retval)
-            elif ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "INTEGER":
-                return 0 if retval is None or retval == '' else int(retval)
-            elif ElDBScheme.ELEMENT_FIELDS[columnName].strip() == "REAL":
-                return 0.0 if retval is None or retval == '' else float(str(retval).strip().replace(",", "."))
-            return retval
-
-        if order == Qt.SortOrder.AscendingOrder:
-            self.parts.partsAr.sort(reverse=True, key=sort_func)
-        else:
-            self.parts.partsAr.sort(reverse=False, key=sort_func)
-
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("Sorting result: %s", " | ".join(map(lambda p: str(p[columnName]), self.parts.partsAr)))
-
-        # self.endResetModel()
-        self.layoutChanged.emit()
+        newOrder = clickSortOrder(self.order, columnName, order == Qt.SortOrder.DescendingOrder, addKeyPressed())
+        if newOrder == self.order:
+            return
+        logger.debug("Sorting by %s", ElDBScheme.formatSortOrder(newOrder))
+        self._flushEdits()
+        self.beginResetModel()
+        self._setQuery(newOrder)
+        self.endResetModel()
+        self.factory.setSortOrder(self.theType, self.order)
+
+    def sortSection(self):
+        """
+        Column and Qt order of the main sort key, for the header sort indicator
+        """
+        fldName, desc = self.order[0]
+        if fldName not in DB_COLUMNS[2:]:
+            return -1, Qt.SortOrder.AscendingOrder
+        return DB_COLUMNS.index(fldName) - 2, Qt.SortOrder.DescendingOrder if desc else Qt.SortOrder.AscendingOrder
 
 
 class TableView(QtCore.QObject):
@@ -336,6 +818,9 @@ class TableView(QtCore.QObject):
         self.searchMode = False
         self.saveResize = False
         self.comm = Communicate()
+        self.edits = EditQueue(factory, self.comm)
+        self.pool: QThreadPool = loaderPool()
+        self.selectFirst = False    # select the first row when it is shown
         # self._events = {}
         self.docListWidget = docList
         self.tableView: QtWidgets.QTableView = tableView
@@ -374,6 +859,8 @@ class TableView(QtCore.QObject):
         # self.tableView.sortByColumn(col, Qt.DescendingOrder)
         # self.tableView.clicked.connect(self.onClick)
 
+        self._defineEditActions()
+
         self.iconsListWidget: IconsListWidget = IconsListWidget(self.factory, self.docListWidget)
         self.iconsListWidget.comm.itemSelect.connect(self.onDocumentSelect)
 
@@ -478,14 +965,51 @@ class TableView(QtCore.QObject):
         delAct.setStatusTip("Delete selected part.")
         delAct.triggered.connect(self.deleteRow)
 
+        setAct = QAction("Set Field for Selection", self.tableView)
+        setAct.setStatusTip("Set the column value of all selected parts.")
+        setAct.triggered.connect(self.setFieldForSelection)
+
         menu = QMenu(self.tableView)
         menu.addAction(tglAct)
         menu.addAction(addAct)
         menu.addSeparator()
+        menu.addAction(self.pasteAct)
+        menu.addAction(self.fillDownAct)
+        menu.addAction(setAct)
+        menu.addSeparator()
         menu.addAction(delAct)
         return menu
 
-    def loadSearchData(self, parts: Parts):
+    def _defineEditActions(self):
+        """
+        Table actions with keyboard shortcuts, also shown in the body menu
+        """
+        self.pasteAct = QAction("Paste Cells", self.tableView)
+        self.pasteAct.setStatusTip("Paste cells range copied from a spreadsheet.")
+        self.pasteAct.setShortcut(QKeySequence.StandardKey.Paste)
+        self.pasteAct.setShortcutContext(Qt.ShortcutContext.WidgetShortcut)
+        self.pasteAct.triggered.connect(self.pasteCells)
+        self.tableView.addAction(self.pasteAct)
+
+        self.fillDownAct = QAction("Fill Down", self.tableView)
+        self.fillDownAct.setStatusTip("Copy the value of the first selected part to the other selected.")
+        self.fillDownAct.setShortcut(QKeySequence("Ctrl+D"))
+        self.fillDownAct.setShortcutContext(Qt.ShortcutContext.WidgetShortcut)
+        self.fillDownAct.triggered.connect(self.fillDown)
+        self.tableView.addAction(self.fillDownAct)
+
+    def cancelLoad(self):
+        """
+        Drop reads of the shown parts model, which are not started or in progress
+        """
+        if isinstance(self.tableModel, PartsTableModel):
+            self.tableModel.cancelLoads()
+        self.pool.clear()
+
+    def loadSearchData(self, parts: Parts) -> bool:
+        if not self.releaseEdits():
+            return False
+        self.cancelLoad()
         self.theType = None
         self.headers = None
         self.searchMode = True
@@ -495,16 +1019,29 @@ class TableView(QtCore.QObject):
         selection_model = self.tableView.selectionModel()
         selection_model.selectionChanged.connect(self.onSelectionChanged)
         self.iconsListWidget.clear()
+        return True
 
-    def loadData(self, theType: Type):
+    def loadData(self, theType: Type) -> bool:
+        """
+        Show parts of the type
+        :return: False when pending edits cannot be saved and the current view is kept
+        """
         # try: self.header.sectionResized.disconnect()
         # except TypeError: pass
+        if not self.releaseEdits():
+            return False
+        self.cancelLoad()
         self.searchMode = False
         self.timestamp = {}
         self.saveResize = False
         self.theType = theType
         # self.header.sectionResized.disconnect()
-        self.tableModel = PartsTableModel(self.factory, self.theType)
+        self.selectFirst = True
+        self.comm.loadProgress.emit(True, 0)
+        self.tableModel = PartsTableModel(self.factory, self.theType, edits=self.edits, pool=self.pool)
+        self.tableModel.partsCounted.connect(self.onPartsCounted)
+        self.tableModel.loadError.connect(self.onLoadError)
+        self.tableModel.rowsInserted.connect(self.onRowsShown)
         self.tableView.setModel(self.tableModel)  # parts_tbl_view
         self.headers: ElDBScheme.Headers = self.theType.getHeaders()
         self.tableView.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
@@ -533,9 +1070,25 @@ class TableView(QtCore.QObject):
         selection_model = self.tableView.selectionModel()
         selection_model.selectionChanged.connect(self.onSelectionChanged)
         self.iconsListWidget.clear()
-        self.tableView.selectRow(0)
         self.saveResize = True
+        # Show the saved sort order without sorting again
+        self.header.blockSignals(True)
+        self.header.setSortIndicator(*self.tableModel.sortSection())
+        self.header.blockSignals(False)
+        # The model counts parts and reads the first page in the loader, the rest while the view scrolls
+        return True
 
+    def onPartsCounted(self, total: int):
+        self.comm.loadProgress.emit(False, total)
+
+    def onRowsShown(self, parent: QModelIndex, first: int, last: int):
+        if self.selectFirst and first == 0:
+            self.selectFirst = False
+            self.tableView.selectRow(0)
+
+    def onLoadError(self, message: str):
+        self.comm.loadProgress.emit(False, self.tableModel.loaded)
+        ErrorDialog(self.tableView, "DB error when reading parts: {}".format(message))
 
     # def dataChanged(self, index1, index2):
     #     logger.debug("DataChanged event occurred.")
@@ -567,6 +1120,7 @@ class TableView(QtCore.QObject):
         :param deselected:
         :return:
         """
+        self.flushEdits()
         if len(self.tableView.selectedIndexes()) > 0:
             index: QModelIndex = self.tableView.selectedIndexes()[0]
             thePart: Part = index.data(Qt.ItemDataRole.UserRole)
@@ -575,6 +1129,34 @@ class TableView(QtCore.QObject):
             self.iconsListWidget.load(thePart)
             self.comm.partSelect.emit(thePart)
 
+    def flushEdits(self) -> bool:
+        """
+        Write pending cell edits now
+        :return: False when writing failed, the edits stay pending
+        """
+        try:
+            self.edits.flush()
+        except BaseException as e:
+            logger.exception("Saving edits failed")
+            ErrorDialog(self.tableView, "Error when saving changes: {}".format(e))
+            return False
+        return True
+
+    def releaseEdits(self) -> bool:
+        """
+        Write pending cell edits before the view is replaced. When writing fails,
+        ask whether to drop them.
+        :return: False when the edits stay pending and the current view should be kept
+        """
+        if self.flushEdits():
+            return True
+        button = QMessageBox.question(self.tableView, "Unsaved changes",
+                                      "Changes of {} parts cannot be saved. Discard them?".format(len(self.edits)))
+        if button != QMessageBox.StandardButton.Yes:
+            return False
+        self.edits.discard()
+        return True
+
     def onDocumentSelect(self, theDoc: Document):
         """
         Repost Event wyen user select document in this part documentsList
@@ -621,14 +1203,14 @@ class TableView(QtCore.QObject):
         hdr: ElDBScheme.Header = self.getHeaderByColumn(self.menuColumnSelected)
         hdr["hidden"] = True
         hdr.save()
-        self.tableView.update()
+        self.updateHeader(hdr)
 
     def showColumn(self):
         self.tableView.hideColumn(self.menuColumnSelected + 1)
         hdr: ElDBScheme.Header = self.getHeaderByColumn(self.menuColumnSelected + 1)
         hdr["hidden"] = False
         hdr.save()
-        self.tableView.update()
+        self.updateHeader(hdr)
 
     def renameHeader(self):
         hdr: ElDBScheme.Header = self.getHeaderByColumn(self.menuColumnSelected)
@@ -636,6 +1218,7 @@ class TableView(QtCore.QObject):
         if newName.strip():
             hdr["display"] = newName
             hdr.save()
+            self.updateHeader(hdr)
             self.tableModel.setHeaderData(self.menuColumnSelected,
                                           Qt.Orientation.Horizontal,
                                           newName,
@@ -646,22 +1229,19 @@ class TableView(QtCore.QObject):
         hdr: ElDBScheme.Header = self.getHeaderByColumn(self.menuColumnSelected)
         hdr["align"] = ElDBScheme.F_ALIGN_RIGHT
         hdr.save()
-        # self.tableView.changeEvent()
-        # index = QModelIndex()
-        # idx = self.tableModel.index(self.menuColumnSelected)
-        # self.tableModel.dataChanged.emit(idx)
-        self.tableView.update()
+        self.updateHeader(hdr)
 
     def alignLeft(self):
         hdr: ElDBScheme.Header = self.getHeaderByColumn(self.menuColumnSelected)
         hdr["align"] = ElDBScheme.F_ALIGN_LEFT
         hdr.save()
-        self.tableView.update()
+        self.updateHeader(hdr)
 
     def alignCenter(self):
         hdr: ElDBScheme.Header = self.getHeaderByColumn(self.menuColumnSelected)
         hdr["align"] = ElDBScheme.F_ALIGN_CENTER
         hdr.save()
+        self.updateHeader(hdr)
 
     def editHeader(self):
         self.comm.hdrEditRequest.emit()
@@ -692,20 +1272,133 @@ class TableView(QtCore.QObject):
             el = {}
             el["part_num"] = value
             thePart = self.factory.createPart(theType, el)
-            self.tableModel.appendRow(thePart)
+            self.selectFirst = False
+            self.tableModel.insertPart(thePart, self._selectFound)
+            self.comm.partsCountChanged.emit([theType])
 
-    def deleteRow(self):
-        index = (self.tableView.selectionModel().currentIndex())
-        thePart: Part = index.sibling(self.menuRowSelected, 1).data(Qt.ItemDataRole.UserRole)
+    def _selectFound(self, row: int):
+        if row >= 0:
+            self.tableView.selectRow(row)
 
-        theType = self.factory.getTypeByID(thePart["type_id"])
-        button = QMessageBox.question(self.tableView, "Deleting part",
-                                      "Are you sure want to delete the part: {} {} ?".format(theType.path,
-                                                                                             thePart["part_num"]))
+    def getSelectedRows(self) -> list:
+        return sorted(index.row() for index in self.tableView.selectionModel().selectedRows())
+
+    def deleteRow(self):
+        rows = self.getSelectedRows()
+        if self.menuRowSelected not in rows:
+            rows = [self.menuRowSelected]
+        if len(rows) == 1:
+            thePart: Part = self.tableModel.partAt(rows[0])
+            theType = self.factory.getTypeByID(thePart["type_id"])
+            question = "Are you sure want to delete the part: {} {} ?".format(theType.path, thePart["part_num"])
+        else:
+            question = "Are you sure want to delete {} selected parts ?".format(len(rows))
+        button = QMessageBox.question(self.tableView, "Deleting part", question)
         if button == QMessageBox.StandardButton.Yes:
-            # self._delete(index)
-            self.tableModel.removeRow(self.menuRowSelected)
-            logger.debug("Menu Clicked on row %s", thePart["part_num"])
+            try:
+                changed = self.tableModel.removeParts(rows)
+            except BaseException as e:
+                logger.exception("Parts delete failed")
+                ErrorDialog(self.tableView, "DB error when removing parts: {}".format(e))
+                return
+            self.comm.partsCountChanged.emit(changed)
+            logger.debug("Deleted %s parts", len(rows))
+
+    def _setCells(self, cells: list) -> bool:
+        if self.searchMode or len(cells) == 0:
+            return False
+        try:
+            count = self.tableModel.setCells(cells)
+        except ValueError as e:
+            ErrorDialog(self.tableView, str(e))
+            return False
+        except BaseException as e:
+            logger.exception("Cells update failed")
+            ErrorDialog(self.tableView, "DB error when saving changes: {}".format(e))
+            return False
+        logger.debug("Set %s cells of %s parts", len(cells), count)
+        return True
+
+    def _visibleColumns(self, column: int) -> list:
+        """
+        Shown columns in screen order, starting from the column
+        """
+        columns = []
+        for visual in range(self.header.visualIndex(column), PARTS_COLUMN_COUNT):
+            logical = self.header.logicalIndex(visual)
+            if not self.tableView.isColumnHidden(logical):
+                columns.append(logical)
+        return columns
+
+    def pasteCells(self):
+        """
+        Paste cells range from clipboard starting at the current cell.
+        Single value is set to the current column of all selected rows.
+        """
+        index = self.tableView.selectionModel().currentIndex()
+        if self.searchMode or not index.isValid():
+            return
+        values = parseTsv(QtWidgets.QApplication.clipboard().text())
+        if len(values) == 0:
+            return
+        rows = self.getSelectedRows()
+        if len(values) == 1 and len(values[0]) == 1 and len(rows) > 1:
+            self._setCells([(row, index.column(), values[0][0]) for row in rows])
+            return
+
+        columns = self._visibleColumns(index.column())
+        lastRow = index.row() + len(values) - 1
+        if lastRow >= self.tableModel.total or max(map(len, values)) > len(columns):
+            ErrorDialog(self.tableView, "Pasted range of {} rows does not fit the table".format(len(values)))
+            return
+        self.tableModel.fetchUpTo(lastRow)
+        cells = []
+        for rowShift, rowValues in enumerate(values):
+            for colShift, value in enumerate(rowValues):
+                cells.append((index.row() + rowShift, columns[colShift], value))
+        self._setCells(cells)
+
+    def fillDown(self):
+        """
+        Copy current column value of the first selected row to the other selected rows
+        """
+        index = self.tableView.selectionModel().currentIndex()
+        rows = self.getSelectedRows()
+        if self.searchMode or not index.isValid() or len(rows) < 2:
+            return
+        value = self.tableModel.valueAt(rows[0], self.tableModel.columns[index.column()].fieldName)
+        self._setCells([(row, index.column(), value) for row in rows[1:]])
+
+    def setFieldForSelection(self):
+        """
+        Ask value and set it to the menu column of all selected rows
+        """
+        rows = self.getSelectedRows()
+        if self.menuRowSelected not in rows:
+            rows = [self.menuRowSelected]
+        col: ColumnInfo = self.tableModel.columns[self.menuColumnSelected]
+        value, ok = QInputDialog.getText(self.tableView, 'Set field',
+                                         "Value of '{}' for {} parts".format(col.label, len(rows)))
+        if ok:
+            self._setCells([(row, self.menuColumnSelected, value) for row in rows])
+
+    def moveSelected(self, theType: Type) -> list:
+        """
+        Move selected parts to the type
+        :return: types which parts counters changed
+        """
+        rows = self.getSelectedRows()
+        if len(rows) == 0:
+            return []
+        try:
+            if self.searchMode:
+                parts: Parts = self.tableModel.parts
+                return self.factory.moveParts([parts.value(row, "id") for row in rows], theType)
+            return self.tableModel.moveParts(rows, theType)
+        except BaseException as e:
+            logger.exception("Parts move failed")
+            ErrorDialog(self.tableView, "DB error when moving parts: {}".format(e))
+            return []
 
     def addDocument(self, file, type: int = ElDBScheme.DOC_TYPE_DEFAULT):
         index = (self.tableView.selectionModel().currentIndex())
@@ -745,13 +1438,12 @@ class TableView(QtCore.QObject):
         logger.debug("Update Header %s, index=%s", hdrObj["display"], idx)
 
         self.tableView.setColumnHidden(idx, hdrObj["hidden"])
+        # Column descriptors are rebuilt on the next data() call
         self.tableModel.needReload = True
-        self.tableView.update()
+        self.tableModel.headerDataChanged.emit(Qt.Orientation.Horizontal, idx, idx)
+        self.tableView.viewport().update()
 
     def selectByID(self, theId):
-        parts:Parts = self.tableModel.parts
         if not self.searchMode:
-            for row in range(0, len(parts)):
-                thePart: Part = parts[row]
-                if thePart.id == theId:
-                    self.tableView.selectRow(row)
+            self.selectFirst = False
+            self.tableModel.rowOfPart(theId, self._selectFound)
@@ -1,14 +1,15 @@
+import bisect
 import logging
 import sys
 from typing import Any
 
 from PyQt6 import QtCore, QtGui
-from PyQt6.QtCore import Qt, QModelIndex, QObject, pyqtSignal
-from PyQt6.QtGui import QStandardItemModel, QStandardItem, QAction, QDropEvent
+from PyQt6.QtCore import Qt, QModelIndex, QObject, QPersistentModelIndex, pyqtSignal
+from PyQt6.QtGui import QAction, QDropEvent
 from PyQt6.QtWidgets import QTreeWidget, QTreeView, QMenu, QInputDialog, QMessageBox
 
 import ElLogger
-from ElDBScheme import DBFactory, Type, Types, Part
+from ElDBScheme import DBFactory, Type, Types, Part, subtree
 
 # logger = logging.getLogger(__name__)
 # logger.setLevel(level=logging.DEBUG)
@@ -26,6 +27,218 @@ class Communicate(QObject):
     typeSelect = pyqtSignal(Type, object)
 
 
+class TypesTreeModel(QtCore.QAbstractItemModel):
+    """
+    Types tree model over DBFactory types. Index internal pointer is the Type object.
+    Children rows are reported to the view only after the node was expanded (fetchMore),
+    siblings order comes from Types, which are kept sorted by name.
+    """
+    def __init__(self, factory: DBFactory):
+        super(TypesTreeModel, self).__init__()
+        self.factory: DBFactory = factory
+        self.fetched = set()        # ids of types which children rows are exposed
+        self.indexes = {}           # type id -> QPersistentModelIndex, Qt keeps them current on row changes
+
+    def reload(self):
+        self.beginResetModel()
+        self.fetched = set()
+        self.indexes = {}
+        self.endResetModel()
+
+    def typeOf(self, index: QModelIndex) -> Type:
+        return index.internalPointer() if index.isValid() else None
+
+    def childTypes(self, theType: Type) -> Types:
+        return theType.getChildren() if theType is not None else self.factory.getRootTypes()
+
+    def isFetched(self, theType: Type) -> bool:
+        return theType is None or theType.recId in self.fetched
+
+    def rowOf(self, theType: Type) -> int:
+        """
+        Position of the type between its siblings. Siblings are sorted by name, so binary search.
+        """
+        typesAr = self.childTypes(theType.parent).typesAr
+        row = bisect.bisect_left(typesAr, theType)
+        while row < len(typesAr):
+            if typesAr[row] is theType:
+                return row
+            row += 1
+        return typesAr.index(theType)
+
+    def indexOf(self, theType: Type, fetch=False) -> QModelIndex:
+        """
+        Model index of the type. Invalid when some of the ancestors is not expanded yet.
+        Found indexes are kept as persistent, so repeated lookups cost a dict access.
+        :param fetch: fetch collapsed ancestors, so the index is always valid
+        """
+        if theType is None:
+            return QModelIndex()
+        persistent = self.indexes.get(theType.recId)
+        if persistent is not None and persistent.isValid():
+            return QModelIndex(persistent)
+
+        if fetch:
+            chain = []
+            parent = theType.parent
+            while parent is not None:
+                chain.append(parent)
+                parent = parent.parent
+            for ancestor in reversed(chain):
+                if not self.isFetched(ancestor):
+                    self.fetchMore(self.indexOf(ancestor))
+        index = self._locate(theType)
+        if index.isValid():
+            self.indexes[theType.recId] = QPersistentModelIndex(index)
+        return index
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        parentType = self.typeOf(parent)
+        if column != 0 or not self.isFetched(parentType):
+            return QModelIndex()
+        typesAr = self.childTypes(parentType).typesAr
+        if row < 0 or row >= len(typesAr):
+            return QModelIndex()
+        return self.createIndex(row, 0, typesAr[row])
+
+    def parent(self, index: QModelIndex = QModelIndex()) -> QModelIndex:
+        theType = self.typeOf(index)
+        if theType is None or theType.parent is None:
+            return QModelIndex()
+        return self.createIndex(self.rowOf(theType.parent), 0, theType.parent)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.column() > 0:
+            return 0
+        parentType = self.typeOf(parent)
+        if not self.isFetched(parentType):
+            return 0
+        return len(self.childTypes(parentType))
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 1
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return len(self.childTypes(self.typeOf(parent))) > 0
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        parentType = self.typeOf(parent)
+        return not self.isFetched(parentType) and len(self.childTypes(parentType)) > 0
+
+    def fetchMore(self, parent: QModelIndex):
+        parentType = self.typeOf(parent)
+        if self.isFetched(parentType):
+            return
+        count = len(self.childTypes(parentType))
+        if count > 0:
+            self.beginInsertRows(parent, 0, count - 1)
+        self.fetched.add(parentType.recId)
+        if count > 0:
+            self.endInsertRows()
+
+    def data(self, index: QModelIndex, role=None):
+        theType = self.typeOf(index)
+        if theType is None:
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            if theType.subtreeCount == 0:
+                return theType.name
+            if theType.partsCount == theType.subtreeCount:
+                return "{} ({})".format(theType.name, theType.partsCount)
+            return "{} ({} / {})".format(theType.name, theType.partsCount, theType.subtreeCount)
+        elif role == Qt.ItemDataRole.EditRole:
+            return theType.name
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            return theType.path
+        elif role == Qt.ItemDataRole.UserRole:
+            return theType
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEditable | \
+            Qt.ItemFlag.ItemIsDragEnabled | Qt.ItemFlag.ItemIsDropEnabled
+
+    def setData(self, index: QModelIndex, value, role=None):
+        theType = self.typeOf(index)
+        if theType is None or role != Qt.ItemDataRole.EditRole:
+            return False
+        value = str(value).strip()
+        if value == "" or value == theType.name:
+            return False
+        self._relayout(lambda: self.factory.renameType(theType, value))
+        return True
+
+    def _relayout(self, change):
+        """
+        Apply change moving types between/within siblings lists and remap persistent indexes.
+        """
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        persistentTypes = [self.typeOf(index) for index in persistent]
+        try:
+            change()
+        finally:
+            newIndexes = []
+            for theType in persistentTypes:
+                if theType is not None and self.factory.typesIndex.byId.get(theType.recId) is theType:
+                    newIndexes.append(self._locate(theType))
+                else:
+                    newIndexes.append(QModelIndex())
+            self.changePersistentIndexList(persistent, newIndexes)
+            self.layoutChanged.emit()
+
+    def _locate(self, theType: Type) -> QModelIndex:
+        """
+        Index of the type computed from the tree, bypassing persistent indexes cache
+        """
+        parent = theType.parent
+        while parent is not None:
+            if not self.isFetched(parent):
+                return QModelIndex()
+            parent = parent.parent
+        return self.createIndex(self.rowOf(theType), 0, theType)
+
+    def addType(self, name: str, parentType: Type = None) -> Type:
+        parent = self.indexOf(parentType, True)
+        self.fetchMore(parent)
+        siblings = self.childTypes(parentType).typesAr
+        row = bisect.bisect_right([theType.name for theType in siblings], name)
+        self.beginInsertRows(parent, row, row)
+        try:
+            newType = self.factory.appendType(name, parentType)
+        finally:
+            self.endInsertRows()
+        if len(siblings) == 1 and parentType is not None:
+            # parent got first child, repaint expand decoration
+            self.dataChanged.emit(parent, parent)
+        return newType
+
+    def removeType(self, theType: Type):
+        """
+        Delete the type. Rows are removed from the view only after DB deletion succeeded,
+        on error the tree stays as it was.
+        """
+        index = self.indexOf(theType)
+        parent, row = index.parent(), index.row()
+        self.factory.deleteType(theType)
+        if index.isValid():
+            self.beginRemoveRows(parent, row, row)
+            self.endRemoveRows()
+        for subType in subtree(theType):
+            self.fetched.discard(subType.recId)
+            self.indexes.pop(subType.recId, None)
+
+    def updateTypes(self, types: list):
+        """
+        Repaint visible rows of the types
+        """
+        for theType in types:
+            index = self.indexOf(theType)
+            if index.isValid():
+                self.dataChanged.emit(index, index)
+
+
 class TypesTree(QtCore.QObject):
     def __init__(self, factory: DBFactory, treeWidget: QTreeView):
         super().__init__()
@@ -34,18 +247,14 @@ class TypesTree(QtCore.QObject):
         self.dbFactory = factory
         self.rootElements = None
         self.treeWidget: QTreeView = treeWidget
-        self.treeModel = QStandardItemModel()
+        self.treeModel = TypesTreeModel(factory)
         self.treeWidget.setModel(self.treeModel)
-        # self.rootNode = self.treeModel.invisibleRootItem()
-        self.rootNode: QStandardItem = None
 
         self.treeWidget.setRootIsDecorated(True)  # Clear current tree content
         self.treeWidget.setUniformRowHeights(True)
         self.treeWidget.setHeaderHidden(True)
         self.treeWidget.clicked.connect(self.onClick)
-        self.lastClickedItem: QStandardItem = None
-
-        self.treeWidget.model().dataChanged.connect(self.onDataChanged)
+        self.lastClickedItem: QModelIndex = None
 
         self.treeWidget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.treeWidget.customContextMenuRequested.connect(self.onMenuEvent)
@@ -99,8 +308,8 @@ class TypesTree(QtCore.QObject):
         return menu
 
     def onClick(self, sel: QModelIndex):
-        self.lastClickedItem = self.treeModel.itemFromIndex(sel)
-        theType: Type = self.lastClickedItem.data(Qt.ItemDataRole.UserRole)
+        self.lastClickedItem = sel
+        theType: Type = sel.data(Qt.ItemDataRole.UserRole)
         logger.debug("Clicked: %s", theType.name)
         # self.dispatchEvent(CLICK_EVENT_NAME, theType)
         self.comm.typeSelect.emit(theType, None)
@@ -112,40 +321,26 @@ class TypesTree(QtCore.QObject):
         self.menu.popup(coord)
 
     def clear(self):
-        model: QStandardItemModel = self.treeWidget.model()
-        if model is not None:
-            model.clear()       # works
-            model.setRowCount(0)  # works
+        self.treeModel.reload()
 
     def load(self):
-        if self.rootNode is not None:
-            self.clear()
-        # self.clearQTreeWidget(self.treeWidget)
-
-        self.rootNode = self.treeModel.invisibleRootItem()
-        self.rootNode.setData(None, Qt.ItemDataRole.UserRole)
-        self._loadNodes_(self.rootNode, self.dbFactory.getRootTypes())
+        self.treeModel.reload()
         logger.debug("Tree Complete.")
 
         ### Select first item
-        if self.rootNode.hasChildren():
-            item = self.rootNode.child(0, 0)
-            self.selectItem(item)
+        if self.treeModel.rowCount() > 0:
+            self.selectItem(self.treeModel.index(0, 0))
             self.treeWidget.setFocus()
             # self.dispatchEvent(CLICK_EVENT_NAME, item.data(Qt.ItemDataRole.UserRole))
 
-        self.treeModel.sort(0, Qt.SortOrder.AscendingOrder)
-        # self.treeModel.setSortRole(Qt.ItemDataRole.DisplayRole)
-        # self.treeModel.sort(self.modelColumn(), Qt.DescendingOrder)
-
-    def selectItem(self, item, part:Part=None):
+    def selectItem(self, item: QModelIndex, part:Part=None):
         """
         Select Type item in tree view and select part in table (if parts param are sent)
-        :param item:
+        :param item: model index of the type
         :param part:
         :return:
         """
-        newIndex = self.treeWidget.model().indexFromItem(item)
+        newIndex = item
         self._expandInDeep(item)
 
         self.treeWidget.selectionModel().select(
@@ -159,12 +354,13 @@ class TypesTree(QtCore.QObject):
         # self.dispatchEvent(CLICK_EVENT_NAME, item.data(Qt.ItemDataRole.UserRole))
         self.comm.typeSelect.emit(item.data(Qt.ItemDataRole.UserRole), part)
 
-    def _expandInDeep(self, item:QStandardItem ):
-        prnt:QStandardItem = item.parent()
-        if prnt is not None and prnt != self.rootNode:
-            self._expandInDeep(prnt)
-        index = self.treeWidget.model().indexFromItem(item)
-        self.treeWidget.setExpanded(index, True)
+    def _expandInDeep(self, item: QModelIndex):
+        prnt = item.parent()
+        while prnt.isValid():
+            self.treeWidget.setExpanded(prnt, True)
+            prnt = prnt.parent()
+        self.treeWidget.setExpanded(item, True)
+        self.treeWidget.scrollTo(item)
 
     def getSelectedIndex(self):
         # return self.treeWidget.selectionModel().selectedIndexes()
@@ -172,16 +368,6 @@ class TypesTree(QtCore.QObject):
         return self.treeWidget.selectionModel().selectedIndexes()[0] \
             if len(self.treeWidget.selectionModel().selectedIndexes()) > 0 else None
 
-    def _loadNodes_(self, node: QStandardItem, types_list: Types):
-        for theType in types_list:
-            childNode = QStandardItem(theType.name)
-            childNode.setData(theType, Qt.ItemDataRole.UserRole)
-
-            # Check for children.
-            if theType.isChildren():
-                self._loadNodes_(childNode, theType.getChildren())
-            node.appendRow(childNode)
-
     def add(self):
         logger.debug("Add menu clicked.")
         name = self.getInput()
@@ -192,15 +378,7 @@ class TypesTree(QtCore.QObject):
         if name == "":
             raise ValueError("Type name cannot be empty.")
         if parentIndex is None:
-            parentIndex: QModelIndex = self.treeModel.indexFromItem(self.rootNode)
-            # self.treeModel.invisibleRootItem()
-            # parentItem: QStandardItem = self.rootNode
-            # # index: QModelIndex = self.treeWidget.selectedIndexes()[0]
-            # neighbor: Type = index.data(Qt.ItemDataRole.UserRole)
-            # neighborItem :QStandardItem = index.model().itemFromIndex(index)
-
-        # parentItem: QStandardItem = neighborItem.parent() if neighborItem.parent() is not None else self.rootNode
-        # parentType: Type = parentItem.data(Qt.ItemDataRole.UserRole)
+            parentIndex = QModelIndex()
         return self._addChild(name, parentIndex)
 
     def addChild(self):
@@ -214,23 +392,7 @@ class TypesTree(QtCore.QObject):
         if name == "":
             raise ValueError("Type name cannot be empty.")
         parentType: Type = parentIndex.data(Qt.ItemDataRole.UserRole)
-        parentItem: QStandardItem = self.treeModel.itemFromIndex(parentIndex)
-        if parentItem is None:
-            parentItem = self.rootNode
-
-        newType = self.dbFactory.appendType(name, parentType)
-        childItem = QStandardItem(newType.name)
-        childItem.setData(newType, Qt.ItemDataRole.UserRole)
-        parentItem.appendRow(childItem)
-        self.treeModel.sort(0, Qt.SortOrder.AscendingOrder)
-        return newType
-
-    def onDataChanged(self, top_left, bottom_right, roles):
-        logger.debug("Got data changed event.  Data = %s, roles=%s", top_left.data(), "|".join(str(x) for x in roles))
-        if top_left == bottom_right and Qt.ItemDataRole.DisplayRole in roles:
-            theType = top_left.data(Qt.ItemDataRole.UserRole)
-            theType.rename(top_left.data())
-            self.treeModel.sort(0, Qt.SortOrder.AscendingOrder)
+        return self.treeModel.addType(name, parentType)
 
     def rename(self):
         logger.debug("Delete menu clicked.")
@@ -244,14 +406,8 @@ class TypesTree(QtCore.QObject):
             raise ValueError("Type name cannot be empty.")
         index: QModelIndex = self.treeWidget.selectedIndexes()[0]
         theType = index.data(Qt.ItemDataRole.UserRole)
-        item: QStandardItem = index.model().itemFromIndex(index)
-        # theType: Type = item.data(Qt.ItemDataRole.UserRole)
         logger.debug("Selected Item %s", theType.name)
-        theType.rename(value)
-        # self.treeModel.beginResetModel()
-        item.setData(value, Qt.ItemDataRole.DisplayRole)
-        self.treeWidget.model().dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
-        self.treeModel.sort(0, Qt.SortOrder.AscendingOrder)
+        self.treeModel.setData(index, value, Qt.ItemDataRole.EditRole)
 
     def delete(self):
         logger.debug("Delete menu clicked.")
@@ -275,18 +431,16 @@ class TypesTree(QtCore.QObject):
         if index is None:
             raise ValueError("Type name cannot be empty.")
         theType: Type = index.data(Qt.ItemDataRole.UserRole)
-        Item: QStandardItem = self.treeModel.itemFromIndex(index)
         #TODO:
-        # Get Type object
         # Get Types Parent
         # Move items to parent
 
-        self.treeWidget.model().removeRow(index.row(), index.parent())
-        self.dbFactory.scheme.delType(theType.recId)
-        self.treeModel.sort(0, Qt.SortOrder.AscendingOrder)
+        self.treeModel.removeType(theType)
+        if theType.parent is not None:
+            self.updateCounts([theType.parent])
 
-        item = self.rootNode.child(0, 0)
-        self.selectItem(item)
+        if self.treeModel.rowCount() > 0:
+            self.selectItem(self.treeModel.index(0, 0))
         self.treeWidget.setFocus()
 
     # def addEventListener(self, name, func):
@@ -309,8 +463,22 @@ class TypesTree(QtCore.QObject):
         else:
             return ""
 
+    def updateCounts(self, types: list):
+        """
+        Repaint parts counters of the types and all their ancestors
+        """
+        done = {}
+        for theType in types:
+            while theType is not None and theType.recId not in done:
+                done[theType.recId] = theType
+                theType = theType.parent
+        self.treeModel.updateTypes(list(done.values()))
+
     def getItemByID(self, theId):
-        return self._scanChilds(theId,self.rootNode)
+        """
+        Model index of the type by its db id, collapsed ancestors are fetched
+        """
+        return self.getIndexByID(theId)
 
     def getIndexByID(self, theId):
         """
@@ -318,22 +486,9 @@ class TypesTree(QtCore.QObject):
         :param theId:
         :return:
         """
-        foundItem = self._scanChilds(theId, self.rootNode)
-        if foundItem is not None:
-            return self.treeWidget.model().indexFromItem(foundItem)
-        return None
-
-    def _scanChilds(self, theId, item: QStandardItem ):
-        for row in range(0, item.rowCount()):
-            childItem = item.child(row,0)
-            theType: Type = childItem.data(Qt.ItemDataRole.UserRole)
-            if theType.recId == theId:
-                logger.debug("Found child Item. Path = %s", theType.path)
-                return childItem
-            elif childItem.hasChildren():
-                foundItem = self._scanChilds(theId, childItem)
-                if foundItem is not None:
-                    return foundItem
-        return None
-
-
+        try:
+            theType = self.dbFactory.getTypeByID(theId)
+        except RuntimeError:
+            return None
+        logger.debug("Found child Item. Path = %s", theType.path)
+        return self.treeModel.indexOf(theType, True)
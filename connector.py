@@ -2,6 +2,11 @@ import os
 import sys
 import sqlite3 # https://docs.python.org/3/library/sqlite3.html
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from sqlite3 import Cursor
 from sqlite3 import Error
 import ElLogger
@@ -34,53 +39,528 @@ class DBSyntax(Exception):
         super().__init__(err_str)
 
 
+STATEMENT_CACHE_SIZE = 256
+
+#
+#   Connection performance profiles. Applied as PRAGMAs at connect time.
+#   cache_size < 0 is size in KiB, mmap_size in bytes, busy_timeout in ms.
+#
+PROFILE_SAFE = "safe"
+PROFILE_BALANCED = "balanced"
+PROFILE_FAST_LOCAL = "fast-local"
+DEFAULT_PROFILE = PROFILE_BALANCED
+
+SQLITE_PROFILES = {
+    # SQLite defaults. Full durability.
+    PROFILE_SAFE: {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    # Fewer fsyncs, bigger cache. Rollback journal without mmap, so still safe on network mounts.
+    PROFILE_BALANCED: {
+        "journal_mode": "TRUNCATE",
+        "synchronous": "NORMAL",
+        "cache_size": -16384,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # WAL and memory mapped IO. Only for catalogs on a local disk.
+    PROFILE_FAST_LOCAL: {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+PRAGMA_CHOICES = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+PRAGMA_INTEGERS = ("cache_size", "mmap_size", "busy_timeout")
+
+
+def buildProfile(settings: dict = None) -> dict:
+    """
+    Make pragmas set from config section. Section key "profile" selects preset,
+    other keys override preset values.
+        db_performance:
+          profile: balanced
+          cache_size: -32768
+    :param settings: config section dict or None
+    :return: dict pragma name -> value
+    """
+    settings = {} if settings is None else settings
+    name = settings.get("profile", DEFAULT_PROFILE)
+    if name not in SQLITE_PROFILES:
+        logger.warning("Unknown DB profile '%s'. Use '%s'.", name, DEFAULT_PROFILE)
+        name = DEFAULT_PROFILE
+    profile = dict(SQLITE_PROFILES[name])
+
+    for key, value in settings.items():
+        if key == "profile":
+            continue
+        if key in PRAGMA_CHOICES:
+            value = str(value).upper()
+            if value not in PRAGMA_CHOICES[key]:
+                logger.warning("Incorrect value '%s' for DB pragma %s. Skip.", value, key)
+                continue
+        elif key in PRAGMA_INTEGERS:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                logger.warning("Incorrect value '%s' for DB pragma %s. Skip.", value, key)
+                continue
+        else:
+            logger.warning("Unknown DB pragma %s. Skip.", key)
+            continue
+        profile[key] = value
+    return profile
+
+
+class StatementRegistry:
+    """
+    Named SQL statements with ? placeholders. Every statement is defined once, so its text
+    is the same on each call and sqlite3 takes the compiled statement from the connection cache
+    instead of parsing and planning it again.
+    The registry mirrors the sqlite3 LRU cache (keyed by statement text) to report the hit rate.
+    Every thread has its own connection and so its own cache mirror.
+    """
+    def __init__(self, cacheSize: int = STATEMENT_CACHE_SIZE):
+        self.cacheSize = cacheSize
+        self.statements = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name: str, sql_str: str):
+        if not sqlite3.complete_statement(sql_str):
+            raise DBSyntax("Statement {}: Incorrect SQL syntax {}".format(name, sql_str))
+        self.statements[name] = sql_str
+
+    def __getitem__(self, name) -> str:
+        return self.statements[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self.statements
+
+    def __len__(self):
+        return len(self.statements)
+
+    def touch(self, sql_str) -> bool:
+        """
+        Account statement execution.
+        :return: True if the compiled statement expected to be taken from the cache
+        """
+        lru = self._lru()
+        if sql_str in lru:
+            lru.move_to_end(sql_str)
+            with self.lock:
+                self.hits += 1
+            return True
+        lru[sql_str] = True
+        if len(lru) > self.cacheSize:
+            lru.popitem(last=False)
+        with self.lock:
+            self.misses += 1
+        return False
+
+    def forget(self):
+        """
+        Drop cache mirror of the current thread, called when its connection closed.
+        """
+        self.local.lru = OrderedDict()
+
+    def _lru(self) -> OrderedDict:
+        lru = getattr(self.local, "lru", None)
+        if lru is None:
+            lru = self.local.lru = OrderedDict()
+        return lru
+
+    def hitRate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {"statements": len(self.statements),
+                "cached": len(self._lru()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hitRate()}
+
+
+#
+#   Statements instrumentation
+#
+DEFAULT_SLOW_MS = 100
+SLOW_LOG_SIZE = 200
+EXPLAIN_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+_LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def statementShape(sql_str: str) -> str:
+    """
+    Statement text with literal values replaced by ?, so the same query with inlined
+    values is counted as one shape.
+    """
+    return _SPACES_RE.sub(" ", _LITERALS_RE.sub("?", sql_str)).strip()
+
+
+class StatementStats:
+    """
+    Per statement shape counters: calls, rows, total and max latency.
+    Statements slower than slowMs go to the slow log, optionally with their query plan.
+    Disabled by default, then connector does not measure anything.
+    Config section:
+        db_instrumentation:
+          enabled: true
+          slow_ms: 100
+          explain: true
+          slow_log: /tmp/elworks_slow.log
+          summary_file: /tmp/elworks_sql_summary.txt
+    """
+    def __init__(self):
+        self.enabled = False
+        self.slowMs = DEFAULT_SLOW_MS
+        self.explain = False
+        self.slowLogFile = None
+        self.summaryFile = None
+        self.lock = threading.Lock()
+        self.shapes = {}     # shape -> [calls, rows, total sec, max sec]
+        self.plans = {}      # shape -> query plan text
+        self.slowLog = deque(maxlen=SLOW_LOG_SIZE)
+
+    def configure(self, settings: dict = None):
+        settings = {} if settings is None else settings
+        self.enabled = bool(settings.get("enabled", False))
+        try:
+            self.slowMs = float(settings.get("slow_ms", DEFAULT_SLOW_MS))
+        except (TypeError, ValueError):
+            logger.warning("Incorrect slow_ms value '%s'. Use %s.", settings.get("slow_ms"), DEFAULT_SLOW_MS)
+            self.slowMs = DEFAULT_SLOW_MS
+        self.explain = bool(settings.get("explain", False))
+        self.slowLogFile = settings.get("slow_log")
+        self.summaryFile = settings.get("summary_file")
+        if self.enabled:
+            logger.info("SQL instrumentation enabled. Slow threshold %s ms, explain %s", self.slowMs, self.explain)
+
+    def reset(self):
+        with self.lock:
+            self.shapes = {}
+            self.plans = {}
+            self.slowLog.clear()
+
+    def record(self, conn, sql_str, values, elapsed: float, rows: int):
+        """
+        Account one statement execution.
+        :param conn: connection, used for EXPLAIN QUERY PLAN of slow statement
+        :param elapsed: seconds
+        :param rows: rows returned or modified, -1 if unknown
+        """
+        shape = statementShape(sql_str)
+        with self.lock:
+            entry = self.shapes.get(shape)
+            if entry is None:
+                entry = self.shapes[shape] = [0, 0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += max(rows, 0)
+            entry[2] += elapsed
+            entry[3] = max(entry[3], elapsed)
+
+        if elapsed * 1000 >= self.slowMs:
+            self._logSlow(conn, shape, sql_str, values, elapsed, rows)
+
+    def _logSlow(self, conn, shape, sql_str, values, elapsed, rows):
+        plan = None
+        if self.explain and sql_str.lstrip().upper().startswith(EXPLAIN_STATEMENTS):
+            plan = self.plans.get(shape)
+            if plan is None:
+                try:
+                    planRows = conn.execute("EXPLAIN QUERY PLAN " + sql_str, values).fetchall()
+                    plan = "; ".join(map(lambda r: str(r[-1]), planRows))
+                except sqlite3.Error as e:
+                    plan = "n/a ({})".format(e)
+                self.plans[shape] = plan
+
+        line = "{:.1f} ms, rows {}: {}".format(elapsed * 1000, rows, shape)
+        if plan is not None:
+            line += " | PLAN: " + plan
+        self.slowLog.append(line)
+        logger.warning("Slow SQL %s", line)
+        if self.slowLogFile:
+            try:
+                with open(self.slowLogFile, "a", encoding="UTF-8") as f:
+                    f.write(time.strftime("%Y-%m-%d %H:%M:%S ") + line + "\n")
+            except OSError as e:
+                logger.error("Cannot write slow SQL log %s: %s", self.slowLogFile, e)
+
+    def summary(self) -> list:
+        """
+        :return: list of (shape, calls, rows, total ms, avg ms, max ms) ordered by total time
+        """
+        with self.lock:
+            items = list(self.shapes.items())
+        result = []
+        for shape, (calls, rows, total, maxTime) in items:
+            result.append((shape, calls, rows, total * 1000, total * 1000 / calls, maxTime * 1000))
+        result.sort(key=lambda r: r[3], reverse=True)
+        return result
+
+    def dump(self):
+        """
+        Write summary to the log and to summary_file if configured. Called on application exit.
+        """
+        if not self.enabled:
+            return
+        lines = ["{:>10} {:>8} {:>10} {:>10} {:>10}  {}".format(
+            "total ms", "calls", "rows", "avg ms", "max ms", "statement")]
+        for shape, calls, rows, total, avg, maxTime in self.summary():
+            lines.append("{:>10.1f} {:>8} {:>10} {:>10.2f} {:>10.2f}  {}".format(total, calls, rows, avg, maxTime, shape))
+        text = "\n".join(lines)
+        logger.info("SQL statements summary:\n%s", text)
+        if self.summaryFile:
+            try:
+                with open(self.summaryFile, "w", encoding="UTF-8") as f:
+                    f.write(text + "\n")
+            except OSError as e:
+                logger.error("Cannot write SQL summary %s: %s", self.summaryFile, e)
+
+
+STATS = StatementStats()
+
+
+class ProfiledCursor:
+    """
+    Cursor wrapper for instrumented selects. Counts fetched rows and fetch time,
+    statement is accounted when the cursor exhausted or closed.
+    """
+    def __init__(self, cursor: Cursor, conn, sql_str, values, elapsed: float):
+        self.cursor = cursor
+        self.conn = conn
+        self.sql_str = sql_str
+        self.values = values
+        self.elapsed = elapsed
+        self.rows = 0
+        self.done = False
+
+    def _fetch(self, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.elapsed += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self.cursor.fetchone)
+        if row is None:
+            self._record()
+        else:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(self.cursor.fetchmany, size if size is not None else self.cursor.arraysize)
+        self.rows += len(rows)
+        if len(rows) == 0:
+            self._record()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self.cursor.fetchall)
+        self.rows += len(rows)
+        self._record()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._record()
+        self.cursor.close()
+
+    def __del__(self):
+        self._record()
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def _record(self):
+        if not self.done:
+            self.done = True
+            STATS.record(self.conn, self.sql_str, self.values, self.elapsed, self.rows)
+
+
 class SQLiteConnector:
-    def __init__(self, db_path: str, create: bool = True):
+    """
+    Connection manager. Every thread works with its own sqlite3 connection, opened on first use
+    with the same performance profile, so the connector may be shared between the GUI thread
+    and QThreadPool workers. Transaction scope is also per thread.
+    Concurrent writers are serialized by SQLite locking, waiting up to busy_timeout.
+    """
+    def __init__(self, db_path: str, create: bool = True, profile: dict = None):
         self.dbPath = db_path
-        self.conn = None
+        self.profile = buildProfile() if profile is None else profile
+        self.statements = StatementRegistry()
+        self.local = threading.local()
+        self.connections = {}       # thread id -> connection, for closing all on disconnect
+        self.lock = threading.Lock()
+        self.connected = False
         # self.connect(False)
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        Connection of the current thread. Opened on first access after connect().
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            if not self.connected:
+                return None
+            conn = self._open()
+        return conn
+
+    @property
+    def txLevel(self) -> int:
+        # Nesting level of the open transaction scope in the current thread. 0 - autocommit mode
+        return getattr(self.local, "txLevel", 0)
+
+    @txLevel.setter
+    def txLevel(self, value: int):
+        self.local.txLevel = value
+
     def connect(self):
         if self.isConnect():
             return self.conn
-        self.conn = sqlite3.connect(self.dbPath)
-        logger.debug("Connect DB : %s", self.dbPath)
+        self.connected = True
+        return self.conn
+
+    def _open(self) -> sqlite3.Connection:
+        # check_same_thread is off only to allow disconnect() close connections of other threads.
+        # Each connection used just by its own thread through self.local.
+        conn = sqlite3.connect(self.dbPath, cached_statements=self.statements.cacheSize, check_same_thread=False)
+        self.local.conn = conn
+        self.local.txLevel = 0
+        self.statements.forget()
+        with self.lock:
+            self.connections[threading.get_ident()] = conn
+        logger.debug("Connect DB : %s, thread %s", self.dbPath, threading.current_thread().name)
+        self.applyProfile()
+        return conn
+
+    def closeThreadConnection(self):
+        """
+        Close connection of the current thread, for short living workers when finish DB work.
+        The parts loader worker keeps its connection open, disconnect() closes it.
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            with self.lock:
+                self.connections.pop(threading.get_ident(), None)
+            self.local.conn = None
+            self.local.txLevel = 0
+            conn.close()
         # sqlite3.connect(database, timeout=5.0, detect_types=0, isolation_level='DEFERRED', check_same_thread=True,
         #                factory=sqlite3.Connection, cached_statements=128, uri=False, *,
         #                autocommit=sqlite3.LEGACY_TRANSACTION_CONTROL)¶
 
+    def applyProfile(self):
+        """
+        Set connection pragmas from the performance profile and log effective values.
+        Values are validated by buildProfile, so it safe to put them into the statement.
+        """
+        # busy_timeout goes first, other pragmas may wait for a lock
+        for name, value in sorted(self.profile.items(), key=lambda item: item[0] != "busy_timeout"):
+            try:
+                self.conn.execute("PRAGMA " + name + " = " + str(value) + ";").fetchall()
+            except sqlite3.DatabaseError as e:
+                logger.warning("Cannot set pragma %s=%s: %s", name, value, e)
+        logger.info("DB %s pragmas: %s", self.dbPath, ", ".join(
+            map(lambda item: "{}={}".format(item[0], item[1]), self.getPragmas().items())))
+
+    def getPragmas(self) -> dict:
+        """
+        Read effective values of profile pragmas
+        """
+        result = {}
+        for name in self.profile.keys():
+            row = self.conn.execute("PRAGMA " + name + ";").fetchone()
+            result[name] = row[0] if row is not None else None
+        return result
+
+    def hasTable(self, name: str) -> bool:
+        curr = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", [name])
+        return curr.fetchone() is not None
+
+    def hasCompileOption(self, option: str) -> bool:
+        curr = self.conn.execute("SELECT sqlite_compileoption_used(?);", [option])
+        return bool(curr.fetchone()[0])
+
     def isConnect(self):
-        return True if self.conn is not None else False
+        return self.connected
 
     def disconnect(self):
         logger.debug("SQLite close connection")
-        self.conn.close()
+        logger.debug("SQLite statements cache: %s", self.statements.stats())
+        self.connected = False
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections = {}
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
 
-    def select_all(self, sql_str):
+    def select_all(self, sql_str, values=()):
         if sqlite3.complete_statement(sql_str):
             logger.debug("SQLite execute: %s", sql_str)
+            self.statements.touch(sql_str)
             cur = self.conn.cursor()
-            cur.execute(sql_str)
+            if STATS.enabled:
+                started = time.perf_counter()
+                cur.execute(sql_str, values)
+                rows = cur.fetchall()
+                STATS.record(self.conn, sql_str, values, time.perf_counter() - started, len(rows))
+                return rows
+            cur.execute(sql_str, values)
             return cur.fetchall()
         else:
             raise DBSyntax("SQLite select_all: Incorrect SQL syntax {}".format(sql_str))
 
-    def select(self, sql_str) -> Cursor:
+    def select(self, sql_str, values=()) -> Cursor:
         if sqlite3.complete_statement(sql_str):
             logger.debug("SQLite select: %s", sql_str)
+            self.statements.touch(sql_str)
             cur = self.conn.cursor()
-            cur.execute(sql_str)
+            if STATS.enabled:
+                started = time.perf_counter()
+                cur.execute(sql_str, values)
+                return ProfiledCursor(cur, self.conn, sql_str, values, time.perf_counter() - started)
+            cur.execute(sql_str, values)
             return cur
         else:
             raise DBSyntax("SQLite get: Incorrect SQL syntax {}".format(sql_str))
 
-    def exec(self, sql_str) -> int:
+    def exec(self, sql_str, values=()) -> int:
         if sqlite3.complete_statement(sql_str):
             try:
                 logger.debug("SQLite execute: %s", sql_str)
-                curr = self.conn.execute(sql_str)
+                self.statements.touch(sql_str)
+                curr = self._execute(sql_str, values)
                 recId = curr.lastrowid
-                self.conn.commit()
+                self._autocommit()
             except sqlite3.OperationalError as e:
                 # raise sqlite3.OperationalError
                 raise DBSyntax("SQLite OperationalError: {} >>> SQL:{}".format(e, sql_str))
@@ -91,10 +571,11 @@ class SQLiteConnector:
     def exec_insert(self, sql_str, values) -> int:
         if sqlite3.complete_statement(sql_str):
             try:
-                logger.debug("SQLite execute: %s, values:%s", sql_str, ", ".join(map(str, values)))
-                curr = self.conn.execute(sql_str, values)
+                logger.debug("SQLite execute: %s, values:%s", sql_str, values)
+                self.statements.touch(sql_str)
+                curr = self._execute(sql_str, values)
                 recId = curr.lastrowid
-                self.conn.commit()
+                self._autocommit()
                 return recId
 
             except sqlite3.OperationalError as e:
@@ -103,7 +584,129 @@ class SQLiteConnector:
         else:
             raise DBSyntax("SQLite get: Incorrect SQL syntax {}".format(sql_str))
 
+    def exec_returning(self, sql_str, values) -> tuple:
+        """
+        Execute a write statement with RETURNING clause.
+        :return: first returned row, None if there are no rows
+        """
+        if sqlite3.complete_statement(sql_str):
+            try:
+                logger.debug("SQLite execute: %s, values:%s", sql_str, values)
+                self.statements.touch(sql_str)
+                curr = self._execute(sql_str, values)
+                row = curr.fetchone()
+                curr.close()
+                self._autocommit()
+                return row
+            except sqlite3.OperationalError as e:
+                raise DBSyntax("SQLite OperationalError: {} >>> SQL:{}".format(e, sql_str))
+        else:
+            raise DBSyntax("SQLite get: Incorrect SQL syntax {}".format(sql_str))
+
+    def exec_many(self, sql_str, rows) -> int:
+        """
+        Execute one statement for each values row with executemany.
+        :param sql_str: statement with ? placeholders
+        :param rows: iterable of values sequences
+        :return: count of modified rows
+        """
+        if sqlite3.complete_statement(sql_str):
+            try:
+                logger.debug("SQLite execute many: %s", sql_str)
+                self.statements.touch(sql_str)
+                if STATS.enabled:
+                    rows = list(rows)
+                    started = time.perf_counter()
+                    curr = self.conn.executemany(sql_str, rows)
+                    STATS.record(self.conn, sql_str, rows[0] if len(rows) > 0 else (),
+                                 time.perf_counter() - started, curr.rowcount)
+                else:
+                    curr = self.conn.executemany(sql_str, rows)
+                self._autocommit()
+                return curr.rowcount
+            except sqlite3.OperationalError as e:
+                raise DBSyntax("SQLite OperationalError: {} >>> SQL:{}".format(e, sql_str))
+        else:
+            raise DBSyntax("SQLite get: Incorrect SQL syntax {}".format(sql_str))
+
+    def _execute(self, sql_str, values) -> Cursor:
+        if not STATS.enabled:
+            return self.conn.execute(sql_str, values)
+        started = time.perf_counter()
+        curr = self.conn.execute(sql_str, values)
+        STATS.record(self.conn, sql_str, values, time.perf_counter() - started, curr.rowcount)
+        return curr
+
+    def inTransaction(self) -> bool:
+        return self.txLevel > 0
+
+    def begin(self):
+        """
+        Open transaction scope. A nested scope is a savepoint of the already opened transaction.
+        Until the outermost scope is committed, writes are not committed.
+        The write lock is taken at once (BEGIN IMMEDIATE), so a scope started as a read
+        is never refused the lock upgrade by a concurrent writer.
+        """
+        if not self.isConnect():
+            raise DBError("SQLite begin: DB not connected.")
+        if self.txLevel > 0:
+            self.conn.execute("SAVEPOINT " + self._savepoint(self.txLevel))
+        elif not self.conn.in_transaction:
+            logger.debug("SQLite begin transaction")
+            self.conn.execute("BEGIN IMMEDIATE")
+        self.txLevel += 1
+
+    def _savepoint(self, level: int) -> str:
+        return "tx_level_" + str(level)
+
     def commit(self):
+        """
+        Close one level of the transaction scope. Changes are committed when the outermost level is closed
+        or when called outside any transaction scope.
+        """
         if self.isConnect():
+            if self.txLevel > 1:
+                self.txLevel -= 1
+                self.conn.execute("RELEASE " + self._savepoint(self.txLevel))
+                return
+            self.txLevel = 0
             self.conn.commit()
 
+    def rollback(self):
+        """
+        Drop writes of the current transaction scope. A nested scope is rolled back to its savepoint,
+        the enclosing scopes go on. The outermost scope rolls back the whole transaction.
+        """
+        if self.isConnect():
+            if self.txLevel > 1:
+                self.txLevel -= 1
+                logger.debug("SQLite rollback to savepoint, level %s", self.txLevel)
+                savepoint = self._savepoint(self.txLevel)
+                self.conn.execute("ROLLBACK TO " + savepoint)
+                self.conn.execute("RELEASE " + savepoint)
+                return
+            logger.debug("SQLite rollback transaction")
+            self.txLevel = 0
+            self.conn.rollback()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Transaction scope. Commit on exit, rollback when exception raised.
+
+            with db.transaction():
+                db.exec_insert(...)
+                db.exec_insert(...)
+        """
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            self.commit()
+
+    def _autocommit(self):
+        if self.txLevel == 0:
+            self.conn.commit()
@@ -4,4 +4,6 @@ STARTUP_MODE_PROJECTS = "P"
 CONFIG_DB_FILE = "db_file"
 CONFIG_STARTUP_MODE = "startup_mode"
 LOG_LEVEL = "log_level"
-LOG_FILE = "log_file"
\ No newline at end of file
+LOG_FILE = "log_file"
+DB_PROFILE_SECTION = "db_performance"
+DB_INSTRUMENTATION_SECTION = "db_instrumentation"
@@ -9,6 +9,7 @@ from PyQt6.QtWidgets import QApplication
 
 import ElDBScheme
 import ElLogger
+import connector
 import constants
 from ElConfig import ElConfig
 from ElDBScheme import DBScheme, DBFactory
@@ -109,18 +110,20 @@ def main():
                 break
 
     ElConfig.CONFIG_OBJECT = config
+    connector.STATS.configure(config.get_section(constants.DB_INSTRUMENTATION_SECTION))
+    dbProfile = connector.buildProfile(config.get_section(constants.DB_PROFILE_SECTION))
 
     if db_file:
-        factory = DBFactory(db_file)
+        factory = DBFactory(db_file, dbProfile)
         config.set_value(constants.CONFIG_DB_FILE, factory.db_file)
     elif config.has_value(constants.CONFIG_DB_FILE):
         db_file = config.get_value(constants.CONFIG_DB_FILE)
-        factory = DBFactory(db_file)
+        factory = DBFactory(db_file, dbProfile)
     else:
         for fpath in resources_path_list:
             db_file = os.path.join(fpath, prog_name + ".sqlite")
             if os.path.isfile(db_file):
-                factory = DBFactory(db_file)
+                factory = DBFactory(db_file, dbProfile)
                 config.set_value(constants.CONFIG_DB_FILE, factory.db_file)
                 break
 
@@ -172,6 +175,7 @@ def main():
         # return None
     finally:
         logger.info("Close DB Connection.")
+        connector.STATS.dump()
         factory.disconnect()
         config.set_value(constants.CONFIG_STARTUP_MODE, startupMode)
         config.save(config_file)
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connector
+import ElDBScheme
+
+
+@pytest.fixture
+def dbPath(tmp_path):
+    return str(tmp_path / "catalog.sqlite")
+
+
+@pytest.fixture
+def db(dbPath):
+    conn = connector.SQLiteConnector(dbPath)
+    conn.connect()
+    conn.exec("CREATE TABLE T (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT);")
+    yield conn
+    conn.disconnect()
+
+
+@pytest.fixture
+def factory(dbPath):
+    theFactory = ElDBScheme.DBFactory(dbPath)
+    theFactory.getRootTypes()
+    yield theFactory
+    theFactory.disconnect()
@@ -0,0 +1,225 @@
+import threading
+
+import pytest
+
+import connector
+
+
+def count(db) -> int:
+    return db.select_all("SELECT count(*) FROM T;")[0][0]
+
+
+def test_transaction_commits_once_on_exit(db):
+    with db.transaction():
+        db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+        assert db.inTransaction()
+        db.exec("INSERT INTO T (name) VALUES (?);", ["b"])
+    assert not db.inTransaction()
+    assert count(db) == 2
+
+
+def test_nested_transaction_is_part_of_outer(db):
+    with db.transaction():
+        with db.transaction():
+            db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+        assert db.txLevel == 1
+        assert db.conn.in_transaction
+    assert db.txLevel == 0
+    assert count(db) == 1
+
+
+def test_rollback_drops_nested_writes(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+            with db.transaction():
+                db.exec("INSERT INTO T (name) VALUES (?);", ["b"])
+                raise RuntimeError("fail")
+    assert db.txLevel == 0
+    assert count(db) == 0
+
+
+def test_caught_inner_failure_keeps_outer_scope(db):
+    with db.transaction():
+        db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.exec("INSERT INTO T (name) VALUES (?);", ["b"])
+                raise RuntimeError("fail")
+        assert db.txLevel == 1
+        db.exec("INSERT INTO T (name) VALUES (?);", ["c"])
+    names = [row[0] for row in db.select_all("SELECT name FROM T ORDER BY name;")]
+    assert names == ["a", "c"]
+
+
+def test_outer_failure_after_caught_inner_failure(db):
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+            with pytest.raises(RuntimeError):
+                with db.transaction():
+                    raise RuntimeError("fail")
+            # Written after the inner failure, still in the outer transaction
+            db.exec("INSERT INTO T (name) VALUES (?);", ["c"])
+            raise ValueError("outer fail")
+    assert db.txLevel == 0
+    assert count(db) == 0
+
+
+def test_exec_many(db):
+    assert db.exec_many("INSERT INTO T (name) VALUES (?);", [["a"], ["b"], ["c"]]) == 3
+    assert count(db) == 3
+
+
+def test_incomplete_statement_rejected(db):
+    with pytest.raises(connector.DBSyntax):
+        db.exec("INSERT INTO T (name) VALUES (?)", ["a"])
+
+
+def test_thread_has_own_connection(db):
+    seen = {}
+    written, done = threading.Event(), threading.Event()
+
+    def worker():
+        with db.transaction():
+            db.exec("INSERT INTO T (name) VALUES (?);", ["w"])
+            seen["txLevel"] = db.txLevel
+            seen["conn"] = db.conn
+            written.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    written.wait(5)
+    # The worker scope is not the scope of this thread
+    assert seen["txLevel"] == 1
+    assert db.txLevel == 0
+    assert seen["conn"] is not db.conn
+    done.set()
+    thread.join()
+    assert count(db) == 1
+    assert len(db.connections) == 2
+    db.disconnect()
+    assert db.connections == {}
+
+
+def test_profile_overrides_checked():
+    profile = connector.buildProfile({"profile": connector.PROFILE_FAST_LOCAL, "synchronous": "full",
+                                      "cache_size": "-1000", "mmap_size": "big", "journal_mode": "NONE",
+                                      "page_size": 8192})
+    expected = dict(connector.SQLITE_PROFILES[connector.PROFILE_FAST_LOCAL], synchronous="FULL", cache_size=-1000)
+    assert profile == expected
+    assert connector.buildProfile({"profile": "unknown"}) == connector.SQLITE_PROFILES[connector.DEFAULT_PROFILE]
+
+
+def test_profile_applied_to_connection(dbPath):
+    profile = connector.buildProfile({"profile": connector.PROFILE_FAST_LOCAL, "cache_size": -2000})
+    db = connector.SQLiteConnector(dbPath, profile=profile)
+    db.connect()
+    pragmas = db.getPragmas()
+    db.disconnect()
+    assert pragmas["journal_mode"] == "wal"
+    assert pragmas["cache_size"] == -2000
+    assert pragmas["busy_timeout"] == 5000
+
+
+@pytest.fixture
+def stats(tmp_path):
+    connector.STATS.configure({"enabled": True, "slow_ms": 10000, "explain": True,
+                               "slow_log": str(tmp_path / "slow.log"),
+                               "summary_file": str(tmp_path / "summary.txt")})
+    connector.STATS.reset()
+    yield connector.STATS
+    connector.STATS.configure()
+    connector.STATS.reset()
+
+
+def test_statement_shape_hides_literals():
+    shape = connector.statementShape("SELECT *  FROM T2 WHERE id = 12 AND name = 'it''s'\n AND price > 1.5;")
+    assert shape == "SELECT * FROM T2 WHERE id = ? AND name = ? AND price > ?;"
+    assert connector.statementShape("SELECT * FROM T2 WHERE id = 7 AND name = '' AND price > 3;") == shape
+
+
+def test_stats_accumulate_per_shape(db, stats):
+    db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+    db.select_all("SELECT name FROM T WHERE id > 0;")
+    db.select_all("SELECT name FROM T WHERE id > 5;")
+    db.exec("INSERT INTO T (name) VALUES (?);", ["b"])
+    curr = db.select("SELECT name FROM T;")
+    assert isinstance(curr, connector.ProfiledCursor)
+    assert len(list(curr)) == 2
+    curr.close()
+    summary = {shape: (calls, rows, total, maxTime) for shape, calls, rows, total, avg, maxTime in stats.summary()}
+    assert summary["SELECT name FROM T WHERE id > ?;"][:2] == (2, 1)
+    assert summary["INSERT INTO T (name) VALUES (?);"][:2] == (2, 2)
+    # cursor is accounted once, when exhausted
+    assert summary["SELECT name FROM T;"][:2] == (1, 2)
+    for calls, rows, total, maxTime in summary.values():
+        assert total >= maxTime > 0
+    assert len(stats.slowLog) == 0
+
+
+def test_slow_statement_logged_with_plan(db, stats, tmp_path):
+    stats.slowMs = 0
+    db.select_all("SELECT name FROM T WHERE id = 1;")
+    assert len(stats.slowLog) == 1
+    line = stats.slowLog[-1]
+    assert "SELECT name FROM T WHERE id = ?;" in line
+    assert "PLAN: SEARCH T USING INTEGER PRIMARY KEY" in line
+    assert line in (tmp_path / "slow.log").read_text()
+
+
+def test_dump_writes_summary(db, stats, tmp_path):
+    db.exec("INSERT INTO T (name) VALUES (?);", ["a"])
+    for i in range(3):
+        db.select_all("SELECT name FROM T WHERE id = {};".format(i))
+    stats.dump()
+    lines = (tmp_path / "summary.txt").read_text().splitlines()
+    assert lines[0].split() == ["total", "ms", "calls", "rows", "avg", "ms", "max", "ms", "statement"]
+    assert len(lines) == 3
+    select = [line for line in lines if line.endswith("SELECT name FROM T WHERE id = ?;")]
+    assert select[0].split()[1:3] == ["3", "1"]
+
+
+def test_nothing_recorded_when_disabled(db, tmp_path):
+    connector.STATS.reset()
+    curr = db.select("SELECT name FROM T;")
+    assert not isinstance(curr, connector.ProfiledCursor)
+    curr.fetchall()
+    db.exec("INSERT INTO T (name) VALUES (?);", ["b"])
+    assert connector.STATS.summary() == []
+    connector.STATS.summaryFile = str(tmp_path / "summary.txt")
+    connector.STATS.dump()
+    connector.STATS.summaryFile = None
+    assert not (tmp_path / "summary.txt").exists()
+
+
+def test_statement_registry_mirrors_lru(dbPath):
+    db = connector.SQLiteConnector(dbPath)
+    db.statements = connector.StatementRegistry(3)
+    db.connect()
+    db.exec("CREATE TABLE T (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT);")
+    db.statements.register("byId", "SELECT name FROM T WHERE id = ?;")
+    with pytest.raises(connector.DBSyntax):
+        db.statements.register("broken", "SELECT name FROM T WHERE id = ?")
+    # the CREATE TABLE miss
+    assert (db.statements.hits, db.statements.misses) == (0, 1)
+
+    queries = {name: "SELECT {} FROM T;".format(name) for name in ("id", "name", "id, name", "name, id")}
+    for name in ("id", "name", "id, name", "id", "name, id", "name", "id"):
+        db.select_all(queries[name])
+    # "name" was dropped by "name, id" as least recently used, "id" was kept by its repeat
+    assert db.statements.stats()["hits"] == 2
+    assert db.statements.stats()["misses"] == 6
+    assert db.statements.stats()["cached"] == 3
+
+    for _ in range(10):
+        db.select_all(db.statements["byId"], [1])
+    assert db.statements.hitRate() == 11 / 18
+
+    # Other thread has its own connection and statement cache
+    thread = threading.Thread(target=lambda: db.select_all(queries["id"]))
+    thread.start()
+    thread.join()
+    assert db.statements.stats()["misses"] == 8
+    db.disconnect()
@@ -0,0 +1,76 @@
+import ElDBScheme
+
+
+def oldCatalog(dbPath):
+    """
+    Catalog file as made before versioned migrations, user_version 0
+    """
+    scheme = ElDBScheme.DBScheme(dbPath)
+    scheme.connect()
+    scheme.createTables()
+    db = scheme.db
+    topId = db.exec_insert("INSERT INTO TYPES (name, path, parent_id) VALUES (?, ?, ?);", ["Top", "Top", 0])
+    subId = db.exec_insert("INSERT INTO TYPES (name, path, parent_id) VALUES (?, ?, ?);", ["Sub", "Top Sub", topId])
+    db.exec_many("INSERT INTO PARTS (type_id, part_num, description) VALUES (?, ?, ?);",
+                 [[topId, "LM358", "dual opamp"], [subId, "NE555", "timer"], [subId, "BC547", "npn transistor"]])
+    scheme.disconnect()
+    return topId, subId
+
+
+def test_new_catalog_at_current_version(factory):
+    assert factory.scheme.getVersion() == ElDBScheme.SCHEME_VERSION
+    for table in ("TYPES_TREE", "TYPES_COUNTS", "idx_parts_type_partnum", "idx_parts_type_price"):
+        assert factory.scheme.db.hasTable(table)
+
+
+def test_old_catalog_migrated_with_data(dbPath):
+    topId, subId = oldCatalog(dbPath)
+    factory = ElDBScheme.DBFactory(dbPath)
+    assert factory.scheme.getVersion() == ElDBScheme.SCHEME_VERSION
+    assert factory.scheme.isSubtype(topId, subId)
+    assert not factory.scheme.isSubtype(subId, topId)
+    assert factory.scheme.countPartsBySubtree(topId) == 3
+    assert factory.scheme.countPartsByType(subId) == 2
+    assert [row[2] for row in factory.scheme.partSearch("time")] == ["NE555"]
+    factory.disconnect()
+
+
+def test_settings_names_made_unique(dbPath):
+    topId, subId = oldCatalog(dbPath)
+    scheme = ElDBScheme.DBScheme(dbPath)
+    scheme.connect()
+    scheme.db.exec_many("INSERT INTO ENVIRONMENT (name, value) VALUES (?, ?);",
+                        [["parts_sort." + str(topId), "part_num"], ["parts_sort." + str(topId), "-value"],
+                         ["parts_sort.999", "price"], ["parts_sort_999", "kept"]])
+    scheme.disconnect()
+
+    factory = ElDBScheme.DBFactory(dbPath)
+    assert factory.scheme.db.select_all("SELECT name, value FROM ENVIRONMENT ORDER BY id;") == \
+           [("parts_sort." + str(topId), "-value"), ("parts_sort_999", "kept")]
+    factory.scheme.setEnv("parts_sort_999", "changed")
+    assert factory.scheme.getEnv("parts_sort_999") == "changed"
+    assert len(factory.scheme.db.select_all("SELECT * FROM ENVIRONMENT;")) == 2
+    factory.disconnect()
+
+
+def test_migrations_not_repeated(factory, dbPath):
+    factory.disconnect()
+    reopened = ElDBScheme.DBFactory(dbPath)
+    assert reopened.scheme.migrate() == ElDBScheme.SCHEME_VERSION
+    reopened.disconnect()
+
+
+def test_missing_fts_index_made_at_startup(factory, dbPath):
+    top = factory.appendType("Top", None)
+    factory.createPart(top, {"part_num": "NE555", "description": "timer"})
+    # as left by the migration run with SQLite without FTS5
+    db = factory.scheme.db
+    for trigger in ("parts_fts_insert", "parts_fts_delete", "parts_fts_update"):
+        db.exec("DROP TRIGGER " + trigger + ";")
+    db.exec("DROP TABLE " + ElDBScheme.PARTS_FTS_TABLE_NAME + ";")
+    factory.disconnect()
+
+    reopened = ElDBScheme.DBFactory(dbPath)
+    assert reopened.scheme.ftsEnabled
+    assert [thePart["part_num"] for thePart in reopened.search("tim")] == ["NE555"]
+    reopened.disconnect()
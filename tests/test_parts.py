@@ -0,0 +1,246 @@
+import pytest
+
+import ElDBScheme
+
+
+@pytest.fixture
+def top(factory):
+    return factory.appendType("Top", None)
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_create_part_gets_stored_row(factory, top, monkeypatch, returning):
+    monkeypatch.setattr(ElDBScheme, "RETURNING_SUPPORTED", returning)
+    thePart = factory.createPart(top, {"part_num": "R1", "quantity": "7", "present": True})
+    assert thePart.id > 0
+    assert thePart["type_id"] == top.recId
+    # values as stored, with column affinity applied
+    assert thePart["quantity"] == 7
+    assert thePart["present"] == 1
+    assert thePart["description"] is None
+    assert top.partsCount == 1
+
+
+def test_parts_cache_identity(factory, top):
+    created = factory.createPart(top, {"part_num": "R1", "description": "res"})
+    typeView = factory.loadPartsByType(top)
+    search = factory.search("R1")
+    thePart = search[0]
+    assert thePart is created
+    assert thePart is factory.loadElementById(created.id)
+    assert thePart is typeView.getByID(created.id)
+
+    # edit through one view is seen by the other lists
+    thePart["local_location"] = "Box"
+    assert typeView.value(typeView.rowOf(thePart.id), "local_location") == "Box"
+    factory.updateParts({thePart.id: {"package": "0603"}})
+    assert thePart["package"] == "0603"
+    assert search.value(0, "package") == "0603"
+
+
+def test_parts_cache_bound_keeps_unsaved(factory, top):
+    factory.cache.size = 10
+    with factory.transaction():
+        for i in range(30):
+            factory.createPart(top, {"part_num": "P%02d" % i})
+    assert len(factory.cache) == 10
+    parts = factory.loadPartsByType(top)
+    unsaved = parts[0]
+    unsaved["shop"] = "X"
+    for thePart in parts:
+        pass
+    assert unsaved.id in factory.cache
+    unsaved.save()
+    factory.deleteParts([unsaved.id])
+    assert unsaved.id not in factory.cache
+
+
+def test_read_rows_show_unsaved_values(factory, top):
+    thePart = factory.createPart(top, {"part_num": "R1", "shop": "A"})
+    thePart["shop"] = "B"
+    parts = factory.loadPartsByType(top)
+    assert parts.value(0, "shop") == "B"
+    assert parts[0] is thePart
+    thePart.save()
+    assert factory.loadPartsByType(top).value(0, "shop") == "B"
+
+
+def test_search_falls_back_to_substring(factory, top):
+    with factory.transaction():
+        for partNum, description in (("LM358", "dual opamp"), ("LM3580", "opamp"), ("NE555", "timer")):
+            factory.createPart(top, {"part_num": partNum, "description": description})
+    assert sorted(thePart["part_num"] for thePart in factory.search("LM358")) == ["LM358", "LM3580"]
+    assert sorted(thePart["part_num"] for thePart in factory.search("amp")) == ["LM358", "LM3580"]
+    assert sorted(thePart["part_num"] for thePart in factory.search("358")) == ["LM358", "LM3580"]
+    assert len(factory.search(" ")) == 3
+    assert len(factory.search("")) == 3
+
+
+def test_sort_order_text():
+    order = ElDBScheme.parseSortOrder("part_num, -quantity,no_such_field")
+    assert order == [("part_num", False), ("quantity", True)]
+    assert ElDBScheme.formatSortOrder(order) == "part_num,-quantity"
+    assert ElDBScheme.parseSortOrder("") == []
+
+
+def test_click_sort_order():
+    order = [("part_num", False)]
+    assert ElDBScheme.clickSortOrder(order, "value", True) == [("value", True)]
+    order = ElDBScheme.clickSortOrder(order, "value", True, addKey=True)
+    assert order == [("part_num", False), ("value", True)]
+    assert ElDBScheme.clickSortOrder(order, "part_num", True, addKey=True) == [("part_num", True), ("value", True)]
+
+
+def test_parse_tsv():
+    text = 'R1\t"10k, 1%"\t"line 1\nline 2"\r\nR2\t""\t"say ""hi"""\n\n'
+    assert ElDBScheme.parseTsv(text) == [["R1", "10k, 1%", "line 1\nline 2"], ["R2", "", 'say "hi"']]
+    assert ElDBScheme.parseTsv("") == []
+
+
+def test_convert_cell_values():
+    assert ElDBScheme.convertValue("INTEGER", " 12 ") == 12
+    assert ElDBScheme.convertValue("INTEGER", "") == 0
+    assert ElDBScheme.convertValue("REAL", "4,7") == 4.7
+    assert ElDBScheme.convertValue("TEXT", " 0603 ") == " 0603 "
+    assert ElDBScheme.convertValue("INTEGER", 5) == 5
+    for text in ("Yes", "x", "+", "TRUE"):
+        assert ElDBScheme.convertValue("BOOLEAN", text) is True
+    for text in ("", "No", "-", "0"):
+        assert ElDBScheme.convertValue("BOOLEAN", text) is False
+    for fieldType, text in (("INTEGER", "1.5"), ("INTEGER", "ten"), ("REAL", "1k"), ("BOOLEAN", "maybe")):
+        with pytest.raises(ValueError):
+            ElDBScheme.convertValue(fieldType, text)
+
+
+def test_sort_order_saved_per_type(factory, top, dbPath):
+    other = factory.appendType("Other", None)
+    factory.setSortOrder(top, [("value", True), ("part_num", False)])
+    factory.disconnect()
+
+    reopened = ElDBScheme.DBFactory(dbPath)
+    reopened.getRootTypes()
+    assert reopened.getSortOrder(reopened.getTypeByPath("Top")) == [("value", True), ("part_num", False)]
+    assert reopened.getSortOrder(reopened.getTypeByPath("Other")) == []
+    reopened.disconnect()
+
+
+def test_parts_sort_by_typed_keys(factory, top):
+    for partNum, quantity in (("B", "10"), ("A", 2), ("C", None), ("A", "1,5"), ("D", "many")):
+        factory.createPart(top, {"part_num": partNum, "quantity": quantity})
+    parts = factory.loadPartsByType(top)
+
+    parts.sortBy([("quantity", False)])
+    assert [parts.value(row, "quantity") for row in range(len(parts))] == [None, "1,5", 2, 10, "many"]
+
+    parts.sortBy([("part_num", True), ("quantity", True)])
+    assert [(parts.value(row, "part_num"), parts.value(row, "quantity")) for row in range(len(parts))] == \
+        [("D", "many"), ("C", None), ("B", 10), ("A", 2), ("A", "1,5")]
+
+
+def test_save_writes_changed_fields_only(factory, top):
+    thePart = factory.createPart(top, {"part_num": "R1", "package": "0603"})
+    # Written by another view after the part was loaded
+    factory.scheme.db.exec("UPDATE PARTS SET description = ? WHERE id = ?;", ["other", thePart.id])
+
+    thePart["package"] = "0603"
+    assert not thePart.changed
+    thePart["package"] = "0805"
+    thePart["present"] = True
+    assert thePart.dirty == {"package", "present"}
+    thePart.save()
+
+    assert not thePart.changed and thePart.dirty == set()
+    stored = dict(zip(ElDBScheme.ELEMENT_FLD_NAMES, factory.scheme.loadPart(thePart.id)))
+    assert (stored["package"], stored["present"], stored["description"]) == ("0805", 1, "other")
+
+
+def test_set_checks_field_type(factory, top):
+    thePart = factory.createPart(top, {"part_num": "R1"})
+    with pytest.raises(ValueError):
+        thePart["quantity"] = "7"
+    assert not thePart.changed
+
+
+def test_bulk_move_and_delete(factory, top):
+    sub = factory.appendType("Sub", top)
+    other = factory.appendType("Other", None)
+    ids = [factory.createPart(theType, {"part_num": "P"}).id for theType in (top, sub, sub, other)]
+    kept = factory.loadElementById(ids[1])
+
+    changed = factory.moveParts(ids[:3], other)
+    assert all(theType in changed for theType in (top, sub, other))
+    assert (top.subtreeCount, sub.subtreeCount, other.subtreeCount) == (0, 0, 4)
+    assert kept["type_id"] == other.recId
+    assert factory.countParts(other) == 4
+
+    changed = factory.deleteParts(ids[1:])
+    assert other in changed
+    assert other.subtreeCount == 1 == factory.countParts(other)
+    assert factory.scheme.db.select_all("SELECT id FROM PARTS;") == [(ids[0],)]
+    assert kept.id not in factory.cache
+
+
+def test_create_parts_in_bulk(factory, top):
+    sub = factory.appendType("Sub", top)
+    count = factory.createParts(sub, [{"part_num": "P%d" % i, "type_id": -1, "quantity": i} for i in range(5)])
+    assert count == 5
+    assert (sub.partsCount, top.subtreeCount) == (5, 5)
+    assert factory.countParts(top) == 5
+    rows = factory.scheme.db.select_all("SELECT type_id, quantity FROM PARTS ORDER BY quantity;")
+    assert rows == [(sub.recId, i) for i in range(5)]
+
+
+@pytest.fixture
+def edited(factory, top):
+    with factory.transaction():
+        parts = [factory.createPart(top, {"part_num": "R%d" % i, "shop": "A"}) for i in range(3)]
+    edits = ElDBScheme.PendingEdits(factory)
+    for thePart in parts:
+        thePart["shop"] = "B"
+        thePart["package"] = "0603"
+        assert edits.add(thePart)
+    assert not edits.add(parts[0])
+    return parts, edits
+
+
+def stored(factory, fldName) -> list:
+    return [row[0] for row in factory.scheme.db.select_all("SELECT " + fldName + " FROM PARTS ORDER BY id;")]
+
+
+def test_pending_edits_written_in_one_transaction(factory, edited):
+    parts, edits = edited
+    executed = []
+    factory.scheme.db.conn.set_trace_callback(executed.append)
+    assert edits.flush() == 3
+    factory.scheme.db.conn.set_trace_callback(None)
+    assert len([sql for sql in executed if sql.startswith("BEGIN")]) == 1
+    assert len([sql for sql in executed if sql.startswith("UPDATE")]) == 3
+    assert len(edits) == 0
+    assert stored(factory, "shop") == ["B"] * 3
+    assert all(len(thePart.dirty) == 0 for thePart in parts)
+
+
+def test_failed_flush_keeps_edits(factory, edited):
+    parts, edits = edited
+
+    def failed():
+        raise ElDBScheme.DBError("disk full")
+    parts[1].save = failed
+    with pytest.raises(ElDBScheme.DBError):
+        edits.flush()
+    # the first part was written and rolled back
+    assert stored(factory, "shop") == ["A"] * 3
+    assert len(edits) == 3
+    assert all(thePart.dirty == {"shop", "package"} for thePart in parts)
+
+    del parts[1].save
+    assert edits.flush() == 3
+    assert stored(factory, "package") == ["0603"] * 3
+
+
+def test_discard_drops_edits(factory, top, edited):
+    parts, edits = edited
+    edits.discard()
+    assert len(edits) == 0
+    assert all(thePart.id not in factory.cache for thePart in parts)
+    assert [thePart["shop"] for thePart in factory.loadPartsByType(top)] == ["A"] * 3
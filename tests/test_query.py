@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+
+@pytest.fixture
+def tree(factory):
+    random.seed(17)
+    top = factory.appendType("Top", None)
+    sub = factory.appendType("Sub", top)
+    other = factory.appendType("Other", None)
+    rows = []
+    for i in range(250):
+        theType = random.choice([top, sub, other])
+        # Repeated and missing values make the id part of the key matter
+        value = random.choice([None, "1k", "10k", "4.7k"])
+        rows.append((theType.recId, "P%03d" % random.randint(0, 60), value))
+    with factory.transaction():
+        factory.scheme.db.exec_many("INSERT INTO PARTS (type_id, part_num, value) VALUES (?, ?, ?);", rows)
+    return top, sub
+
+
+def expected(factory, query) -> list:
+    sql = "SELECT id FROM PARTS WHERE " + query.where + " ORDER BY " + query.orderBy + ";"
+    return [row[0] for row in factory.scheme.db.select_all(sql, [query.typeId])]
+
+
+def readPages(query, pageSize) -> list:
+    ids = []
+    afterKey = None
+    while True:
+        rows = query.page(afterKey, pageSize)
+        ids += [row[0] for row in rows]
+        if len(rows) < pageSize:
+            return ids
+        afterKey = query.keyOf(rows[-1])
+
+
+@pytest.mark.parametrize("order", [
+    [("part_num", False)],
+    [("value", False), ("part_num", True)],
+    [("value", True), ("part_num", False)],
+    [("part_num", True)],
+    [("id", True)],
+])
+@pytest.mark.parametrize("withChild", [True, False])
+def test_pages_follow_order(factory, tree, order, withChild):
+    query = factory.queryParts(tree[0], withChild, order)
+    ids = expected(factory, query)
+    assert query.count() == len(ids)
+    assert readPages(query, 7) == ids
+
+
+def test_page_keys_start_pages(factory, tree):
+    query = factory.queryParts(tree[0], True, [("value", True), ("part_num", False)])
+    ids = expected(factory, query)
+    keys = query.pageKeys(10, 5)
+    assert len(keys) == 5
+    rows = query.page(keys[2], 10)
+    assert [row[0] for row in rows] == ids[30:40]
+    assert query.keyOf(rows[-1]) == keys[3]
+
+
+def test_position(factory, tree):
+    top, sub = tree
+    query = factory.queryParts(top, True, [("value", False), ("part_num", False)])
+    ids = expected(factory, query)
+    for row in (0, 1, len(ids) // 2, len(ids) - 1):
+        assert query.position(ids[row]) == row
+    outside = factory.scheme.db.select_all("SELECT id FROM PARTS WHERE type_id NOT IN (?, ?);",
+                                           [top.recId, sub.recId])[0][0]
+    assert query.position(outside) == -1
+
+
+def test_unknown_order_field_rejected(factory, tree):
+    with pytest.raises(ValueError):
+        factory.queryParts(tree[0], True, [("no_such_field", False)])
+
+
+def test_single_type_without_subtypes_uses_type_id(factory, tree):
+    query = factory.queryParts(tree[1], True)
+    assert not query.withChild
+    assert query.where == "type_id = ?"
+    assert readPages(query, 7) == expected(factory, query)
+
+
+@pytest.mark.parametrize("desc", [False, True])
+def test_saved_order_uses_index(factory, tree, desc):
+    top, sub = tree
+    factory.setSortOrder(sub, [("value", desc)])
+    query = factory.queryParts(sub, True, factory.getSortOrder(sub))
+    assert query.keyDesc == [desc, desc]
+    first = query.page(None, 7)
+    for afterKey in (None, query.keyOf(first[-1])):
+        sql, values = query.pageSql(afterKey, 7)
+        plan = " ".join(row[-1] for row in factory.scheme.db.select_all("EXPLAIN QUERY PLAN " + sql, values))
+        assert "idx_parts_type_value" in plan
+        assert "TEMP B-TREE" not in plan
@@ -0,0 +1,118 @@
+import pytest
+
+import ElDBScheme
+
+
+def count(factory, sql, values=()) -> int:
+    return factory.scheme.db.select_all(sql, values)[0][0]
+
+
+def test_types_indexed_by_id_and_path(factory):
+    top = factory.appendType("Top", None)
+    sub = factory.appendType("Sub", top)
+    assert factory.getTypeByID(sub.recId) is sub
+    assert factory.getTypeByPath("Top Sub") is sub
+    assert factory.createTypeByPath("Top Sub") is sub
+
+
+def test_delete_type_removes_subtree_rows(factory):
+    top = factory.appendType("Top", None)
+    sub = factory.appendType("Sub", top)
+    leaf = factory.appendType("Leaf", sub)
+    kept = factory.appendType("Kept", top)
+    for theType in (top, sub, leaf, leaf, kept):
+        factory.createPart(theType, {"part_num": "P"})
+    thePart = factory.createPart(leaf, {"part_num": "D"})
+    thePart.getDocuments()
+    thePart.addDocument("datasheet.pdf")
+    for theType in (top, sub, leaf):
+        factory.setSortOrder(theType, [("value", True)])
+
+    factory.deleteType(sub)
+
+    assert count(factory, "SELECT count(*) FROM PARTS;") == 2
+    assert count(factory, "SELECT count(*) FROM TYPES;") == 2
+    assert count(factory, "SELECT count(*) FROM DATASHEETS;") == 0
+    assert count(factory, "SELECT count(*) FROM TYPES_TREE WHERE ancestor_id IN (?, ?) OR descendant_id IN (?, ?);",
+                 [sub.recId, leaf.recId] * 2) == 0
+    assert sub.recId not in factory.typesIndex.byId
+    assert leaf.recId not in factory.typesIndex.byId
+    assert [row[0] for row in factory.scheme.db.select_all("SELECT name FROM ENVIRONMENT;")] == \
+           [ElDBScheme.SORT_ORDER_ENV + str(top.recId)]
+
+
+def test_parts_counters_follow_triggers(factory):
+    top = factory.appendType("Top", None)
+    sub = factory.appendType("Sub", top)
+    other = factory.appendType("Other", None)
+    parts = [factory.createPart(sub, {"part_num": "P%d" % i}) for i in range(3)]
+    factory.createPart(top, {"part_num": "T"})
+    assert (top.partsCount, top.subtreeCount, sub.subtreeCount) == (1, 4, 3)
+
+    factory.movePart(parts[0], other)
+    factory.deletePart(parts[1])
+    assert (top.subtreeCount, sub.subtreeCount, other.subtreeCount) == (2, 1, 1)
+    assert factory.countParts(top) == 2
+    assert factory.countParts(top, False) == 1
+    assert factory.countParts(other) == 1
+
+
+def test_counters_loaded_with_tree(factory, dbPath):
+    top = factory.appendType("Top", None)
+    sub = factory.appendType("Sub", top)
+    factory.createPart(top, {"part_num": "T"})
+    factory.createPart(sub, {"part_num": "S"})
+    factory.disconnect()
+
+    reopened = ElDBScheme.DBFactory(dbPath)
+    theType = reopened.getTypeByPath("Top")
+    assert (theType.partsCount, theType.subtreeCount) == (1, 2)
+    reopened.disconnect()
+
+
+def test_delete_type_counters_match_db(factory):
+    top = factory.appendType("Top", None)
+    mid = factory.appendType("Mid", top)
+    sub = factory.appendType("Sub", mid)
+    for theType in (top, mid, sub, sub):
+        factory.createPart(theType, {"part_num": "P"})
+
+    changed = factory.deleteType(sub)
+
+    assert changed == [mid, top]
+    assert (mid.subtreeCount, top.subtreeCount) == (1, 2)
+    assert top.subtreeCount == factory.countParts(top)
+    assert mid.subtreeCount == factory.countParts(mid)
+
+
+def closure(factory) -> set:
+    rows = factory.scheme.db.select_all("SELECT ancestor_id, descendant_id, depth FROM TYPES_TREE;")
+    return {tuple(row) for row in rows}
+
+
+def test_closure_follows_type_moves(factory):
+    a = factory.appendType("A", None)
+    b = factory.appendType("B", a)
+    c = factory.appendType("C", b)
+    d = factory.appendType("D", None)
+    assert closure(factory) == {(a.recId, a.recId, 0), (b.recId, b.recId, 0), (c.recId, c.recId, 0),
+                                (d.recId, d.recId, 0), (a.recId, b.recId, 1), (a.recId, c.recId, 2),
+                                (b.recId, c.recId, 1)}
+
+    factory.moveType(b, d)
+
+    assert closure(factory) == {(a.recId, a.recId, 0), (b.recId, b.recId, 0), (c.recId, c.recId, 0),
+                                (d.recId, d.recId, 0), (d.recId, b.recId, 1), (d.recId, c.recId, 2),
+                                (b.recId, c.recId, 1)}
+    assert factory.isSubtype(c, d)
+    assert not factory.isSubtype(c, a)
+    assert factory.getTypeByPath("D B C") is c
+
+
+def test_move_type_under_itself_rejected(factory):
+    a = factory.appendType("A", None)
+    b = factory.appendType("B", a)
+    with pytest.raises(ValueError):
+        factory.moveType(a, b)
+    assert factory.isSubtype(b, a)
+    assert b.parent is a